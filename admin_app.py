@@ -2,6 +2,7 @@ from config import get_config
 from map import DatabaseCollectionMap, Permission, LIFF
 from flask import Blueprint, request, render_template, jsonify
 from utils.error_handler import handle_exception
+from utils.metrics import collect_metrics
 
 admin_app = Blueprint('admin_app', __name__)
 
@@ -25,6 +26,23 @@ def check_admin():
     except Exception as e:
         return handle_exception(e)
 
+@admin_app.route('/metrics', methods=['POST'])
+def metrics():
+    """取得系統執行指標（僅限管理員）"""
+    try:
+        user_id = request.json.get('userId')
+        if not user_id:
+            return jsonify({'success': False, 'message': '缺少 userId'}), 400
+
+        user = firebaseService.get_data(DatabaseCollectionMap.USER, user_id)
+        if user and user.get('permission') >= Permission.ADMIN:
+            return jsonify({'success': True, 'metrics': collect_metrics()})
+        else:
+            return jsonify({'success': False, 'message': '權限不足'}), 403
+
+    except Exception as e:
+        return handle_exception(e)
+
 @admin_app.route('/', methods=['GET'])
 def admin():
     liff_id = LIFF.ADMIN.value
@@ -0,0 +1,45 @@
+from firebase_admin import firestore_async
+from google.cloud.firestore_v1.base_query import FieldFilter
+from google.cloud.firestore_v1 import query
+
+class AsyncFireBaseService:
+    """
+    FireBaseService 的非同步版本（Firestore AsyncClient）\n
+    與 FireBaseService 共用同一個 Firebase app，需在 event loop 中使用。
+    """
+    def __init__(self, app):
+        self.db = firestore_async.client(app)
+
+    async def get_collection_data(self, collection):
+        """取得集合所有資料"""
+        return [{'_id': doc.id, **doc.to_dict()} async for doc in self.db.collection(collection).stream()]
+
+    async def get_data(self, collection, doc_id):
+        """取得資料"""
+        doc = await self.db.collection(collection).document(doc_id).get()
+        return doc.to_dict()
+
+    async def filter_data(self, collection, conditions, order_by=None, limit=None):
+        """篩選資料，參數格式同 FireBaseService.filter_data"""
+        collection_ref = self.db.collection(collection)
+        for condition in conditions:
+            collection_ref = collection_ref.where(filter=FieldFilter(*condition))
+        if order_by:
+            field = order_by[0]
+            direction = query.Query.DESCENDING if order_by[1] == 'desc' else query.Query.ASCENDING
+            collection_ref = collection_ref.order_by(field, direction=direction)
+        if limit:
+            collection_ref = collection_ref.limit(limit)
+        return [{'_id': doc.id, **doc.to_dict()} async for doc in collection_ref.stream()]
+
+    async def add_data(self, collection, doc_id, data):
+        """新增資料"""
+        await self.db.collection(collection).document(doc_id).set(data)
+
+    async def update_data(self, collection, doc_id, data):
+        """更新資料"""
+        await self.db.collection(collection).document(doc_id).update(data)
+
+    async def delete_data(self, collection, doc_id):
+        """刪除資料"""
+        await self.db.collection(collection).document(doc_id).delete()
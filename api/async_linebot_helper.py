@@ -0,0 +1,146 @@
+from config import get_config
+from map import DatabaseCollectionMap
+from api.profile_cache import NOT_FOUND
+from utils.cache import MISSING
+from linebot.v3.messaging import (
+    AsyncApiClient,
+    AsyncMessagingApi,
+    ReplyMessageRequest,
+    PushMessageRequest,
+    ShowLoadingAnimationRequest
+)
+from utils.rate_limiter import RateLimiter, classify_line_endpoint
+from utils.flex_template import FlexTemplate
+import asyncio
+
+config = get_config()
+configuration = config.configuration
+
+class LimitedAsyncApiClient(AsyncApiClient):
+    """每次請求前先依 endpoint 類別向共用限流器取得額度（等待時不阻塞 event loop）"""
+    def __init__(self, configuration, rate_limiter: RateLimiter = None):
+        super().__init__(configuration)
+        self.rate_limiter = rate_limiter
+
+    async def request(self, method, url, *args, **kwargs):
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire_async(classify_line_endpoint(url))
+        return await super().request(method, url, *args, **kwargs)
+
+class AsyncLineApiClient:
+    """
+    行程內共用的非同步 LINE Messaging API client\n
+    aiohttp session 必須在 event loop 中建立，因此第一次使用時才建立。
+    """
+    def __init__(self, configuration, rate_limiter: RateLimiter = None):
+        self.configuration = configuration
+        self.rate_limiter = rate_limiter
+        self._api_client = None
+        self._messaging_api = None
+
+    @property
+    def messaging_api(self) -> AsyncMessagingApi:
+        if self._messaging_api is None:
+            self._api_client = LimitedAsyncApiClient(self.configuration, self.rate_limiter)
+            self._messaging_api = AsyncMessagingApi(self._api_client)
+        return self._messaging_api
+
+    async def close(self):
+        """關閉 aiohttp session"""
+        api_client, self._api_client, self._messaging_api = self._api_client, None, None
+        if api_client is not None:
+            await api_client.close()
+
+async_line_api_client = AsyncLineApiClient(configuration, config.line_rate_limiter)
+
+class AsyncLineBotHelper:
+    """LineBotHelper 的非同步版本（僅包含 webhook 回應路徑會用到的方法）"""
+    @staticmethod
+    async def get_user_info(user_id: str) -> dict:
+        """獲取指定用戶的個人資料資訊。
+
+        Args:
+            user_id (str): LINE 用戶的 ID
+
+        Returns:
+            dict: 包含用戶資訊的字典，用戶封鎖或未加好友時回傳 None
+        """
+        # 與同步版本共用個人資料快取；未命中時在執行緒中查詢，與其他查詢共用同一次 API 呼叫
+        from api.linebot_helper import profile_cache
+        cached = profile_cache.peek(user_id)
+        if cached is NOT_FOUND:
+            return None
+        if cached is not MISSING:
+            return cached
+        return await asyncio.to_thread(profile_cache.get, user_id)
+
+    @staticmethod
+    async def show_loading_animation_(event, time: int=10):
+        """
+        立即顯示載入動畫\n
+        處理事件時請使用 loading_indicator.track，只有處理較久時才會在背景送出
+        """
+        line_bot_api = async_line_api_client.messaging_api
+        await line_bot_api.show_loading_animation(
+            ShowLoadingAnimationRequest(chatId=event.source.user_id, loadingSeconds=time)
+        )
+
+    @staticmethod
+    async def reply_message(event, messages: list):
+        """
+        回覆多則訊息
+        """
+        # 訊息驗證大多命中快取，只有新的模板形狀才會在執行緒中呼叫遠端驗證
+        from api.linebot_helper import message_validator, loading_indicator
+        # 取消尚未送出的載入動畫，避免回覆後才顯示
+        loading_indicator.finish(event)
+        await asyncio.to_thread(message_validator.validate, messages)
+        line_bot_api = async_line_api_client.messaging_api
+        await line_bot_api.reply_message_with_http_info(
+            ReplyMessageRequest(
+                reply_token=event.reply_token,
+                messages=messages
+            )
+        )
+
+    @staticmethod
+    async def push_message(user_id: str, messages: list):
+        """
+        推播多則訊息給一位user
+        """
+        line_bot_api = async_line_api_client.messaging_api
+        await line_bot_api.push_message_with_http_info(
+            PushMessageRequest(
+                to=user_id,
+                messages=messages
+            )
+        )
+
+class AsyncFlexMessageHelper:
+    """FlexMessageHelper 的非同步版本：與同步版本共用編譯快取，未命中時以 asyncFirebaseService 讀取模板"""
+    @staticmethod
+    async def get_template(doc_id: str, field: str = None) -> FlexTemplate:
+        """
+        Summary:
+            取得 line_flex 集合中編譯後的模板，參數同 FlexMessageHelper.get_template
+        Returns:
+            FlexTemplate: 編譯後的模板
+        """
+        from api.linebot_helper import FlexMessageHelper, flex_templates
+        if not FlexMessageHelper.watching():
+            # 監聽使用同步的 Firestore client（建立 client 與訂閱會阻塞，在執行緒中進行）
+            await asyncio.to_thread(FlexMessageHelper._watch_templates)
+        template = flex_templates.peek((doc_id, field))
+        if template is not None:
+            return template
+        doc = await config.asyncFirebaseService.get_data(DatabaseCollectionMap.LINE_FLEX, doc_id)
+        if not doc:
+            raise ValueError(f"Flex template '{doc_id}' not found")
+        return flex_templates.get((doc_id, field), None, lambda: FlexMessageHelper._load_template(doc, field))
+
+    @staticmethod
+    async def create_carousel_from_template(doc_id: str, items: list[dict], field: str = None) -> dict:
+        """ Returns 以 line_flex 模板的第一個 bubble 為每個 item 生成 carousel
+        dict: carousel
+        """
+        return (await __class__.get_template(doc_id, field)).render_carousel(items)
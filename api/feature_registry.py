@@ -0,0 +1,139 @@
+from map import FeatureStatus, DatabaseCollectionMap
+from utils.feature_router import FeatureRouter, build_feature_router
+from typing import Dict, Optional, Tuple
+import threading
+import time
+
+class FeatureRegistry:
+    """
+    功能狀態與關鍵字路由（feature 集合，以文件 ID 作為功能名稱）\n
+    第一次使用時載入整個集合，之後透過 Firestore 監聽更新；每次變更都重新建立完整的快照並整個替換，
+    處理訊息時只讀取記憶體中的快照，不會查詢 Firestore。
+    """
+    RETRY_INTERVAL = 30
+
+    def __init__(self, service, collection: str = DatabaseCollectionMap.FEATURE,
+                 static_status: Dict[str, FeatureStatus] = None, static_keywords: Dict[str, str] = None):
+        """
+        Args:
+            service: FireBaseService 的 LazyService 代理（config.firebaseService）
+            collection: 功能設定集合
+            static_status: 程式內建的功能狀態（config.feature），集合中沒有設定狀態時使用
+            static_keywords: 程式內建的關鍵字對應（Map.FEATURE）
+        """
+        self.service = service
+        self.collection = collection
+        self.static_status = dict(static_status or {})
+        self.static_keywords = dict(static_keywords or {})
+        self._docs = {}
+        self._seeded = False
+        self._loaded_service = None
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+        self._counters = {'loads': 0, 'builds': 0, 'load_errors': 0, 'updated_at': None}
+        # (功能狀態, 路由)，更新時整個 tuple 替換
+        self._snapshot = self._build_snapshot()
+
+    def _build_snapshot(self) -> Tuple[Dict[str, FeatureStatus], FeatureRouter]:
+        status = dict(self.static_status)
+        for feature, doc in self._docs.items():
+            parsed = self._parse_status(feature, doc.get('status'))
+            if parsed is not None:
+                status[feature] = parsed
+        router = build_feature_router(list(self._docs.values()), self.static_keywords)
+        self._counters['builds'] += 1
+        self._counters['updated_at'] = time.time()
+        return status, router
+
+    @staticmethod
+    def _parse_status(feature: str, value) -> Optional[FeatureStatus]:
+        """狀態可為數字（1 / 2 / 3）或名稱（ENABLE / MAINTENANCE / DISABLE）"""
+        if value is None:
+            return None
+        try:
+            if isinstance(value, str) and not value.isdigit():
+                return FeatureStatus[value.upper()]
+            return FeatureStatus(int(value))
+        except (KeyError, ValueError):
+            print(f"Invalid status {value!r} for feature '{feature}'")
+            return None
+
+    def _get_snapshot(self) -> tuple:
+        if time.monotonic() < self._retry_at:
+            return self._snapshot
+        try:
+            service = self.service.get()
+            if self._loaded_service is not service:
+                # 已有 fork 前載入的設定時不等待其他執行緒（例如 warm up）載入，先沿用目前的快照
+                if not self._lock.acquire(blocking=not self._seeded):
+                    return self._snapshot
+                try:
+                    # Firebase 重新建立後（例如 fork 後）原本的監聽已失效，需要重新載入與訂閱
+                    if self._loaded_service is not service:
+                        self._docs = {doc['_id']: doc for doc in service.get_collection_data(self.collection)}
+                        self._snapshot = self._build_snapshot()
+                        self._counters['loads'] += 1
+                        service.subscribe(self.collection, self._on_changes)
+                        self._loaded_service = service
+                finally:
+                    self._lock.release()
+        except Exception as e:
+            # 載入失敗時沿用目前的快照（程式內建設定），避免每則訊息都重新查詢
+            self._counters['load_errors'] += 1
+            self._retry_at = time.monotonic() + self.RETRY_INTERVAL
+            print(f"Failed to load feature settings: {str(e)}")
+        return self._snapshot
+
+    def _on_changes(self, changes):
+        with self._lock:
+            docs = dict(self._docs)
+            for change in changes:
+                if change.type.name == 'REMOVED':
+                    docs.pop(change.document.id, None)
+                else:
+                    docs[change.document.id] = {'_id': change.document.id, **(change.document.to_dict() or {})}
+            self._docs = docs
+            self._snapshot = self._build_snapshot()
+
+    def seed(self, docs: list):
+        """
+        Summary:
+            以已讀取的集合資料建立快照，不訂閱變更（pre-fork 伺服器在 fork 前呼叫，worker 共用路由）\n
+            worker 第一次使用時仍會重新載入並訂閱，載入期間以此快照處理訊息
+        Args:
+            docs: 集合資料（含 _id）
+        """
+        with self._lock:
+            self._docs = {doc['_id']: doc for doc in docs}
+            self._snapshot = self._build_snapshot()
+            self._seeded = True
+
+    def load(self):
+        """預先載入功能設定並開始監聽（例如在 warm up 時呼叫）"""
+        self._get_snapshot()
+
+    def route(self, text: str) -> Tuple[Optional[str], Optional[FeatureStatus]]:
+        """
+        Summary:
+            取得訊息對應的功能與狀態
+        Returns:
+            tuple: (功能名稱, 功能狀態)，沒有對應的功能時回傳 (None, None)
+        """
+        status, router = self._get_snapshot()
+        feature = router.match(text)
+        if feature is None:
+            return None, None
+        return feature, status.get(feature)
+
+    def status(self, feature: str) -> Optional[FeatureStatus]:
+        """Returns
+        FeatureStatus | None: 功能狀態
+        """
+        return self._get_snapshot()[0].get(feature)
+
+    def stats(self) -> dict:
+        """Returns
+        dict: 功能數、路由規則數與載入、重建次數
+        """
+        status, router = self._snapshot
+        return {'features': len(status), 'rules': router.size, **self._counters}
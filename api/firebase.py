@@ -2,14 +2,119 @@ import firebase_admin
 from firebase_admin import credentials, firestore
 from google.cloud.firestore_v1.base_query import FieldFilter
 from google.cloud.firestore_v1 import query, aggregation
+from google.cloud.firestore_v1.field_path import FieldPath
+from google.api_core import exceptions as google_exceptions
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from utils.cache import TTLCache, MISSING
+from utils.metrics import register_metrics
+from utils.utils import chunked
+from datetime import datetime
+import base64
+import copy
+import json
+import random
 import threading
+import time
 
 class FireBaseService:
+    # Firestore 單一 batch 最多 500 筆寫入
+    BATCH_LIMIT = 500
+    # 可重試的暫時性錯誤（交易衝突、逾時、配額）
+    RETRYABLE_ERRORS = (
+        google_exceptions.Aborted,
+        google_exceptions.DeadlineExceeded,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.ResourceExhausted,
+        google_exceptions.InternalServerError
+    )
+
     def __init__(self, cred):
         self.cred = credentials.Certificate(cred)
-        firebase_admin.initialize_app(self.cred)
-        self.db = firestore.client()
+        self.app = firebase_admin.initialize_app(self.cred)
+        self.db = firestore.client(self.app)
         self.callback_done = threading.Event()
+        self._caches = {}
+        self._listeners = {}
+        self._watches = {}
+        self._listener_lock = threading.Lock()
+
+    def enable_cache(self, collection, maxsize=1024, ttl=300):
+        """啟用集合的讀取快取\n
+        get_data、get_collection_data、filter_data 的結果會依 maxsize / ttl 保留，
+        並透過 on_snapshot 監聽集合變更自動失效
+        """
+        if collection in self._caches:
+            return self._caches[collection]
+        cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._caches[collection] = cache
+        self.subscribe(collection, lambda changes: self._invalidate_changes(collection, changes))
+        register_metrics(f'firestore_cache.{collection}', cache.stats)
+        return cache
+
+    def cache_stats(self):
+        """取得各集合快取的命中統計"""
+        return {collection: cache.stats() for collection, cache in self._caches.items()}
+
+    def subscribe(self, collection, callback):
+        """訂閱集合變更\n
+        同一集合只建立一個 on_snapshot 監聽，變更會依序通知所有訂閱者\n
+        callback(changes): changes 為 DocumentChange 列表
+        """
+        with self._listener_lock:
+            self._listeners.setdefault(collection, []).append(callback)
+            if collection not in self._watches:
+                self._watches[collection] = self.on_snapshot(
+                    collection, callback=lambda changes: self._notify_listeners(collection, changes)
+                )
+
+    def _notify_listeners(self, collection, changes):
+        with self._listener_lock:
+            listeners = list(self._listeners.get(collection, []))
+        for listener in listeners:
+            try:
+                listener(changes)
+            except Exception as e:
+                print(f"Snapshot listener failed for {collection}: {str(e)}")
+
+    def _invalidate_changes(self, collection, changes):
+        doc_ids = {change.document.id for change in changes}
+        if doc_ids:
+            self._invalidate(collection, *doc_ids)
+
+    def _invalidate(self, collection, *doc_ids):
+        """使指定文件與集合層級的查詢快取失效（未指定文件時清除整個集合的快取）"""
+        cache = self._caches.get(collection)
+        if cache is None:
+            return
+        if not doc_ids:
+            cache.clear()
+        else:
+            doc_ids = set(doc_ids)
+            cache.delete_where(lambda key: key[0] != 'doc' or key[1] in doc_ids)
+
+    def _cached(self, collection, key, loader):
+        """從快取讀取，未命中時呼叫 loader 並寫入快取（回傳副本，避免呼叫端修改快取內容）"""
+        cache = self._caches.get(collection)
+        if cache is None:
+            return loader()
+        value = cache.get(key)
+        if value is MISSING:
+            generation = cache.generation(key)
+            value = loader()
+            cache.set(key, value, generation=generation)
+        return copy.deepcopy(value)
+
+    def close(self):
+        """停止所有監聽並釋放 Firebase app（之後可重新建立 FireBaseService）"""
+        with self._listener_lock:
+            watches, self._watches = self._watches, {}
+            self._listeners = {}
+        for watch in watches.values():
+            try:
+                watch.unsubscribe()
+            except Exception as e:
+                print(f"Failed to unsubscribe snapshot listener: {str(e)}")
+        firebase_admin.delete_app(self.app)
 
     def list_collections(self):
         """取得所有 collection 名稱"""
@@ -17,14 +122,18 @@ class FireBaseService:
 
     def get_collection_data(self, collection):
         """取得集合所有資料"""
-        docs = self.db.collection(collection).stream()
-        return [{'_id': doc.id, **doc.to_dict()} for doc in docs]
+        def load():
+            docs = self.db.collection(collection).stream()
+            return [{'_id': doc.id, **doc.to_dict()} for doc in docs]
+        return self._cached(collection, ('collection',), load)
 
     def get_data(self, collection, doc_id):
         """取得資料"""
-        doc_ref = self.db.collection(collection).document(doc_id)
-        doc = doc_ref.get()
-        return doc.to_dict()
+        def load():
+            doc_ref = self.db.collection(collection).document(doc_id)
+            doc = doc_ref.get()
+            return doc.to_dict()
+        return self._cached(collection, ('doc', doc_id), load)
     
     def filter_data(self, collection, conditions, order_by=None, limit=None):
         """篩選資料\n
@@ -41,6 +150,13 @@ class FireBaseService:
         direction: "asc" or "desc" (default: "asc")
         Example: ("age", "desc")
         """
+        def load():
+            docs = self._build_query(collection, conditions, order_by, limit).stream()
+            return [{'_id': doc.id, **doc.to_dict()} for doc in docs]
+        return self._cached(collection, ('filter', repr(conditions), repr(order_by), limit), load)
+
+    def _build_query(self, collection, conditions, order_by=None, limit=None):
+        """依條件、排序與筆數建立查詢"""
         collection_ref = self.db.collection(collection)
         for condition in conditions:
             collection_ref = collection_ref.where(filter=FieldFilter(*condition))
@@ -50,8 +166,68 @@ class FireBaseService:
             collection_ref = collection_ref.order_by(field, direction=direction)
         if limit:
             collection_ref = collection_ref.limit(limit)
-        docs = collection_ref.stream()
-        return [{'_id': doc.id, **doc.to_dict()} for doc in docs]
+        return collection_ref
+
+    def iter_collection_data(self, collection, page_size=100, select=None, cursor=None):
+        """逐筆讀取集合所有資料（generator，依頁讀取，記憶體用量固定）"""
+        for docs, _ in self.paginate_data(collection, page_size=page_size, select=select, cursor=cursor):
+            yield from docs
+
+    def iter_filter_data(self, collection, conditions, order_by=None, page_size=100, select=None, cursor=None):
+        """逐筆讀取篩選後的資料（generator），conditions 與 order_by 格式同 filter_data"""
+        for docs, _ in self.paginate_data(collection, conditions, order_by, page_size, select, cursor):
+            yield from docs
+
+    def paginate_data(self, collection, conditions=None, order_by=None, page_size=100, select=None, cursor=None):
+        """以 start_after 游標分頁讀取資料（generator）\n
+        每頁 yield (docs, next_cursor)，next_cursor 為可保存的字串，
+        傳回 cursor 參數即可從該頁之後繼續讀取；最後一頁的 next_cursor 為 None\n
+        select: 只讀取指定欄位，例如 ['userId', 'permission']（排序欄位會自動加入）
+        """
+        base_query = self._build_query(collection, conditions or [], order_by)
+        # 以文件 ID 作為第二排序鍵（方向與主排序相同），確保游標位置唯一
+        direction = query.Query.DESCENDING if order_by and order_by[1] == 'desc' else query.Query.ASCENDING
+        base_query = base_query.order_by(FieldPath.document_id(), direction=direction)
+        order_field = order_by[0] if order_by else None
+        if select:
+            fields = list(select)
+            if order_field and order_field not in fields:
+                fields.append(order_field)
+            base_query = base_query.select(fields)
+
+        after = self._decode_cursor(cursor) if cursor else None
+        while True:
+            page_query = base_query.limit(page_size)
+            if after is not None:
+                page_query = page_query.start_after(after)
+            snapshots = list(page_query.stream())
+            if not snapshots:
+                return
+            last = snapshots[-1]
+            after = ([last.get(order_field)] if order_field else []) + [last.id]
+            next_cursor = self._encode_cursor(after) if len(snapshots) == page_size else None
+            yield [{'_id': snapshot.id, **(snapshot.to_dict() or {})} for snapshot in snapshots], next_cursor
+            if next_cursor is None:
+                return
+
+    @staticmethod
+    def _encode_cursor(values):
+        """將游標位置編碼為字串"""
+        def default(value):
+            if isinstance(value, datetime):
+                return {'$datetime': value.isoformat()}
+            raise TypeError(f"Unsupported cursor value: {value!r}")
+        data = json.dumps(values, default=default, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def _decode_cursor(cursor):
+        """將字串還原為游標位置"""
+        def object_hook(value):
+            if '$datetime' in value:
+                return datetime.fromisoformat(value['$datetime'])
+            return value
+        return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')), object_hook=object_hook)
     
     def get_aggregate_count(self, collection, conditions):
         """
@@ -70,20 +246,121 @@ class FireBaseService:
         """新增資料"""
         doc_ref = self.db.collection(collection).document(doc_id)
         doc_ref.set(data)
+        self._invalidate(collection, doc_id)
 
     def update_data(self, collection, doc_id, data):
         """更新資料"""
         doc_ref = self.db.collection(collection).document(doc_id)
         doc_ref.update(data)
+        self._invalidate(collection, doc_id)
 
     def delete_data(self, collection, doc_id):
         """刪除資料"""
         doc_ref = self.db.collection(collection).document(doc_id)
         doc_ref.delete()
+        self._invalidate(collection, doc_id)
+
+    def bulk_set(self, collection, items, merge=False, chunk_size=BATCH_LIMIT, max_workers=4, max_retries=5):
+        """批次新增/覆寫資料\n
+        items: 可迭代的 (doc_id, data)，可為任意大小的 list 或 generator\n
+        merge: 是否與既有資料合併\n
+        Returns: {'succeeded': [doc_id, ...], 'failed': [{'_id': doc_id, 'error': str}, ...]}
+        """
+        return self._bulk_write(
+            collection, items, lambda batch, doc_ref, data: batch.set(doc_ref, data, merge=merge),
+            chunk_size, max_workers, max_retries
+        )
+
+    def bulk_update(self, collection, items, chunk_size=BATCH_LIMIT, max_workers=4, max_retries=5):
+        """批次更新資料\n
+        items: 可迭代的 (doc_id, data)\n
+        Returns: 同 bulk_set
+        """
+        return self._bulk_write(
+            collection, items, lambda batch, doc_ref, data: batch.update(doc_ref, data),
+            chunk_size, max_workers, max_retries
+        )
+
+    def bulk_delete(self, collection, doc_ids, chunk_size=BATCH_LIMIT, max_workers=4, max_retries=5):
+        """批次刪除資料\n
+        doc_ids: 可迭代的 doc_id\n
+        Returns: 同 bulk_set
+        """
+        return self._bulk_write(
+            collection, ((doc_id, None) for doc_id in doc_ids), lambda batch, doc_ref, data: batch.delete(doc_ref),
+            chunk_size, max_workers, max_retries
+        )
+
+    def _bulk_write(self, collection, items, write, chunk_size, max_workers, max_retries):
+        """依 batch 上限分段，並以有限的並行數提交"""
+        collection_ref = self.db.collection(collection)
+        chunk_size = max(1, min(chunk_size, self.BATCH_LIMIT))
+        report = {'succeeded': [], 'failed': []}
+
+        def collect(futures):
+            for future in futures:
+                succeeded, failed = future.result()
+                report['succeeded'].extend(succeeded)
+                report['failed'].extend(failed)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = set()
+            for chunk in chunked(items, chunk_size):
+                # 限制排隊中的 chunk 數量，避免一次把整個 iterable 載入記憶體
+                if len(pending) >= max_workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                pending.add(executor.submit(self._commit_chunk, collection_ref, chunk, write, max_retries))
+            collect(wait(pending).done)
+
+        if report['succeeded']:
+            self._invalidate(collection, *report['succeeded'])
+        return report
+
+    def _commit_chunk(self, collection_ref, chunk, write, max_retries):
+        """提交一段寫入，回傳 (成功的 doc_id 列表, 失敗報告列表)"""
+        def commit(entries):
+            batch = self.db.batch()
+            for doc_id, data in entries:
+                write(batch, collection_ref.document(doc_id), data)
+            batch.commit()
 
-    def on_snapshot(self, collection):
-        """監聽文件變更"""
-        def callback(doc_snapshot, changes, read_time):
+        try:
+            self._commit_with_retry(lambda: commit(chunk), max_retries)
+            return [doc_id for doc_id, _ in chunk], []
+        except self.RETRYABLE_ERRORS as e:
+            return [], [{'_id': doc_id, 'error': str(e)} for doc_id, _ in chunk]
+        except Exception as e:
+            if len(chunk) == 1:
+                return [], [{'_id': chunk[0][0], 'error': str(e)}]
+
+        # batch 為全有或全無，非暫時性錯誤（如更新不存在的文件）時逐筆寫入找出失敗的文件
+        succeeded, failed = [], []
+        for entry in chunk:
+            try:
+                self._commit_with_retry(lambda: commit([entry]), max_retries)
+                succeeded.append(entry[0])
+            except Exception as e:
+                failed.append({'_id': entry[0], 'error': str(e)})
+        return succeeded, failed
+
+    def _commit_with_retry(self, commit, max_retries):
+        """遇到暫時性錯誤時以指數退避（含 jitter）重試"""
+        for attempt in range(max_retries + 1):
+            try:
+                return commit()
+            except self.RETRYABLE_ERRORS:
+                if attempt == max_retries:
+                    raise
+                time.sleep(min(30, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.5))
+
+    def on_snapshot(self, collection, callback=None):
+        """監聽文件變更\n
+        callback(changes): 自訂變更處理函式，未指定時使用預設處理
+        """
+        def on_changes(doc_snapshot, changes, read_time):
+            if callback:
+                return callback(changes)
             for change in changes:
                 # 檢測變更類型
                 if change.type.name == 'MODIFIED':
@@ -92,5 +369,5 @@ class FireBaseService:
 
         # 監聽集合
         doc_ref = self.db.collection(collection)
-        doc_watch = doc_ref.on_snapshot(callback)
+        doc_watch = doc_ref.on_snapshot(on_changes)
         return doc_watch
@@ -0,0 +1,219 @@
+from typing import Optional, Tuple
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import requests
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+JPEG_SIGNATURE = b'\xff\xd8'
+# JPEG 的 SOF marker（C4 / C8 / CC 不是 SOF）
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+def read_image_info(data) -> Tuple[str, int, int]:
+    """
+    Summary:
+        從 PNG / JPEG 標頭讀取格式與尺寸（不解碼圖片）
+    Args:
+        data: bytes 或 mmap
+    Returns:
+        tuple: (content_type, width, height)
+    """
+    size = len(data)
+    # 標頭不完整（截斷的檔案）時視為不支援的格式
+    if data[:8] == PNG_SIGNATURE and data[12:16] == b'IHDR' and size >= 24:
+        width, height = struct.unpack('>II', data[16:24])
+        return 'image/png', width, height
+    if data[:2] == JPEG_SIGNATURE:
+        position = 2
+        while position + 4 <= size:
+            if data[position] != 0xFF:
+                break
+            marker = data[position + 1]
+            if marker == 0xFF:
+                position += 1
+                continue
+            if marker in (0x01, *range(0xD0, 0xD9)):
+                position += 2
+                continue
+            length = struct.unpack('>H', data[position + 2:position + 4])[0]
+            if length < 2:
+                break
+            if marker in JPEG_SOF_MARKERS:
+                if length < 7 or position + 9 > size:
+                    break
+                height, width = struct.unpack('>HH', data[position + 5:position + 9])
+                return 'image/jpeg', width, height
+            position += 2 + length
+    raise ValueError('Unsupported image format (PNG or JPEG required)')
+
+class CachedImage:
+    """快取中的圖片檔案"""
+    __slots__ = ('url', 'path', 'sha256', 'size', 'content_type', 'width', 'height')
+
+    def __init__(self, url, path, sha256, size, content_type, width, height):
+        self.url = url
+        self.path = path
+        self.sha256 = sha256
+        self.size = size
+        self.content_type = content_type
+        self.width = width
+        self.height = height
+
+    def read(self) -> bytes:
+        """以 mmap 讀取圖片並確認內容與雜湊值相符後回傳 bytes"""
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if hashlib.sha256(data).hexdigest() != self.sha256:
+                raise ValueError(f"Cached image is corrupted: {self.path}")
+            return data[:]
+
+    def __repr__(self):
+        return f"<CachedImage {self.url} {self.content_type} {self.width}x{self.height} {self.size}B>"
+
+class ImageCache:
+    """
+    以內容雜湊定址的本機圖片快取\n
+    圖片以 sha256 存放於 objects/，index/ 以每個 URL 一個檔案記錄 ETag / Last-Modified 與雜湊值
+    （各自以暫存檔 + os.replace 寫入，多個行程同時更新不會互相覆蓋）；
+    再次取得時以條件式 GET 驗證（304 時直接使用快取），下載時以串流寫入並限制大小。\n
+    目錄在第一次取得圖片時才建立。
+    """
+    def __init__(self, directory: str, max_bytes: int = 1024 * 1024, timeout: tuple = (3, 30)):
+        """
+        Args:
+            directory: 快取目錄（可在多個環境間共用，支援 ~）
+            max_bytes: 圖片大小上限
+            timeout: (connect, read) timeout 秒數
+        """
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self._objects = os.path.join(self.directory, 'objects')
+        self._index = os.path.join(self.directory, 'index')
+        self._ready = False
+        self._counters = {'hits': 0, 'revalidated': 0, 'downloads': 0}
+
+    def _ensure_directories(self):
+        if not self._ready:
+            os.makedirs(self._objects, exist_ok=True)
+            os.makedirs(self._index, exist_ok=True)
+            self._ready = True
+
+    def _entry_path(self, url: str) -> str:
+        return os.path.join(self._index, hashlib.sha256(url.encode('utf-8')).hexdigest() + '.json')
+
+    def _load_entry(self, url: str) -> Optional[dict]:
+        try:
+            with open(self._entry_path(url), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        return entry if entry.get('url') == url else None
+
+    def _save_entry(self, url: str, entry: dict):
+        fd, tmp_path = tempfile.mkstemp(dir=self._index, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'url': url, **entry}, f, ensure_ascii=False)
+            os.replace(tmp_path, self._entry_path(url))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _object_path(self, sha256: str) -> str:
+        return os.path.join(self._objects, sha256)
+
+    def fetch(self, url: str) -> CachedImage:
+        """
+        Summary:
+            取得圖片（必要時下載），並驗證格式與大小
+        Raises:
+            ValueError: 下載失敗、超過大小上限或不是 PNG / JPEG
+        """
+        self._ensure_directories()
+        entry = self._load_entry(url)
+        if entry and not os.path.exists(self._object_path(entry['sha256'])):
+            entry = None
+
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        with requests.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if entry and response.status_code == 304:
+                self._counters['revalidated'] += 1
+                return self._open(url, entry['sha256'])
+            if response.status_code != 200:
+                raise ValueError(f"Failed to download image {url}: HTTP {response.status_code}")
+            sha256 = self._download(url, response)
+            self._save_entry(url, {
+                'sha256': sha256,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified')
+            })
+        return self._open(url, sha256)
+
+    def _download(self, url: str, response) -> str:
+        """串流寫入暫存檔並計算雜湊，完成後移到 objects/<sha256>"""
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self._objects, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise ValueError(f"Image {url} exceeds {self.max_bytes} bytes")
+                    digest.update(chunk)
+                    f.write(chunk)
+            sha256 = digest.hexdigest()
+            path = self._object_path(sha256)
+            if os.path.exists(path):
+                # 相同內容已在快取中（例如不同 URL 指向同一張圖）
+                self._counters['hits'] += 1
+                os.remove(tmp_path)
+            else:
+                self._counters['downloads'] += 1
+                os.replace(tmp_path, path)
+            return sha256
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _open(self, url: str, sha256: str) -> CachedImage:
+        path = self._object_path(sha256)
+        size = os.path.getsize(path)
+        if size > self.max_bytes:
+            raise ValueError(f"Image {url} exceeds {self.max_bytes} bytes")
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            content_type, width, height = read_image_info(data)
+        return CachedImage(url, path, sha256, size, content_type, width, height)
+
+    def stats(self) -> dict:
+        """Returns
+        dict: 快取目錄與命中 / 重新驗證 / 下載次數
+        """
+        return {'directory': self.directory, **self._counters}
+
+def validate_rich_menu_image(image: CachedImage, size: Optional[dict] = None):
+    """
+    Summary:
+        檢查圖片是否符合 LINE 圖文選單的限制（寬 800~2500、高 >= 250、寬高比 >= 1.45），
+        有指定 size 時尺寸需與圖文選單定義相同
+    Raises:
+        ValueError: 不符合限制
+    """
+    if not 800 <= image.width <= 2500 or image.height < 250 or image.width / image.height < 1.45:
+        raise ValueError(f"Invalid rich menu image size {image.width}x{image.height}: {image.url}")
+    if size and (size.get('width'), size.get('height')) != (image.width, image.height):
+        raise ValueError(
+            f"Rich menu image {image.width}x{image.height} does not match menu size "
+            f"{size.get('width')}x{size.get('height')}: {image.url}"
+        )
@@ -0,0 +1,88 @@
+from linebot.v3.messaging import (
+    ApiClient,
+    Configuration,
+    MessagingApi,
+    MessagingApiBlob
+)
+from utils.rate_limiter import RateLimiter, classify_line_endpoint
+import atexit
+import threading
+
+class PooledApiClient(ApiClient):
+    """
+    長期共用的 ApiClient，未指定 _request_timeout 的請求會套用預設 timeout，
+    有設定 rate_limiter 時每次請求前會先依 endpoint 類別取得額度
+    """
+    def __init__(self, configuration: Configuration, request_timeout=None, rate_limiter: RateLimiter = None):
+        super().__init__(configuration)
+        self.request_timeout = request_timeout
+        self.rate_limiter = rate_limiter
+
+    def request(self, method, url, *args, **kwargs):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(classify_line_endpoint(url))
+        if not kwargs.get('_request_timeout'):
+            kwargs['_request_timeout'] = self.request_timeout
+        return super().request(method, url, *args, **kwargs)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # 共用 client 不隨 with 區塊結束而關閉，由 LineApiClient.close 統一處理
+        pass
+
+class LineApiClient:
+    """
+    行程內共用的 LINE Messaging API client\n
+    所有請求共用同一個 urllib3 連線池（keep-alive），避免每次呼叫都重新建立連線與 TLS handshake。
+    """
+    def __init__(self, configuration: Configuration, pool_size: int = 10, timeout: tuple = (3, 10),
+                 rate_limiter: RateLimiter = None):
+        """
+        Args:
+            configuration: LINE Messaging API Configuration
+            pool_size: 連線池大小（同時對 LINE API 的連線數）
+            timeout: (connect, read) timeout 秒數
+            rate_limiter: 外呼限流器，None 為不限流
+        """
+        self.configuration = configuration
+        self.configuration.connection_pool_maxsize = pool_size
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self._lock = threading.Lock()
+        self._clients = None
+        atexit.register(self.close)
+
+    def _get_clients(self) -> tuple:
+        clients = self._clients
+        if clients is None:
+            with self._lock:
+                if self._clients is None:
+                    api_client = PooledApiClient(self.configuration, self.timeout, self.rate_limiter)
+                    self._clients = (api_client, MessagingApi(api_client), MessagingApiBlob(api_client))
+                clients = self._clients
+        return clients
+
+    @property
+    def api_client(self) -> ApiClient:
+        return self._get_clients()[0]
+
+    @property
+    def messaging_api(self) -> MessagingApi:
+        return self._get_clients()[1]
+
+    @property
+    def messaging_api_blob(self) -> MessagingApiBlob:
+        return self._get_clients()[2]
+
+    def reset(self):
+        """捨棄目前的連線池但不關閉連線（fork 後在子行程使用，避免關閉父行程仍在使用的 socket）"""
+        with self._lock:
+            self._clients = None
+
+    def close(self):
+        """關閉連線池，下次使用時會重新建立"""
+        with self._lock:
+            clients, self._clients = self._clients, None
+        if clients is not None:
+            api_client = clients[0]
+            api_client.rest_client.pool_manager.clear()
+            api_client.close()
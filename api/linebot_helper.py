@@ -1,13 +1,17 @@
-from config import get_config
+from config import get_config, LazyService
 from map import DatabaseCollectionMap
 from utils.utils import replace_variable
+from utils.metrics import register_metrics
+from api.message_validator import MessageValidator
+from api.multicast import MulticastFanout, MulticastError
+from api.image_cache import ImageCache, CachedImage, validate_rich_menu_image
+from api.richmenu_assign import RichMenuAssigner
+from api.profile_cache import ProfileCache
+from api.loading_indicator import LoadingIndicator
+from utils.flex_template import FlexTemplate, FlexTemplateCache
 from linebot.v3.messaging import (
-    ApiClient,
     ApiException,
-    MessagingApi,
-    MessagingApiBlob,
     ReplyMessageRequest,
-    MulticastRequest,
     PushMessageRequest,
     RichMenuRequest,
     URIAction,
@@ -19,21 +23,68 @@ from linebot.v3.messaging import (
     QuickReplyItem,
     ShowLoadingAnimationRequest,
     ValidateMessageRequest,
-    SetWebhookEndpointRequest,
-    RichMenuBulkLinkRequest,
-    RichMenuBulkUnlinkRequest,
-    RichMenuBatchRequest,
-    RichMenuBatchLinkOperation,
-    RichMenuBatchUnlinkOperation,
-    RichMenuBatchUnlinkAllOperation
+    SetWebhookEndpointRequest
 )
-import requests
 import json
+import threading
 
 config = get_config()
 configuration = config.configuration
+line_api_client = config.line_api_client
 firebaseService = config.firebaseService
 
+# 回覆前的訊息驗證：已驗證過的內容與模板形狀不再呼叫遠端 validate API
+message_validator = MessageValidator(
+    lambda messages: line_api_client.messaging_api.validate_reply(ValidateMessageRequest(messages=messages)),
+    strict=config.LINE_VALIDATE_STRICT
+)
+register_metrics('message_validator', message_validator.stats)
+
+# 使用者個人資料快取（404 以較短的時間快取，同一使用者同時查詢只呼叫一次 API）
+profile_cache = ProfileCache(
+    lambda user_id: line_api_client.messaging_api.get_profile(user_id).to_dict(),
+    store=lambda items: firebaseService.bulk_set(DatabaseCollectionMap.USER, items, merge=True),
+    maxsize=config.PROFILE_CACHE_SIZE,
+    ttl=config.PROFILE_CACHE_TTL,
+    negative_ttl=config.PROFILE_NEGATIVE_TTL
+)
+register_metrics('profile_cache', profile_cache.stats)
+
+# 編譯後的 Flex 模板（以文件 ID 與版本為鍵）
+flex_templates = FlexTemplateCache()
+register_metrics('flex_templates', flex_templates.stats)
+
+# 圖文選單圖片的本機快取
+# 只有部署圖文選單時才需要，第一次使用時才建立（webhook 與 gunicorn master 不會建立目錄）
+rich_menu_image_cache = LazyService(
+    'rich_menu_image_cache', lambda: ImageCache(config.RICH_MENU_IMAGE_CACHE_DIR), config.startup_timings
+)
+register_metrics(
+    'rich_menu_image_cache', lambda: rich_menu_image_cache.stats() if rich_menu_image_cache.initialized else {}
+)
+
+# 圖文選單的大量連結 / 取消連結與批次操作
+rich_menu_assigner = RichMenuAssigner(max_workers=config.RICH_MENU_MAX_WORKERS)
+
+# 多人推播：每段 500 人並行送出，429 / 5xx 依 Retry-After 重試
+multicast_fanout = MulticastFanout(
+    lambda: line_api_client.messaging_api,
+    max_workers=config.MULTICAST_MAX_WORKERS,
+    chunks_per_second=config.MULTICAST_CHUNKS_PER_SECOND,
+    max_retries=config.MULTICAST_MAX_RETRIES
+)
+
+# 載入動畫：超過門檻仍未回覆時才在背景送出，回覆時取消
+loading_indicator = LoadingIndicator(
+    lambda user_id, seconds: line_api_client.messaging_api.show_loading_animation(
+        ShowLoadingAnimationRequest(chatId=user_id, loadingSeconds=seconds)
+    ),
+    delay=config.LOADING_ANIMATION_DELAY,
+    max_delay=config.LOADING_ANIMATION_MAX_DELAY,
+    loading_seconds=config.LOADING_ANIMATION_SECONDS
+)
+register_metrics('loading_indicator', loading_indicator.stats)
+
 class LineBotHelper:
     @staticmethod
     def get_user_info(user_id: str) -> dict:
@@ -43,66 +94,79 @@ class LineBotHelper:
             user_id (str): LINE 用戶的 ID
             
         Returns:
-            dict: 包含用戶資訊的字典
+            dict: 包含用戶資訊的字典，用戶封鎖或未加好友時回傳 None
+        """
+        return profile_cache.get(user_id)
+
+    @staticmethod
+    def prefetch_user_info(user_ids, write_through: bool = False) -> dict:
+        """並行取得多位用戶的個人資料並放入快取。
+
+        Args:
+            user_ids: user id 或含 userId / _id 的 dict
+            write_through (bool): 是否將個人資料合併寫入 users 集合
+
+        Returns:
+            dict: 取得結果（cached、fetched、not_found、failed、stored）
         """
-        with ApiClient(configuration) as api_client:
-            line_bot_api = MessagingApi(api_client)
-            return line_bot_api.get_profile(user_id).to_dict()
+        return profile_cache.prefetch(user_ids, write_through)
     
     @staticmethod
     def show_loading_animation_(event, time: int=10):
         """
-        顯示載入動畫
+        立即顯示載入動畫（同步呼叫 API）\n
+        處理事件時請使用 loading_indicator.track，只有處理較久時才會在背景送出
         """
-        with ApiClient(configuration) as api_client:
-            line_bot_api = MessagingApi(api_client)
-            line_bot_api.show_loading_animation(
-                ShowLoadingAnimationRequest(chatId=event.source.user_id, loadingSeconds=time)
-            )
+        line_bot_api = line_api_client.messaging_api
+        line_bot_api.show_loading_animation(
+            ShowLoadingAnimationRequest(chatId=event.source.user_id, loadingSeconds=time)
+        )
         
     @staticmethod
     def reply_message(event, messages: list):
         """
         回覆多則訊息
         """
-        with ApiClient(configuration) as api_client:
-            line_bot_api = MessagingApi(api_client)
-            # 為了避免回覆訊息時發生錯誤（通常是Flex string解析異常），先檢查訊息是否合法
-            line_bot_api.validate_reply(ValidateMessageRequest(messages=messages))
-            line_bot_api.reply_message_with_http_info(
-                ReplyMessageRequest(
-                    reply_token=event.reply_token,
-                    messages=messages
-                )
+        # 取消尚未送出的載入動畫，避免回覆後才顯示
+        loading_indicator.finish(event)
+        line_bot_api = line_api_client.messaging_api
+        # 為了避免回覆訊息時發生錯誤（通常是Flex string解析異常），先檢查訊息是否合法
+        message_validator.validate(messages)
+        line_bot_api.reply_message_with_http_info(
+            ReplyMessageRequest(
+                reply_token=event.reply_token,
+                messages=messages
             )
+        )
 
     @staticmethod
-    def multicast_message(user_ids: list, messages: list):
+    def multicast_message(user_ids, messages: list) -> list:
         """
-        推播多則訊息給多位user
+        推播多則訊息給多位user\n
+        user_ids 可以是任意數量的 user id，或 firebaseService.iter_filter_data 等回傳的 dict（取 userId / _id）
+
+        Returns:
+            list[dict]: 每段（最多 500 人）的送出結果，包含 status、attempts、request_id、error、retryable
+        Raises:
+            MulticastError: 有段落在重試後仍失敗（error.failed 含失敗段落的 user_ids，其餘段落已送出）
         """
-        with ApiClient(configuration) as api_client:
-            line_bot_api = MessagingApi(api_client)
-            line_bot_api.multicast_with_http_info(
-                MulticastRequest(
-                    to=user_ids,
-                    messages=messages
-                )
-            )
+        reports = multicast_fanout.send(user_ids, messages)
+        if MulticastError.should_raise(reports):
+            raise MulticastError(reports)
+        return reports
 
     @staticmethod
     def push_message(user_id: str, messages: list):
         """
         推播多則訊息給一位user
         """
-        with ApiClient(configuration) as api_client:
-            line_bot_api = MessagingApi(api_client)
-            line_bot_api.push_message_with_http_info(
-                PushMessageRequest(
-                    to=user_id,
-                    messages=messages
-                )
+        line_bot_api = line_api_client.messaging_api
+        line_bot_api.push_message_with_http_info(
+            PushMessageRequest(
+                to=user_id,
+                messages=messages
             )
+        )
     
     @staticmethod
     def create_action(action: dict):
@@ -129,153 +193,238 @@ class WebhookHelper:
         """
         取得 LINE Bot 的 Webhook URL
         """
-        with ApiClient(configuration) as api_client:
-            line_bot_api = MessagingApi(api_client)
-            response = line_bot_api.get_webhook_endpoint()
-            return response.endpoint
+        line_bot_api = line_api_client.messaging_api
+        response = line_bot_api.get_webhook_endpoint()
+        return response.endpoint
     
     @staticmethod
     def set_webhook_url(webhook_url: str):
         """
         設定 LINE Bot 的 Webhook URL
         """
-        with ApiClient(configuration) as api_client:
-            line_bot_api = MessagingApi(api_client)
-            try:
-                line_bot_api.set_webhook_endpoint(
-                    SetWebhookEndpointRequest(
-                        endpoint=webhook_url
-                    )
+        line_bot_api = line_api_client.messaging_api
+        try:
+            line_bot_api.set_webhook_endpoint(
+                SetWebhookEndpointRequest(
+                    endpoint=webhook_url
                 )
-            except ApiException as e:
-                raise ValueError(f"Failed to set webhook URL: {e}")
+            )
+        except ApiException as e:
+            raise ValueError(f"Failed to set webhook URL: {e}")
     
     @staticmethod
     def test_webhook_url():
         """
         測試 LINE Bot 的 Webhook URL 是否有效
         """
-        with ApiClient(configuration) as api_client:
-            line_bot_api = MessagingApi(api_client)
-            try:
-                return line_bot_api.test_webhook_endpoint().to_dict()
-            except ApiException as e:
-                raise ValueError(f"Webhook URL test failed: {e}")
+        line_bot_api = line_api_client.messaging_api
+        try:
+            return line_bot_api.test_webhook_endpoint().to_dict()
+        except ApiException as e:
+            raise ValueError(f"Webhook URL test failed: {e}")
 
 class RichMenuHelper:
+    @staticmethod
+    def get_rich_menu_image_(image_url) -> CachedImage:
+        """
+        取得圖文選單的圖片（本機快取，以條件式 GET 確認是否更新）並檢查圖片限制
+        """
+        image = rich_menu_image_cache.fetch(image_url)
+        validate_rich_menu_image(image)
+        return image
+
+    @staticmethod
+    def upload_rich_menu_image_(rich_menu_id, image: CachedImage):
+        """
+        上傳圖文選單的圖片（PNG 或 JPEG）
+        """
+        line_bot_blob_api = line_api_client.messaging_api_blob
+        line_bot_blob_api.set_rich_menu_image(
+            rich_menu_id=rich_menu_id,
+            body=image.read(),
+            _headers={'Content-Type': image.content_type}
+        )
+
     @staticmethod
     def set_rich_menu_image_(rich_menu_id, image_url):
         """
         設定圖文選單的圖片
         """
-        with ApiClient(configuration) as api_client:
-            line_bot_blob_api = MessagingApiBlob(api_client)
-            response = requests.get(image_url)
-            if response.status_code != 200:
-                raise ValueError('Invalid image url')
-            else:
-                line_bot_blob_api.set_rich_menu_image(
-                    rich_menu_id=rich_menu_id,
-                    body=response.content,
-                    _headers={'Content-Type': 'image/png'}
-                )
+        __class__.upload_rich_menu_image_(rich_menu_id, __class__.get_rich_menu_image_(image_url))
 
     @staticmethod
     def create_rich_menu_alias_(alias_id, rich_menu_id):
         """
         建立圖文選單的alias
         """
-        with ApiClient(configuration) as api_client:
-            line_bot_api = MessagingApi(api_client)
-            line_bot_api.create_rich_menu_alias(
-                CreateRichMenuAliasRequest(
-                    rich_menu_alias_id=alias_id,
-                    rich_menu_id=rich_menu_id
-                )
+        line_bot_api = line_api_client.messaging_api
+        line_bot_api.create_rich_menu_alias(
+            CreateRichMenuAliasRequest(
+                rich_menu_alias_id=alias_id,
+                rich_menu_id=rich_menu_id
             )
+        )
 
     @staticmethod
     def create_rich_menu_(alias_id):
-        with ApiClient(configuration) as api_client:
-            line_bot_api = MessagingApi(api_client)
-            # 設定 rich menu image
-            rich_menu_str = firebaseService.get_data(
-                DatabaseCollectionMap.RICH_MENU,
-                alias_id
-            ).get('richmenu')
-            rich_menu_id = line_bot_api.create_rich_menu(
-                rich_menu_request=RichMenuRequest.from_json(rich_menu_str)
-            ).rich_menu_id
-            rich_menu_url = firebaseService.get_data(
-                DatabaseCollectionMap.RICH_MENU,
-                alias_id
-            ).get('image_url')
-            __class__.set_rich_menu_image_(rich_menu_id, rich_menu_url)
-            __class__.create_rich_menu_alias_(alias_id, rich_menu_id)
-            return rich_menu_id
+        line_bot_api = line_api_client.messaging_api
+        rich_menu = firebaseService.get_data(
+            DatabaseCollectionMap.RICH_MENU,
+            alias_id
+        )
+        rich_menu_id = line_bot_api.create_rich_menu(
+            rich_menu_request=RichMenuRequest.from_json(rich_menu.get('richmenu'))
+        ).rich_menu_id
+        # 設定 rich menu image
+        __class__.set_rich_menu_image_(rich_menu_id, rich_menu.get('image_url'))
+        __class__.create_rich_menu_alias_(alias_id, rich_menu_id)
+        return rich_menu_id
 
     #-----------------以下為設定rich menu的程式-----------------
 
     @staticmethod
-    def set_richmenu():
-        """
-        設定rich menu，並將alias id為page1的rich menu設為預設
-        """
-        with ApiClient(configuration) as api_client:
-            line_bot_api = MessagingApi(api_client)
-            richmenus = firebaseService.get_collection_data(DatabaseCollectionMap.RICH_MENU)
-            for richmenu in richmenus:
-                richmenu_id = RichMenuHelper.create_rich_menu_(richmenu.get('alias_id'))
-                firebaseService.update_data(
-                    DatabaseCollectionMap.RICH_MENU,
-                    richmenu.get('alias_id'),
-                    {'richmenu_id': richmenu_id}
-                )
-                if richmenu.get('alias_id') == 'page1':
-                    line_bot_api.set_default_rich_menu(richmenu_id)
+    def set_richmenu(force: bool = False) -> dict:
+        """
+        設定rich menu，並將alias id為page1的rich menu設為預設\n
+        只重新建立定義或圖片有變更的rich menu（force=True 時全部重新建立），回傳部署計畫與結果
+        """
+        from api.richmenu_deploy import RichMenuDeployer
+        return RichMenuDeployer().deploy(apply=True, force=force)
 
     @staticmethod
     def delete_all_richmenu():
         """
-        刪除所有圖文選單和Alias
-        """
-        with ApiClient(configuration) as api_client:
-            line_bot_api = MessagingApi(api_client)
-            richmenu_list = line_bot_api.get_rich_menu_list()
-            richmenu_alias_list = line_bot_api.get_rich_menu_alias_list()
-            for richmenu in richmenu_alias_list.aliases:
-                line_bot_api.delete_rich_menu_alias(richmenu.rich_menu_alias_id)
-            for richmenu in richmenu_list.richmenus:
-                line_bot_api.delete_rich_menu(richmenu.rich_menu_id)
-
-
-#         # 取消圖文選單連結使用者
-#         line_bot_api.unlink_rich_menu_id_from_user("Uxxxxxxx")
-#         line_bot_api.unlink_rich_menu_id_from_users(
-#             RichMenuBulkUnlinkRequest(
-#                 user_ids=user_ids
-#             )
-#         )
-
-#         # 取得使用者的圖文選單ID
-#         rich_menu_id = line_bot_api.get_rich_menu_id_of_user("Uxxxxxxx")
-
-#         # 批次替換或取消連結圖文選單
-#         line_bot_api.rich_menu_batch(
-#             RichMenuBatchRequest(
-#                 operations=[
-#                     RichMenuBatchLinkOperation(
-#                         var_from="richmenu-xxxxxxx", # 從哪個圖文選單ID
-#                         to="richmenu-xxxxxxxx" # 到哪個圖文選單ID
-#                     ),
-#                     RichMenuBatchUnlinkOperation(
-#                         var_from="richmenu-xxxxxxx", # 從哪個圖文選單ID
-#                     ),
-#                     RichMenuBatchUnlinkAllOperation(),
-#                 ]
-#             )
-#         )
-    
+        刪除所有圖文選單和Alias（並行處理）
+        """
+        return rich_menu_assigner.teardown()
+
+    @staticmethod
+    def link_rich_menu_to_users(rich_menu_id: str, users) -> dict:
+        """
+        將圖文選單連結到任意數量的使用者（每 500 人一個請求並行送出）\n
+        users 可以是 user id 或 firebaseService.iter_filter_data 等回傳的 dict
+        """
+        return rich_menu_assigner.link(rich_menu_id, users)
+
+    @staticmethod
+    def link_rich_menu_by_permission(rich_menu_id: str, permission) -> dict:
+        """
+        將圖文選單連結到指定權限的所有使用者
+        """
+        return rich_menu_assigner.link_by_permission(rich_menu_id, permission)
+
+    @staticmethod
+    def unlink_rich_menu_from_users(users) -> dict:
+        """
+        取消使用者的個人圖文選單
+        """
+        return rich_menu_assigner.unlink(users)
+
+    @staticmethod
+    def switch_rich_menu(from_rich_menu_id: str, to_rich_menu_id: str, wait: bool = True) -> list:
+        """
+        將所有使用 from_rich_menu_id 的使用者改為 to_rich_menu_id（rich menu batch API）
+        """
+        return rich_menu_assigner.switch(from_rich_menu_id, to_rich_menu_id, wait)
+
+def _copy_model(value):
+    """複製 SDK 的 pydantic 模型（含巢狀模型與 list / dict），不重新驗證"""
+    if hasattr(value, '__fields_set__'):
+        copied = value.__class__.__new__(value.__class__)
+        object.__setattr__(copied, '__dict__', {key: _copy_model(item) for key, item in value.__dict__.items()})
+        object.__setattr__(copied, '__fields_set__', set(value.__fields_set__))
+        return copied
+    if isinstance(value, list):
+        return [_copy_model(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _copy_model(item) for key, item in value.items()}
+    return value
+
+class QuickReplyRegistry:
+    """
+    預先建立的快速回覆選項（quick_reply 集合，以文件 ID 作為選項組 ID）\n
+    第一次使用時載入整個集合並建立 QuickReply 物件與 JSON，之後透過 Firestore 監聽只重建有變更的選項組；
+    共用的 QuickReply 不會交給呼叫端，get 每次回傳不需重新驗證的複本（修改複本不影響其他請求）。
+    """
+    def __init__(self, collection: str = DatabaseCollectionMap.QUICK_REPLY, field: str = 'items'):
+        """
+        Args:
+            collection: 快速回覆集合
+            field: 文件中存放選項的欄位（action 的 JSON 字串或 dict 列表，格式同 create_quick_reply）
+        """
+        self.collection = collection
+        self.field = field
+        self._service = None
+        # set_id -> (原始選項, QuickReply, JSON)，更新時整個 dict 替換
+        self._sets = {}
+        self._lock = threading.Lock()
+        self._counters = {'loads': 0, 'builds': 0, 'hits': 0}
+
+    def _get_sets(self) -> dict:
+        service = firebaseService.get()
+        if self._service is not service:
+            with self._lock:
+                # Firebase 重新建立後（例如 fork 後）原本的監聽已失效，需要重新載入與訂閱
+                if self._service is not service:
+                    self._sets = self._build_sets(service.get_collection_data(self.collection), {})
+                    self._counters['loads'] += 1
+                    service.subscribe(self.collection, self._on_changes)
+                    self._service = service
+        return self._sets
+
+    def _build_sets(self, docs: list, current: dict) -> dict:
+        sets = dict(current)
+        for doc in docs:
+            items = doc.get(self.field) or []
+            if doc['_id'] in sets and sets[doc['_id']][0] == items:
+                continue
+            try:
+                quick_reply = QuickReplyHelper.create_quick_reply(items)
+            except Exception as e:
+                print(f"Failed to build quick reply '{doc['_id']}': {str(e)}")
+                sets.pop(doc['_id'], None)
+                continue
+            sets[doc['_id']] = (items, quick_reply, quick_reply.to_json())
+            self._counters['builds'] += 1
+        return sets
+
+    def _on_changes(self, changes):
+        with self._lock:
+            removed = {change.document.id for change in changes if change.type.name == 'REMOVED'}
+            docs = [
+                {'_id': change.document.id, **(change.document.to_dict() or {})}
+                for change in changes if change.type.name != 'REMOVED'
+            ]
+            sets = self._build_sets(docs, self._sets)
+            for set_id in removed:
+                sets.pop(set_id, None)
+            self._sets = sets
+
+    def _get(self, set_id: str) -> tuple:
+        entry = self._get_sets().get(set_id)
+        if entry is None:
+            raise ValueError(f"Quick reply '{set_id}' not found")
+        self._counters['hits'] += 1
+        return entry
+
+    def get(self, set_id: str) -> QuickReply:
+        """Returns
+        QuickReply: 快速回覆選項的複本（可自由修改）
+        """
+        return _copy_model(self._get(set_id)[1])
+
+    def get_json(self, set_id: str) -> str:
+        """Returns
+        str: 快速回覆選項序列化後的 JSON（共用，不需複製）
+        """
+        return self._get(set_id)[2]
+
+    def stats(self) -> dict:
+        """Returns
+        dict: 選項組數量與載入、建立次數
+        """
+        return {'sets': len(self._sets), **self._counters}
+
 class QuickReplyHelper:
     @staticmethod
     def create_quick_reply(quick_reply_data: list[dict]):
@@ -283,26 +432,123 @@ class QuickReplyHelper:
         QuickReply: 快速回覆選項
         """
         return QuickReply(
-            items=[QuickReplyItem(action=LineBotHelper.create_action(json.loads(item))) for item in quick_reply_data]
+            items=[
+                QuickReplyItem(action=LineBotHelper.create_action(json.loads(item) if isinstance(item, str) else item))
+                for item in quick_reply_data
+            ]
         )
+
+    @staticmethod
+    def get_quick_reply(set_id: str) -> QuickReply:
+        """Returns
+        QuickReply: quick_reply 集合中預先建立的快速回覆選項（每次回傳複本）
+        """
+        return quick_reply_registry.get(set_id)
+
+quick_reply_registry = QuickReplyRegistry()
+register_metrics('quick_reply_registry', quick_reply_registry.stats)
     
 class FlexMessageHelper:
+    # 目前監聽 line_flex 變更的 Firebase 實體（重新建立後需重新訂閱）
+    _watched_service = None
+    _watch_lock = threading.Lock()
+    # fork 前預先編譯的文件 ID -> 文件的 update_time，版本相同時保留編譯結果
+    _preloaded_versions = {}
+
+    @staticmethod
+    def _watch_templates():
+        service = firebaseService.get()
+        if __class__._watched_service is service:
+            return
+        with __class__._watch_lock:
+            if __class__._watched_service is not service:
+                service.subscribe(DatabaseCollectionMap.LINE_FLEX, __class__._on_template_changes)
+                # 訂閱前可能錯過的變更；預先編譯的模板由訂閱後第一次通知（所有文件）依版本檢查
+                flex_templates.retain(__class__._preloaded_versions)
+                __class__._watched_service = service
+
+    @staticmethod
+    def watching() -> bool:
+        """目前的 Firebase 實體是否已監聽 line_flex 變更（不會建立 Firebase）"""
+        return firebaseService.initialized and __class__._watched_service is firebaseService.get()
+
+    @staticmethod
+    def _on_template_changes(changes):
+        for change in changes:
+            doc_id = change.document.id
+            version = __class__._preloaded_versions.get(doc_id)
+            if version is not None and change.type.name != 'REMOVED' and version == str(change.document.update_time):
+                continue
+            __class__._preloaded_versions.pop(doc_id, None)
+            flex_templates.invalidate(doc_id)
+
+    @staticmethod
+    def _load_template(doc: dict, field: str = None):
+        template = doc.get(field) if field else {key: value for key, value in doc.items() if key != 'version'}
+        return json.loads(template) if isinstance(template, str) else template
+
+    @staticmethod
+    def preload_templates(docs: list):
+        """
+        Summary:
+            預先編譯 line_flex 集合的模板（pre-fork 伺服器在 fork 前呼叫，worker 共用編譯結果）\n
+            整份文件即為模板（有 type）時編譯整份文件，否則編譯內容為 Flex JSON 的欄位；
+            worker 訂閱後只移除版本已改變的文件
+        Args:
+            docs: (文件 ID, 文件內容, update_time) 列表
+        """
+        for doc_id, doc, update_time in docs:
+            fields = [None] if 'type' in doc else [key for key, value in doc.items() if isinstance(value, (str, dict))]
+            compiled = False
+            for field in fields:
+                try:
+                    template = __class__._load_template(doc, field)
+                except ValueError:
+                    continue
+                if not isinstance(template, dict) or 'type' not in template:
+                    continue
+                flex_templates.get((doc_id, field), None, lambda template=template: template)
+                compiled = True
+            if compiled:
+                __class__._preloaded_versions[doc_id] = str(update_time)
+
     @staticmethod
-    def create_carousel_bubbles(items: list[dict], line_flex_json: json):
+    def get_template(doc_id: str, field: str = None) -> FlexTemplate:
+        """
+        Summary:
+            取得 line_flex 集合中編譯後的模板，以 (文件 ID, 欄位) 快取，文件變更時由 Firestore 監聽移除
+        Args:
+            doc_id: 模板文件 ID
+            field: 存放模板的欄位（JSON 字串或 dict），未指定時整份文件（version 欄位除外）即為模板
+        Returns:
+            FlexTemplate: 編譯後的模板
+        """
+        __class__._watch_templates()
+
+        def load():
+            doc = firebaseService.get_data(DatabaseCollectionMap.LINE_FLEX, doc_id)
+            if not doc:
+                raise ValueError(f"Flex template '{doc_id}' not found")
+            return __class__._load_template(doc, field)
+
+        return flex_templates.get((doc_id, field), None, load)
+
+    @staticmethod
+    def create_carousel_from_template(doc_id: str, items: list[dict], field: str = None) -> dict:
+        """ Returns 以 line_flex 模板的第一個 bubble 為每個 item 生成 carousel
+        dict: carousel
+        """
+        return __class__.get_template(doc_id, field).render_carousel(items)
+
+    @staticmethod
+    def create_carousel_bubbles(items: list[dict], line_flex_json: dict):
         """ Returns 根據 items 生成並替換 carousel bubbles的變數
         json: carousel bubbles
         """
-        bubbles = []
-        for item in items:
-            # 複製原始的 bubble
-            new_bubble = line_flex_json['contents'][0].copy()
-            # 在新 bubble 中進行變數替換
-            new_bubble = LineBotHelper.replace_variable(json.dumps(new_bubble), item)
-            
-            # 將新 bubble 添加到 bubbles 中
-            bubbles.append(json.loads(new_bubble))
-        
+        # 模板只編譯一次，每個 item 直接填入變數；同一份模板重複使用時請改用 create_carousel_from_template
+        carousel = FlexTemplate(line_flex_json).render_carousel(items)
+
         # 將生成的 bubbles 放回 line_flex_json 中
-        line_flex_json['contents'] = bubbles
+        line_flex_json['contents'] = carousel['contents']
 
-        return line_flex_json
\ No newline at end of file
+        return line_flex_json
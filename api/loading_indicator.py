@@ -0,0 +1,194 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Optional
+import heapq
+import os
+import threading
+import time
+
+class LoadingIndicator:
+    """
+    延遲、非阻塞的載入動畫\n
+    事件開始處理時只排程，不呼叫 API；超過門檻仍未回覆時才由背景執行緒送出載入動畫，回覆後取消。
+    門檻依各功能過去的處理時間（EWMA）調整：通常很快回覆的功能不送出，已知很慢的功能立即送出；
+    同一使用者同時有多個事件處理中時只送出一次。
+    """
+    # 門檻為平均處理時間的倍數，預留波動空間
+    HEADROOM = 1.5
+
+    def __init__(self, send: Callable[[str, int], None], delay: float = 0.5, max_delay: float = 1.5,
+                 loading_seconds: int = 10, alpha: float = 0.2, max_workers: int = 2):
+        """
+        Args:
+            send: 送出載入動畫的函式，參數為 (user id, 秒數)
+            delay: 沒有歷史資料時的門檻秒數，也是門檻的下限
+            max_delay: 門檻上限；平均處理時間超過此值的功能會立即送出
+            loading_seconds: 載入動畫顯示秒數（5 ~ 60，LINE 收到回覆時會自動結束）
+            alpha: EWMA 的權重
+            max_workers: 同時送出載入動畫的數量
+        """
+        self.send = send
+        self.delay = delay
+        self.max_delay = max_delay
+        self.loading_seconds = loading_seconds
+        self.alpha = alpha
+        self.max_workers = max_workers
+        # reply token -> (user id, 功能, 開始時間)
+        self._tracked = {}
+        # user id -> {'events': 處理中的事件數, 'due': 預計送出時間, 'submitted': 已交給執行緒送出, 'shown_until': 動畫結束時間}
+        self._users = {}
+        self._heap = []
+        self._sequence = 0
+        self._latency = {}
+        self._condition = threading.Condition()
+        self._pid = None
+        self._executor = None
+        self._counters = {'tracked': 0, 'scheduled': 0, 'sent': 0, 'cancelled': 0, 'deduplicated': 0, 'failed': 0}
+
+    def _ensure_started(self):
+        # 執行緒無法在 fork 後沿用，每個 worker 行程各自啟動
+        if self._pid == os.getpid():
+            return
+        with self._condition:
+            if self._pid == os.getpid():
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='loading-animation')
+            threading.Thread(target=self._run, name='loading-animation-scheduler', daemon=True).start()
+            self._pid = os.getpid()
+
+    def threshold(self, feature: Optional[str] = None) -> float:
+        """
+        Summary:
+            取得功能的門檻秒數（超過此時間未回覆才送出載入動畫）
+        """
+        latency = self._latency.get(feature)
+        if latency is None:
+            return self.delay
+        expected = latency * self.HEADROOM
+        if expected > self.max_delay:
+            return 0
+        return max(self.delay, expected)
+
+    def start(self, event, feature: Optional[str] = None):
+        """
+        Summary:
+            開始追蹤事件，門檻時間後仍未回覆則送出載入動畫（不會阻塞）
+        Args:
+            event: LINE event（需要 reply token 與使用者來源）
+            feature: 功能名稱，用於記錄處理時間
+        """
+        user_id = getattr(event.source, 'user_id', None)
+        reply_token = getattr(event, 'reply_token', None)
+        if not user_id or not reply_token:
+            return
+        self._ensure_started()
+        now = time.monotonic()
+        due = now + self.threshold(feature)
+        with self._condition:
+            if reply_token in self._tracked:
+                return
+            self._tracked[reply_token] = (user_id, feature, now)
+            self._counters['tracked'] += 1
+            state = self._users.setdefault(user_id, {'events': 0, 'due': None, 'submitted': False, 'shown_until': 0})
+            state['events'] += 1
+            if state['shown_until'] > now or state['submitted'] or (state['due'] is not None and state['due'] <= due):
+                # 動畫顯示中、送出中或已排程更早的送出
+                self._counters['deduplicated'] += 1
+                return
+            self._schedule(user_id, state, due)
+
+    def _schedule(self, user_id: str, state: dict, due: float):
+        state['due'] = due
+        self._sequence += 1
+        heapq.heappush(self._heap, (due, self._sequence, user_id))
+        self._counters['scheduled'] += 1
+        self._condition.notify()
+
+    def finish(self, event):
+        """
+        Summary:
+            事件已回覆或處理完成：取消尚未送出的載入動畫並記錄處理時間（重複呼叫不會有影響）
+        """
+        reply_token = getattr(event, 'reply_token', None)
+        now = time.monotonic()
+        with self._condition:
+            tracked = self._tracked.pop(reply_token, None)
+            if tracked is None:
+                return
+            user_id, feature, started_at = tracked
+            latency = now - started_at
+            previous = self._latency.get(feature)
+            self._latency[feature] = latency if previous is None else previous + self.alpha * (latency - previous)
+
+            state = self._users.get(user_id)
+            if state is None:
+                return
+            state['events'] -= 1
+            if state['events'] <= 0:
+                # 已排程或已交給執行緒但尚未送出的動畫都會取消（_send 送出前會再確認）
+                if state['due'] is not None or state['submitted']:
+                    self._counters['cancelled'] += 1
+                self._users.pop(user_id, None)
+                return
+            # 回覆會結束動畫；同一使用者還有其他事件處理中時重新排程
+            state['shown_until'] = 0
+            if state['due'] is None and not state['submitted']:
+                self._schedule(user_id, state, now + self.delay)
+
+    @contextmanager
+    def track(self, event, feature: Optional[str] = None):
+        """在區塊內追蹤事件，離開時呼叫 finish"""
+        self.start(event, feature)
+        try:
+            yield
+        finally:
+            self.finish(event)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    now = time.monotonic()
+                    if not self._heap:
+                        self._condition.wait()
+                        continue
+                    due, _, user_id = self._heap[0]
+                    if due > now:
+                        self._condition.wait(due - now)
+                        continue
+                    heapq.heappop(self._heap)
+                    state = self._users.get(user_id)
+                    # 已回覆或已重新排程的項目直接略過
+                    if state is None or state['due'] != due:
+                        continue
+                    state['due'] = None
+                    state['submitted'] = True
+                    break
+                executor = self._executor
+            executor.submit(self._send, user_id)
+
+    def _send(self, user_id: str):
+        with self._condition:
+            state = self._users.get(user_id)
+            # 等待執行緒期間已回覆（所有事件都已完成）時不送出，避免回覆後才顯示動畫
+            if state is None or not state['submitted']:
+                return
+            state['submitted'] = False
+            state['shown_until'] = time.monotonic() + self.loading_seconds
+        try:
+            self.send(user_id, self.loading_seconds)
+            self._counters['sent'] += 1
+        except Exception as e:
+            self._counters['failed'] += 1
+            print(f"Failed to show loading animation: {str(e)}")
+
+    def stats(self) -> dict:
+        """Returns
+        dict: 排程、送出、取消次數與各功能的平均處理時間（秒）
+        """
+        with self._condition:
+            return {
+                **self._counters,
+                'inflight': len(self._tracked),
+                'latency': {str(feature): round(latency, 3) for feature, latency in self._latency.items()}
+            }
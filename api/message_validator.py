@@ -0,0 +1,170 @@
+from collections import OrderedDict
+from typing import Callable
+import hashlib
+import json
+import threading
+
+class MessageValidator:
+    """
+    本機訊息檢查與驗證結果快取\n
+    已驗證過的內容（以序列化後的 hash 為鍵）直接略過；
+    內容不同但結構（模板形狀）已驗證過的訊息只做本機檢查，
+    只有新的模板形狀或 strict 模式才會呼叫 LINE 的 validate API。
+    """
+    MAX_MESSAGES = 5
+    MAX_TEXT_LENGTH = 5000
+    MAX_ALT_TEXT_LENGTH = 1500
+    MAX_CAROUSEL_BUBBLES = 12
+    MAX_QUICK_REPLY_ITEMS = 13
+    MAX_BUBBLE_SIZE = 30 * 1024
+    MAX_CAROUSEL_SIZE = 50 * 1024
+    URI_SCHEMES = ('http://', 'https://', 'line://', 'tel:', 'mailto:')
+
+    def __init__(self, remote_validator: Callable[[list], None], strict: bool = False, maxsize: int = 1024):
+        """
+        Args:
+            remote_validator: 呼叫 LINE validate API 的函式，驗證失敗時應拋出例外
+            strict: 是否每次都呼叫遠端驗證
+            maxsize: 快取的內容 hash / 形狀 hash 數量上限
+        """
+        self.remote_validator = remote_validator
+        self.strict = strict
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._validated = OrderedDict()
+        self._shapes = OrderedDict()
+        self._counters = {'cache_hits': 0, 'local_only': 0, 'remote_calls': 0, 'local_errors': 0}
+
+    def validate(self, messages: list):
+        """驗證訊息，不合法時拋出 ValueError（本機檢查）或 ApiException（遠端驗證）
+
+        Args:
+            messages (list): Message 物件列表
+        """
+        payload = [message.to_dict() for message in messages]
+        digest = self._digest(payload)
+        with self._lock:
+            if digest in self._validated:
+                self._validated.move_to_end(digest)
+                self._counters['cache_hits'] += 1
+                return
+
+        try:
+            self._validate_locally(payload)
+        except ValueError:
+            self._incr('local_errors')
+            raise
+
+        shape = self._digest(self._shape(payload))
+        with self._lock:
+            known_shape = shape in self._shapes
+        if self.strict or not known_shape:
+            self.remote_validator(messages)
+            self._incr('remote_calls')
+        else:
+            self._incr('local_only')
+
+        with self._lock:
+            self._remember(self._validated, digest)
+            self._remember(self._shapes, shape)
+
+    def stats(self) -> dict:
+        """Returns
+        dict: 快取大小與命中/遠端驗證計數
+        """
+        with self._lock:
+            return {
+                'strict': self.strict,
+                'validated_payloads': len(self._validated),
+                'known_shapes': len(self._shapes),
+                **self._counters
+            }
+
+    def clear(self):
+        """清除快取"""
+        with self._lock:
+            self._validated.clear()
+            self._shapes.clear()
+
+    def _incr(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _remember(self, cache: OrderedDict, key: str):
+        cache[key] = True
+        cache.move_to_end(key)
+        while len(cache) > self.maxsize:
+            cache.popitem(last=False)
+
+    @staticmethod
+    def _digest(data) -> str:
+        serialized = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+        return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+    # 自由文字欄位：內容不影響訊息是否合法（長度等限制由 _validate_locally 檢查），形狀中以空字串取代
+    FREE_TEXT_KEYS = frozenset({
+        'text', 'altText', 'label', 'data', 'displayText', 'fillInText', 'uri', 'url', 'linkUri',
+        'originalContentUrl', 'previewImageUrl', 'thumbnailImageUrl', 'title', 'address'
+    })
+
+    @classmethod
+    def _shape(cls, data, key: str = None):
+        """
+        取得資料結構，相同模板帶入不同變數時形狀相同\n
+        只有自由文字欄位的字串會以空字串取代；type、layout、size 等列舉值保留，避免不合法的值因形狀相同而略過驗證
+        """
+        if isinstance(data, dict):
+            return {child_key: cls._shape(value, child_key) for child_key, value in data.items()}
+        if isinstance(data, list):
+            return [cls._shape(value, key) for value in data]
+        if isinstance(data, str) and key in cls.FREE_TEXT_KEYS:
+            return ''
+        return data
+
+    def _validate_locally(self, payload: list):
+        if not payload:
+            raise ValueError('At least one message is required')
+        if len(payload) > self.MAX_MESSAGES:
+            raise ValueError(f'Too many messages: {len(payload)} > {self.MAX_MESSAGES}')
+        for message in payload:
+            message_type = message.get('type')
+            if message_type == 'text':
+                text = message.get('text') or ''
+                if not text or len(text) > self.MAX_TEXT_LENGTH:
+                    raise ValueError(f'Invalid text length: {len(text)}')
+            elif message_type == 'flex':
+                self._validate_flex(message)
+            quick_reply = message.get('quickReply')
+            if quick_reply:
+                items = quick_reply.get('items') or []
+                if not items or len(items) > self.MAX_QUICK_REPLY_ITEMS:
+                    raise ValueError(f'Invalid quick reply item count: {len(items)}')
+            self._validate_uris(message)
+
+    def _validate_flex(self, message: dict):
+        alt_text = message.get('altText') or ''
+        if not alt_text or len(alt_text) > self.MAX_ALT_TEXT_LENGTH:
+            raise ValueError(f'Invalid flex altText length: {len(alt_text)}')
+        contents = message.get('contents') or {}
+        size = len(json.dumps(contents, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        if contents.get('type') == 'bubble':
+            if size > self.MAX_BUBBLE_SIZE:
+                raise ValueError(f'Flex bubble is too large: {size} bytes')
+        elif contents.get('type') == 'carousel':
+            bubbles = contents.get('contents') or []
+            if not bubbles or len(bubbles) > self.MAX_CAROUSEL_BUBBLES:
+                raise ValueError(f'Invalid carousel bubble count: {len(bubbles)}')
+            if size > self.MAX_CAROUSEL_SIZE:
+                raise ValueError(f'Flex carousel is too large: {size} bytes')
+        else:
+            raise ValueError(f'Invalid flex container type: {contents.get("type")}')
+
+    def _validate_uris(self, data):
+        if isinstance(data, dict):
+            for key, value in data.items():
+                if key in ('uri', 'url') and isinstance(value, str) and not value.startswith(self.URI_SCHEMES):
+                    raise ValueError(f'Invalid {key}: {value}')
+                self._validate_uris(value)
+        elif isinstance(data, list):
+            for value in data:
+                self._validate_uris(value)
@@ -0,0 +1,131 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from linebot.v3.messaging import ApiException, MulticastRequest
+from utils.utils import chunked, iter_user_ids
+from utils.rate_limiter import backoff_delay, get_header
+from typing import Callable, Iterable
+import threading
+import time
+import uuid
+
+class MulticastError(Exception):
+    """
+    推播未完全送達（有段落在重試後仍失敗）\n
+    reports 為所有段落的結果，failed 為失敗的段落（含 user_ids，可重新推播給這些收件者）；
+    retryable 為 True 代表所有失敗都是暫時性的（429 / 5xx / 連線錯誤）
+    """
+    def __init__(self, reports: list):
+        self.reports = reports
+        self.failed = [report for report in reports if report['status'] == 'failed']
+        self.retryable = all(report['retryable'] for report in self.failed)
+        super().__init__(
+            f"Multicast failed for {len(self.failed)}/{len(reports)} chunks "
+            f"({sum(report['recipients'] for report in self.failed)} recipients): "
+            f"{self.failed[0]['error'] if self.failed else None}"
+        )
+
+    @staticmethod
+    def should_raise(reports: list) -> bool:
+        """有任何段落失敗時回傳 True"""
+        return any(report['status'] == 'failed' for report in reports)
+
+class MulticastFanout:
+    """
+    多人推播引擎\n
+    將任意數量的收件者分段（每段最多 500 人）並行送出，遇到 429 / 5xx 時依 Retry-After 與 jitter 退避重試，
+    每段使用固定的 X-Line-Retry-Key，重試不會重複送達。
+    """
+    MAX_RECIPIENTS = 500
+    RETRY_KEY_CONFLICT = 409
+
+    def __init__(self, get_messaging_api: Callable, max_workers: int = 4, chunks_per_second: float = 0,
+                 max_retries: int = 5):
+        """
+        Args:
+            get_messaging_api: 回傳 MessagingApi 的函式
+            max_workers: 同時送出的段數
+            chunks_per_second: 每秒最多送出的段數，0 代表不限制
+            max_retries: 每段的最大重試次數
+        """
+        self.get_messaging_api = get_messaging_api
+        self.max_workers = max_workers
+        self.chunks_per_second = chunks_per_second
+        self.max_retries = max_retries
+        self._pace_lock = threading.Lock()
+        self._next_send_at = 0.0
+
+    def send(self, recipients: Iterable, messages: list, chunk_size: int = MAX_RECIPIENTS) -> list:
+        """
+        Summary:
+            推播訊息給所有收件者
+        Args:
+            recipients: user id 或含 userId / _id 的 dict（例如 FireBaseService.iter_filter_data 的結果），重複的收件者只會送一次
+            messages: 要推播的訊息
+            chunk_size: 每段的收件者數量（最多 500）
+        Returns:
+            list[dict]: 每段的送出結果，依段落順序排列
+        """
+        chunk_size = max(1, min(chunk_size, self.MAX_RECIPIENTS))
+        reports = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = set()
+            for index, user_ids in enumerate(chunked(iter_user_ids(recipients), chunk_size)):
+                if len(pending) >= self.max_workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    reports.extend(future.result() for future in done)
+                pending.add(executor.submit(self._send_chunk, index, user_ids, messages))
+            reports.extend(future.result() for future in wait(pending).done)
+        return sorted(reports, key=lambda report: report['chunk'])
+
+    def _wait_for_pace(self):
+        if not self.chunks_per_second:
+            return
+        with self._pace_lock:
+            now = time.monotonic()
+            send_at = max(now, self._next_send_at)
+            self._next_send_at = send_at + 1 / self.chunks_per_second
+        if send_at > now:
+            time.sleep(send_at - now)
+
+    def _send_chunk(self, index: int, user_ids: list, messages: list) -> dict:
+        retry_key = str(uuid.uuid4())
+        report = {
+            'chunk': index,
+            'recipients': len(user_ids),
+            'retry_key': retry_key,
+            'status': 'failed',
+            'attempts': 0,
+            'request_id': None,
+            'error': None,
+            # 失敗時是否可以稍後重送（429 / 5xx / 連線錯誤）
+            'retryable': True
+        }
+        request = MulticastRequest(to=user_ids, messages=messages)
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_pace()
+            report['attempts'] = attempt + 1
+            try:
+                response = self.get_messaging_api().multicast_with_http_info(request, x_line_retry_key=retry_key)
+                report['status'] = 'sent'
+                report['request_id'] = get_header(response.headers, 'x-line-request-id')
+                report['error'] = None
+                return report
+            except ApiException as e:
+                if e.status == self.RETRY_KEY_CONFLICT:
+                    # 相同 retry key 的請求已被接受（前一次嘗試其實已送達）
+                    report['status'] = 'sent'
+                    report['request_id'] = get_header(e.headers, 'x-line-accepted-request-id')
+                    report['error'] = None
+                    return report
+                report['error'] = f"{e.status} {e.reason}"
+                if e.status != 429 and (e.status or 0) < 500:
+                    report['retryable'] = False
+                    break
+                if attempt < self.max_retries:
+                    time.sleep(backoff_delay(attempt, get_header(e.headers, 'retry-after')))
+            except Exception as e:
+                # 連線錯誤等暫時性問題，以相同 retry key 重試
+                report['error'] = str(e)
+                if attempt < self.max_retries:
+                    time.sleep(backoff_delay(attempt))
+        report['user_ids'] = user_ids
+        return report
@@ -0,0 +1,142 @@
+from linebot.v3.messaging import ApiException
+from utils.cache import TTLCache, MISSING
+from utils.utils import iter_user_ids
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterable, Optional
+import threading
+
+# 使用者不存在（封鎖、未加好友或已刪除帳號）的快取值
+NOT_FOUND = object()
+
+class ProfileCache:
+    """
+    LINE 使用者個人資料快取\n
+    成功取得的資料快取 ttl 秒，404（封鎖或未加好友）以較短的 negative_ttl 快取；
+    同一使用者同時有多個查詢時只會呼叫一次 API，其他查詢等待同一個結果。
+    """
+    def __init__(self, fetch: Callable[[str], dict], store: Callable[[list], dict] = None, maxsize: int = 10000,
+                 ttl: float = 3600, negative_ttl: float = 300, max_workers: int = 8):
+        """
+        Args:
+            fetch: 以 user id 取得個人資料的函式（LINE get_profile）
+            store: 批次寫入個人資料的函式，參數為 [(user_id, profile), ...]（prefetch 的 write-through 使用）
+            maxsize: 最多快取的使用者數
+            ttl: 個人資料快取秒數
+            negative_ttl: 找不到使用者的快取秒數
+            max_workers: prefetch 同時查詢的數量
+        """
+        self.fetch = fetch
+        self.store = store
+        self.negative_ttl = negative_ttl
+        self.max_workers = max_workers
+        self._cache = TTLCache(maxsize, ttl)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._counters = {'fetches': 0, 'not_found': 0, 'coalesced': 0}
+
+    def get(self, user_id: str) -> Optional[dict]:
+        """
+        Summary:
+            取得使用者個人資料
+        Returns:
+            dict | None: 個人資料，使用者不存在時回傳 None
+        """
+        value = self._cache.get(user_id)
+        if value is MISSING:
+            value = self._load(user_id)
+        return None if value is NOT_FOUND else dict(value)
+
+    def peek(self, user_id: str):
+        """只查詢快取，回傳個人資料、NOT_FOUND 或 MISSING（未快取）"""
+        value = self._cache.get(user_id)
+        return dict(value) if isinstance(value, dict) else value
+
+    def _load(self, user_id: str):
+        with self._lock:
+            future = self._inflight.get(user_id)
+            owner = future is None
+            if owner:
+                future = self._inflight[user_id] = Future()
+                generation = self._cache.generation(user_id)
+            else:
+                self._counters['coalesced'] += 1
+        if not owner:
+            return future.result()
+
+        try:
+            try:
+                value = self.fetch(user_id)
+                self._counters['fetches'] += 1
+                self._cache.set(user_id, value, generation=generation)
+            except ApiException as e:
+                if e.status != 404:
+                    raise
+                value = NOT_FOUND
+                self._counters['not_found'] += 1
+                self._cache.set(user_id, value, generation=generation, ttl=self.negative_ttl)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(user_id, None)
+
+    def set(self, user_id: str, profile: dict):
+        """寫入個人資料（例如由其他來源取得最新資料時）"""
+        self._cache.set(user_id, dict(profile))
+
+    def mark_not_found(self, user_id: str):
+        """標記使用者不存在（例如收到 unfollow 事件）"""
+        self._cache.delete(user_id)
+        self._cache.set(user_id, NOT_FOUND, ttl=self.negative_ttl)
+
+    def evict(self, user_id: str):
+        """移除快取（例如收到 follow 事件，下次查詢時重新取得）"""
+        self._cache.delete(user_id)
+
+    def prefetch(self, user_ids: Iterable, write_through: bool = False) -> dict:
+        """
+        Summary:
+            並行取得多位使用者的個人資料並放入快取
+        Args:
+            user_ids: user id 或含 userId / _id 的 dict
+            write_through: 是否將取得的個人資料合併寫入 store（例如 users 集合）
+        Returns:
+            dict: cached（原本已在快取）、fetched、not_found、failed 與 stored（write-through 結果）
+        """
+        report = {'cached': 0, 'fetched': 0, 'not_found': [], 'failed': [], 'stored': None}
+        missing = []
+        for user_id in iter_user_ids(user_ids):
+            if self._cache.get(user_id) is MISSING:
+                missing.append(user_id)
+            else:
+                report['cached'] += 1
+
+        def load(user_id):
+            try:
+                return user_id, self.get(user_id), None
+            except Exception as e:
+                return user_id, None, str(e)
+
+        profiles = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for user_id, profile, error in executor.map(load, missing):
+                if error:
+                    report['failed'].append({'_id': user_id, 'error': error})
+                elif profile is None:
+                    report['not_found'].append(user_id)
+                else:
+                    report['fetched'] += 1
+                    profiles.append((user_id, profile))
+
+        if write_through and self.store and profiles:
+            report['stored'] = self.store(profiles)
+        return report
+
+    def stats(self) -> dict:
+        """Returns
+        dict: 快取統計與 API 呼叫次數
+        """
+        return {**self._cache.stats(), 'inflight': len(self._inflight), **self._counters}
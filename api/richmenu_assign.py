@@ -0,0 +1,208 @@
+from config import get_config
+from map import DatabaseCollectionMap
+from utils.utils import chunked, iter_user_ids
+from utils.rate_limiter import backoff_delay, get_header
+from linebot.v3.messaging import (
+    ApiException,
+    RichMenuBulkLinkRequest,
+    RichMenuBulkUnlinkRequest,
+    RichMenuBatchRequest,
+    RichMenuBatchLinkOperation,
+    RichMenuBatchUnlinkOperation,
+    RichMenuBatchUnlinkAllOperation
+)
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait as wait_futures
+from typing import Callable, Iterable
+import time
+import uuid
+
+config = get_config()
+line_api_client = config.line_api_client
+firebaseService = config.firebaseService
+
+class RichMenuAssigner:
+    """
+    圖文選單指派引擎\n
+    大量使用者的連結 / 取消連結以每 500 人一個 bulk 請求並行送出；
+    整批切換（例如所有使用 A 的使用者改為 B）使用 rich menu batch API 並輪詢進度；
+    刪除所有圖文選單與 alias 時以有限的並行數處理。
+    """
+    MAX_USERS = 500
+    MAX_OPERATIONS = 1000
+
+    def __init__(self, max_workers: int = 4, max_retries: int = 5):
+        """
+        Args:
+            max_workers: 同時送出的請求數
+            max_retries: 遇到 429 / 5xx 時的最大重試次數
+        """
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+
+    def _call(self, func: Callable):
+        """呼叫 LINE API，遇到 429 / 5xx 時依 Retry-After 退避重試"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return func()
+            except ApiException as e:
+                if attempt >= self.max_retries or (e.status != 429 and (e.status or 0) < 500):
+                    raise
+                time.sleep(backoff_delay(attempt, get_header(e.headers, 'retry-after')))
+
+    def _run_chunks(self, users: Iterable, send: Callable[[list], None]) -> dict:
+        report = {'users': 0, 'chunks': 0, 'succeeded': 0, 'failed': []}
+
+        def run(index, user_ids):
+            try:
+                self._call(lambda: send(user_ids))
+                return index, user_ids, None
+            except Exception as e:
+                return index, user_ids, str(e)
+
+        def collect(futures):
+            for future in futures:
+                index, user_ids, error = future.result()
+                if error:
+                    report['failed'].append({'chunk': index, 'user_ids': user_ids, 'error': error})
+                else:
+                    report['succeeded'] += len(user_ids)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = set()
+            for index, user_ids in enumerate(chunked(iter_user_ids(users), self.MAX_USERS)):
+                report['users'] += len(user_ids)
+                report['chunks'] += 1
+                if len(pending) >= self.max_workers * 2:
+                    done, pending = wait_futures(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                pending.add(executor.submit(run, index, user_ids))
+            collect(wait_futures(pending).done)
+        report['failed'].sort(key=lambda chunk: chunk['chunk'])
+        return report
+
+    def link(self, rich_menu_id: str, users: Iterable) -> dict:
+        """
+        Summary:
+            將圖文選單連結到使用者
+        Args:
+            rich_menu_id: 圖文選單 ID
+            users: user id 或含 userId / _id 的 dict（可為 generator，不會一次載入）
+        Returns:
+            dict: users、chunks、succeeded（成功的人數）、failed（失敗的段落與錯誤）
+        """
+        line_bot_api = line_api_client.messaging_api
+        return self._run_chunks(users, lambda user_ids: line_bot_api.link_rich_menu_id_to_users(
+            RichMenuBulkLinkRequest(rich_menu_id=rich_menu_id, user_ids=user_ids)
+        ))
+
+    def unlink(self, users: Iterable) -> dict:
+        """
+        Summary:
+            取消使用者的個人圖文選單（恢復為預設圖文選單），回傳格式同 link
+        """
+        line_bot_api = line_api_client.messaging_api
+        return self._run_chunks(users, lambda user_ids: line_bot_api.unlink_rich_menu_id_from_users(
+            RichMenuBulkUnlinkRequest(user_ids=user_ids)
+        ))
+
+    def link_by_permission(self, rich_menu_id: str, permission) -> dict:
+        """
+        Summary:
+            將圖文選單連結到指定權限的所有使用者（分頁讀取 users 集合），回傳格式同 link
+        """
+        users = firebaseService.iter_filter_data(
+            DatabaseCollectionMap.USER,
+            [('permission', '==', permission)],
+            page_size=self.MAX_USERS,
+            select=['permission']
+        )
+        return self.link(rich_menu_id, users)
+
+    def batch(self, operations: list, wait: bool = True, poll_interval: float = 1, timeout: float = 600,
+              max_resumes: int = 1) -> list:
+        """
+        Summary:
+            以 rich menu batch API 送出批次操作（每個請求最多 1000 個操作），並輪詢直到完成
+        Args:
+            operations: RichMenuBatchLinkOperation / RichMenuBatchUnlinkOperation / RichMenuBatchUnlinkAllOperation
+            wait: 是否等待完成
+            poll_interval: 輪詢間隔秒數
+            timeout: 每個請求最長等待秒數
+            max_resumes: 失敗時以 resumeRequestKey 繼續執行的次數
+        Returns:
+            list[dict]: 每個請求的 request_id、phase 與完成時間
+        """
+        line_bot_api = line_api_client.messaging_api
+        reports = []
+        for chunk in chunked(operations, self.MAX_OPERATIONS):
+            request = RichMenuBatchRequest(operations=chunk, resume_request_key=uuid.uuid4().hex)
+            report = {'operations': len(chunk), 'request_id': None, 'phase': None, 'resumed': 0, 'completed_time': None}
+            reports.append(report)
+            while True:
+                response = self._call(lambda: line_bot_api.rich_menu_batch_with_http_info(request))
+                report['request_id'] = get_header(response.headers, 'x-line-request-id')
+                if not wait:
+                    report['phase'] = 'submitted'
+                    break
+                progress = self._poll(report['request_id'], poll_interval, timeout)
+                report['phase'] = getattr(progress.phase, 'value', progress.phase) if progress else 'timeout'
+                report['completed_time'] = progress.completed_time.isoformat() if progress and progress.completed_time else None
+                # 失敗時以相同的 resumeRequestKey 重送，只處理尚未完成的使用者
+                if report['phase'] != 'failed' or report['resumed'] >= max_resumes:
+                    break
+                report['resumed'] += 1
+        return reports
+
+    def _poll(self, request_id: str, poll_interval: float, timeout: float):
+        line_bot_api = line_api_client.messaging_api
+        deadline = time.monotonic() + timeout
+        while True:
+            progress = self._call(lambda: line_bot_api.get_rich_menu_batch_progress(request_id))
+            if getattr(progress.phase, 'value', progress.phase) != 'ongoing':
+                return progress
+            if time.monotonic() + poll_interval > deadline:
+                return None
+            time.sleep(poll_interval)
+
+    def switch(self, from_rich_menu_id: str, to_rich_menu_id: str, wait: bool = True) -> list:
+        """將所有連結 from_rich_menu_id 的使用者改為 to_rich_menu_id（LINE 端批次處理，不需要使用者清單）"""
+        return self.batch([RichMenuBatchLinkOperation(var_from=from_rich_menu_id, to=to_rich_menu_id)], wait=wait)
+
+    def unlink_from(self, rich_menu_id: str, wait: bool = True) -> list:
+        """取消所有使用者與 rich_menu_id 的連結"""
+        return self.batch([RichMenuBatchUnlinkOperation(var_from=rich_menu_id)], wait=wait)
+
+    def unlink_all(self, wait: bool = True) -> list:
+        """取消所有使用者的個人圖文選單"""
+        return self.batch([RichMenuBatchUnlinkAllOperation()], wait=wait)
+
+    def teardown(self) -> dict:
+        """
+        Summary:
+            並行刪除所有 alias 後再刪除所有圖文選單
+        Returns:
+            dict: 刪除的 alias / 圖文選單與錯誤
+        """
+        line_bot_api = line_api_client.messaging_api
+        alias_ids = [alias.rich_menu_alias_id for alias in line_bot_api.get_rich_menu_alias_list().aliases]
+        rich_menu_ids = [menu.rich_menu_id for menu in line_bot_api.get_rich_menu_list().richmenus]
+        report = {'aliases': [], 'richmenus': [], 'errors': []}
+
+        def delete_all(ids, delete, deleted):
+            def run(item_id):
+                try:
+                    self._call(lambda: delete(item_id))
+                    return item_id, None
+                except Exception as e:
+                    return item_id, str(e)
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for item_id, error in executor.map(run, ids):
+                    if error:
+                        report['errors'].append({'id': item_id, 'error': error})
+                    else:
+                        deleted.append(item_id)
+
+        # alias 先刪除，避免指向已刪除的圖文選單
+        delete_all(alias_ids, line_bot_api.delete_rich_menu_alias, report['aliases'])
+        delete_all(rich_menu_ids, line_bot_api.delete_rich_menu, report['richmenus'])
+        return report
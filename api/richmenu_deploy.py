@@ -0,0 +1,247 @@
+"""
+圖文選單部署（比對差異後只更新有變更的圖文選單）
+
+    python -m api.richmenu_deploy            # 只顯示部署計畫
+    python -m api.richmenu_deploy --apply    # 執行部署
+    python -m api.richmenu_deploy --apply --force   # 全部重新建立
+"""
+from api.linebot_helper import RichMenuHelper, line_api_client, firebaseService
+from api.image_cache import validate_rich_menu_image
+from map import DatabaseCollectionMap
+from linebot.v3.messaging import (
+    ApiException,
+    RichMenuRequest,
+    UpdateRichMenuAliasRequest
+)
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import sys
+
+class RichMenuDeployer:
+    """
+    rich_menu 集合的圖文選單部署\n
+    以圖文選單定義與圖片內容的雜湊值和已部署的版本比較，只建立有變更的圖文選單；
+    建立與上傳圖片並行處理，全部成功後才切換 alias（update_rich_menu_alias），任一失敗則不切換並刪除新建立的圖文選單。
+    """
+    def __init__(self, collection: str = DatabaseCollectionMap.RICH_MENU, default_alias: str = 'page1', max_workers: int = 4):
+        """
+        Args:
+            collection: 圖文選單集合（文件需有 alias_id、richmenu、image_url 欄位）
+            default_alias: 設為預設圖文選單的 alias
+            max_workers: 同時建立 / 上傳的數量
+        """
+        self.collection = collection
+        self.default_alias = default_alias
+        self.max_workers = max_workers
+
+    @staticmethod
+    def _hash(content: bytes) -> str:
+        return hashlib.sha256(content).hexdigest()
+
+    @staticmethod
+    def _load_image(menu: dict):
+        """取得圖文選單的圖片並確認尺寸與定義相同（失敗時以 ValueError 回報）"""
+        try:
+            image = RichMenuHelper.get_rich_menu_image_(menu['_image_url'])
+            validate_rich_menu_image(image, menu['_size'])
+        except Exception as e:
+            raise ValueError(f"image: {e}") from e
+        return image
+
+    def plan(self, force: bool = False, check_images: bool = True) -> dict:
+        """
+        Summary:
+            比對 Firestore 中的定義與 LINE 上已部署的圖文選單，產生部署計畫
+        Args:
+            force: 全部重新建立
+            check_images: 是否取得並檢查必定會重新建立的圖文選單的圖片；
+                為 False 時（只顯示計畫）只檢查需要以圖片判斷是否變更的圖文選單，其餘在 apply 時才取得
+        Returns:
+            dict: {'menus': [每個圖文選單的 action（create / replace / alias / unchanged / invalid）與原因], 'aliases': 目前的 alias 對應}
+        """
+        line_bot_api = line_api_client.messaging_api
+        docs = firebaseService.get_collection_data(self.collection)
+        deployed_ids = {menu.rich_menu_id for menu in line_bot_api.get_rich_menu_list().richmenus}
+        aliases = {alias.rich_menu_alias_id: alias.rich_menu_id for alias in line_bot_api.get_rich_menu_alias_list().aliases}
+
+        # 1. 先檢查定義：不需要圖片就能決定建立或取代的圖文選單，只在需要時才取得圖片
+        menus = []
+        for doc in docs:
+            menu = {
+                'doc_id': doc['_id'],
+                'alias_id': doc.get('alias_id') or doc['_id'],
+                'rich_menu_id': doc.get('richmenu_id')
+            }
+            try:
+                if not doc.get('richmenu'):
+                    raise ValueError('missing richmenu definition')
+                # 以正規化後的 JSON 計算雜湊，空白或欄位順序不同不視為變更
+                parsed = json.loads(doc['richmenu'])
+                if not isinstance(parsed, dict):
+                    raise ValueError('richmenu definition must be a JSON object')
+            except ValueError as e:
+                menus.append({**menu, 'action': 'invalid', 'reason': str(e)})
+                continue
+            definition = json.dumps(parsed, sort_keys=True, ensure_ascii=False)
+            menu.update({
+                'definition_hash': self._hash(definition.encode('utf-8')),
+                'image_hash': None,
+                '_definition': definition,
+                '_image_url': doc.get('image_url'),
+                '_size': parsed.get('size'),
+                '_image': None
+            })
+            if force:
+                menu['action'], menu['reason'] = 'replace', 'forced'
+            elif not menu['rich_menu_id'] or menu['rich_menu_id'] not in deployed_ids:
+                menu['action'], menu['reason'] = 'create', 'not deployed'
+            elif menu['definition_hash'] != doc.get('definition_hash'):
+                menu['action'], menu['reason'] = 'replace', 'definition changed'
+            else:
+                menu['action'], menu['reason'] = None, None
+                menu['_deployed_image_hash'] = doc.get('image_hash')
+            menus.append(menu)
+
+        # 2. 並行取得圖片；圖片有問題的圖文選單標記為 invalid，不影響其他圖文選單
+        pending = [menu for menu in menus if menu['action'] is None or (check_images and menu['action'] != 'invalid')]
+        def fetch_image(menu):
+            try:
+                return self._load_image(menu), None
+            except ValueError as e:
+                return None, str(e)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            images = list(executor.map(fetch_image, pending))
+
+        for menu, (image, error) in zip(pending, images):
+            deployed_image_hash = menu.pop('_deployed_image_hash', None)
+            if error:
+                menu['action'], menu['reason'] = 'invalid', error
+                continue
+            menu['_image'], menu['image_hash'] = image, image.sha256
+            if menu['action']:
+                continue
+            if menu['image_hash'] != deployed_image_hash:
+                menu['action'], menu['reason'] = 'replace', 'image changed'
+            elif aliases.get(menu['alias_id']) != menu['rich_menu_id']:
+                menu['action'], menu['reason'] = 'alias', 'alias not pointing to deployed menu'
+            else:
+                menu['action'], menu['reason'] = 'unchanged', None
+        return {'menus': menus, 'aliases': aliases}
+
+    def apply(self, plan: dict) -> dict:
+        """
+        Summary:
+            執行部署計畫
+        Returns:
+            dict: 部署結果（applied、每個圖文選單的結果、刪除的舊圖文選單、錯誤）
+        """
+        line_bot_api = line_api_client.messaging_api
+        menus = plan['menus']
+        aliases = plan['aliases']
+        changed = [menu for menu in menus if menu['action'] in ('create', 'replace')]
+        report = {'applied': False, 'created': {}, 'deleted': [], 'errors': []}
+
+        # 1. 並行建立新的圖文選單並上傳圖片
+        def create(menu):
+            # 只顯示計畫時未取得的圖片在此取得，與其他圖文選單的建立並行
+            if menu['_image'] is None:
+                menu['_image'] = self._load_image(menu)
+                menu['image_hash'] = menu['_image'].sha256
+            rich_menu_id = line_bot_api.create_rich_menu(
+                rich_menu_request=RichMenuRequest.from_json(menu['_definition'])
+            ).rich_menu_id
+            try:
+                RichMenuHelper.upload_rich_menu_image_(rich_menu_id, menu['_image'])
+            except Exception:
+                self._delete(rich_menu_id)
+                raise
+            return rich_menu_id
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [(menu, executor.submit(create, menu)) for menu in changed]
+        for menu, future in futures:
+            try:
+                report['created'][menu['alias_id']] = future.result()
+            except Exception as e:
+                report['errors'].append({'alias_id': menu['alias_id'], 'step': 'create', 'error': str(e)})
+
+        # 任一建立失敗時不切換任何 alias，維持原本的圖文選單
+        if report['errors']:
+            report['deleted'] = self._delete_all(report['created'].values())
+            return report
+
+        # 2. 全部建立完成後才切換 alias
+        targets = {menu['alias_id']: report['created'].get(menu['alias_id'], menu['rich_menu_id']) for menu in menus}
+        failed_aliases = set()
+        for menu in menus:
+            if menu['action'] not in ('create', 'replace', 'alias'):
+                continue
+            alias_id = menu['alias_id']
+            try:
+                if alias_id in aliases:
+                    line_bot_api.update_rich_menu_alias(alias_id, UpdateRichMenuAliasRequest(rich_menu_id=targets[alias_id]))
+                else:
+                    RichMenuHelper.create_rich_menu_alias_(alias_id, targets[alias_id])
+            except ApiException as e:
+                failed_aliases.add(alias_id)
+                report['errors'].append({'alias_id': alias_id, 'step': 'alias', 'error': f"{e.status} {e.reason}"})
+
+        # alias 切換失敗的圖文選單視為未部署：alias 仍指向舊圖文選單，保留舊的並刪除新建立的
+        deployed = [menu for menu in changed if menu['alias_id'] not in failed_aliases]
+        orphaned = [report['created'][alias_id] for alias_id in failed_aliases if alias_id in report['created']]
+
+        default_menu = next((menu for menu in deployed if menu['alias_id'] == self.default_alias), None)
+        if default_menu:
+            line_bot_api.set_default_rich_menu(targets[self.default_alias])
+
+        # 3. 記錄已部署的版本
+        for menu in deployed:
+            firebaseService.update_data(self.collection, menu['doc_id'], {
+                'richmenu_id': targets[menu['alias_id']],
+                'definition_hash': menu['definition_hash'],
+                'image_hash': menu['image_hash']
+            })
+
+        # 4. 刪除被取代的舊圖文選單與 alias 切換失敗而未使用的新圖文選單
+        report['deleted'] = self._delete_all([
+            *(menu['rich_menu_id'] for menu in deployed
+              if menu['action'] == 'replace' and menu['rich_menu_id'] and menu['rich_menu_id'] not in targets.values()),
+            *orphaned
+        ])
+        report['applied'] = not report['errors']
+        return report
+
+    def deploy(self, apply: bool = True, force: bool = False) -> dict:
+        """
+        Summary:
+            產生部署計畫並（選擇性）執行
+        Returns:
+            dict: {'plan': 部署計畫, 'result': 部署結果（只產生計畫時為 None）}
+        """
+        plan = self.plan(force=force, check_images=apply)
+        result = self.apply(plan) if apply else None
+        return {
+            'plan': [{key: value for key, value in menu.items() if not key.startswith('_')} for menu in plan['menus']],
+            'result': result
+        }
+
+    @staticmethod
+    def _delete(rich_menu_id: str) -> bool:
+        try:
+            line_api_client.messaging_api.delete_rich_menu(rich_menu_id)
+            return True
+        except ApiException as e:
+            print(f"Failed to delete rich menu {rich_menu_id}: {e.status} {e.reason}")
+            return False
+
+    def _delete_all(self, rich_menu_ids) -> list:
+        rich_menu_ids = list(rich_menu_ids)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            deleted = list(executor.map(self._delete, rich_menu_ids))
+        return [rich_menu_id for rich_menu_id, ok in zip(rich_menu_ids, deleted) if ok]
+
+if __name__ == '__main__':
+    output = RichMenuDeployer().deploy(apply='--apply' in sys.argv, force='--force' in sys.argv)
+    print(json.dumps(output, indent=2, ensure_ascii=False))
@@ -1,22 +1,126 @@
+from googleapiclient.errors import HttpError
+from pygsheets.utils import format_addr, numericise_all
+from utils.metrics import register_metrics
+import atexit
+import logging
+import random
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
 class SpreadsheetService:
-    def __init__(self, gc, url):
+    def __init__(self, gc, url, write_buffer_size=100, write_flush_interval=5):
         self.gc = gc
         self.sh = self.gc.open_by_url(url)
+        self.write_buffer_size = write_buffer_size
+        self.write_flush_interval = write_flush_interval
+        self._write_buffer = None
+        self._lock = threading.Lock()
+        # 快取：工作表名稱 -> 工作表物件；工作表 id -> {標題名稱: column index}
+        self._worksheets = {}
+        self._headers = {}
+        self._snapshots = {}
+
+    def get_worksheet(self, title: str):
+        """Returns
+        Worksheet: 工作表物件（快取，不會每次重新查詢）
+        """
+        wks = self._worksheets.get(title)
+        if wks is None:
+            wks = self.sh.worksheet_by_title(title)
+            with self._lock:
+                self._worksheets[title] = wks
+        return wks
+
+    def get_header_map(self, wks, refresh: bool = False):
+        """Returns
+        dict: 標題名稱 -> column index（快取第 1 列，重複標題取第一個）
+        """
+        if isinstance(wks, str):
+            wks = self.get_worksheet(wks)
+        headers = None if refresh else self._headers.get(wks.id)
+        if headers is None:
+            headers = {}
+            for index, name in enumerate(wks.get_row(1), start=1):
+                headers.setdefault(name, index)
+            with self._lock:
+                self._headers[wks.id] = headers
+        return headers
+
+    def refresh(self, title: str = None):
+        """
+        Summary:
+            清除工作表與標題快取
+        Args:
+            title: 工作表名稱，未指定則清除全部
+        """
+        with self._lock:
+            if title is None:
+                self._worksheets.clear()
+                self._headers.clear()
+                return
+            wks = self._worksheets.pop(title, None)
+            if wks is not None:
+                self._headers.pop(wks.id, None)
+
+    def snapshot(self, title: str, key_columns: tuple = (), refresh_interval: float = 0):
+        """
+        Summary:
+            取得工作表快照（同一工作表只載入一次），適合讀多寫少的參照資料
+        Args:
+            title: 工作表名稱
+            key_columns: 要建立索引的欄位名稱，find 時為 O(1) 查詢
+            refresh_interval: 背景自動重新載入的間隔秒數，0 代表只在呼叫 refresh 時更新
+        Returns:
+            WorksheetSnapshot: 工作表快照（值與 get_all_records 相同，數字會轉換為 int / float，find 時請使用相同型別）
+        """
+        snapshot = self._snapshots.get(title)
+        if snapshot is None:
+            # 載入時會呼叫 get_worksheet（需要 self._lock），因此在鎖外建立，再以 setdefault 保留先完成的快照
+            created = WorksheetSnapshot(lambda: self._load_values(title), key_columns, refresh_interval)
+            with self._lock:
+                snapshot = self._snapshots.setdefault(title, created)
+            if snapshot is not created:
+                created.stop()
+        return snapshot
+
+    def _load_values(self, title: str) -> list:
+        """Returns
+        list: 工作表所有資料，標題以外的值與 get_all_records 相同轉換為數字
+        """
+        rows = self.get_worksheet(title).get_all_values(
+            include_tailing_empty=False, include_tailing_empty_rows=False
+        )
+        return rows[:1] + [numericise_all(row) for row in rows[1:]]
+
+    def _invalidate_headers(self, wks):
+        with self._lock:
+            self._headers.pop(wks.id, None)
 
     def get_column_index(self, wks, column_name):
         """Returns
         int: column_name 所在的 column index
         """
-        return wks.get_row(1).index(column_name) + 1
-    
+        headers = self.get_header_map(wks)
+        if column_name not in headers:
+            # 標題可能已在其他地方被修改，重新讀取一次
+            headers = self.get_header_map(wks, refresh=True)
+        if column_name not in headers:
+            raise ValueError(f"{column_name!r} is not in list")
+        return headers[column_name]
+
     def get_row_index(self, wks, column_name, value):
         """Returns
         int: value 所在的 row index
         """
+        if isinstance(wks, str):
+            wks = self.get_worksheet(wks)
         column_index = self.get_column_index(wks, column_name)
         column_values = wks.get_col(column_index)
         return column_values.index(value) + 1 if value in column_values else None
-    
+
     def get_worksheet_data(self, title: str):
         """
         Summary:
@@ -26,10 +130,22 @@ class SpreadsheetService:
         Returns:
             list: 工作表資料
         """
-        wks = self.sh.worksheet_by_title(title)
+        wks = self.get_worksheet(title)
         return wks.get_all_records()
-    
-    def update_cell_value(self, title: str, range: tuple, value: str):
+
+    def write_buffer(self):
+        """Returns
+        SpreadsheetWriteBuffer: 共用的寫入緩衝區（第一次呼叫時建立）
+        """
+        with self._lock:
+            if self._write_buffer is None:
+                self._write_buffer = SpreadsheetWriteBuffer(
+                    self, self.write_buffer_size, self.write_flush_interval
+                )
+                register_metrics('spreadsheet_write_buffer', self._write_buffer.stats)
+            return self._write_buffer
+
+    def update_cell_value(self, title: str, range: tuple, value: str, buffered: bool = False):
         """
         Summary:
             更新工作表資料
@@ -37,10 +153,15 @@ class SpreadsheetService:
             title: 工作表名稱
             range: 要更新的列索引(E.g. (row, col))
             value: 要更新的資料
+            buffered: 是否放入寫入緩衝區，與其他更新合併後批次寫入
         """
-        wks = self.sh.worksheet_by_title(title)
+        if buffered:
+            return self.write_buffer().update_cell_value(title, range, value)
+        wks = self.get_worksheet(title)
         wks.update_value(range, value)
-        
+        if range[0] == 1:
+            self._invalidate_headers(wks)
+
     def update_cells_values(self, title: str, range: str, values: list):
         """
         Summary:
@@ -50,9 +171,12 @@ class SpreadsheetService:
             range: 要更新的列索範圍(E.g. 'A1:B1')
             values: 要更新的資料(E.g. [['row1-1', 'row1-2']] 或 [['row1'], ['row2']])
         """
-        wks = self.sh.worksheet_by_title(title)
+        wks = self.get_worksheet(title)
         wks.update_values(range, values)
-    
+        start_row = re.search(r'\d+', range)
+        if start_row is None or int(start_row.group()) == 1:
+            self._invalidate_headers(wks)
+
     def delete_row_data(self, title, index):
         """
         Summary:
@@ -60,5 +184,337 @@ class SpreadsheetService:
         Args:
             title: 工作表名稱
         """
-        wks = self.sh.worksheet_by_title(title)
-        wks.delete_rows(index)
\ No newline at end of file
+        wks = self.get_worksheet(title)
+        wks.delete_rows(index)
+        if index == 1:
+            self._invalidate_headers(wks)
+
+
+class WorksheetSnapshot:
+    """
+    工作表快照\n
+    一次載入整張工作表並以欄為單位保存，對 key_columns 建立 hash 索引。\n
+    重新載入時先建立新的快照再整體替換，讀取端不會看到載入到一半的資料。
+    """
+    def __init__(self, loader, key_columns: tuple = (), refresh_interval: float = 0):
+        """
+        Args:
+            loader: 回傳工作表所有資料的函式（第一列為標題）
+            key_columns: 要建立索引的欄位名稱
+            refresh_interval: 背景自動重新載入的間隔秒數，0 代表不自動更新
+        """
+        self._loader = loader
+        self.key_columns = tuple(key_columns)
+        self.refresh_interval = refresh_interval
+        self._state = None
+        self._refresh_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self.refresh()
+        if refresh_interval:
+            threading.Thread(target=self._refresh_loop, name='worksheet-snapshot', daemon=True).start()
+
+    def refresh(self):
+        """重新載入工作表（同步）"""
+        with self._refresh_lock:
+            rows = self._loader()
+            self._state = self._build(rows)
+
+    def refresh_async(self):
+        """在背景重新載入工作表，載入完成前仍使用目前的快照"""
+        threading.Thread(target=self.refresh, name='worksheet-snapshot-refresh', daemon=True).start()
+
+    def stop(self):
+        """停止背景自動更新"""
+        self._stop_event.set()
+
+    @property
+    def headers(self) -> list:
+        return list(self._state['headers'])
+
+    @property
+    def loaded_at(self) -> float:
+        return self._state['loaded_at']
+
+    def __len__(self):
+        return self._state['row_count']
+
+    def column(self, column: str) -> tuple:
+        """Returns
+        tuple: 欄位所有值（不含標題）
+        """
+        return self._state['columns'][column]
+
+    def find(self, column: str, value):
+        """Returns
+        dict: 第一筆 column 等於 value 的資料，找不到時為 None
+        """
+        state = self._state
+        positions = self._positions(state, column, value)
+        return self._row(state, positions[0]) if positions else None
+
+    def find_all(self, column: str, value) -> list:
+        """Returns
+        list[dict]: 所有 column 等於 value 的資料
+        """
+        state = self._state
+        return [self._row(state, position) for position in self._positions(state, column, value)]
+
+    def find_row_index(self, column: str, value):
+        """Returns
+        int: value 在工作表中的 row index（與 SpreadsheetService.get_row_index 相同，含標題列），找不到時為 None
+        """
+        positions = self._positions(self._state, column, value)
+        return positions[0] + 2 if positions else None
+
+    def records(self) -> list:
+        """Returns
+        list[dict]: 所有資料（同 get_all_records）
+        """
+        state = self._state
+        return [self._row(state, position) for position in range(state['row_count'])]
+
+    def _refresh_loop(self):
+        while not self._stop_event.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception('Failed to refresh worksheet snapshot')
+
+    def _build(self, rows: list) -> dict:
+        headers = list(rows[0]) if rows else []
+        data_rows = rows[1:]
+        columns = {}
+        for column_index, header in enumerate(headers):
+            if header in columns:
+                continue
+            columns[header] = tuple(
+                row[column_index] if column_index < len(row) else '' for row in data_rows
+            )
+        indexes = {}
+        for column in self.key_columns:
+            index = {}
+            for position, value in enumerate(columns.get(column, ())):
+                index.setdefault(value, []).append(position)
+            indexes[column] = index
+        return {
+            'headers': tuple(columns),
+            'columns': columns,
+            'indexes': indexes,
+            'row_count': len(data_rows),
+            'loaded_at': time.time()
+        }
+
+    @staticmethod
+    def _positions(state: dict, column: str, value) -> list:
+        index = state['indexes'].get(column)
+        if index is not None:
+            return index.get(value, [])
+        # 未建立索引的欄位以線性搜尋處理
+        return [position for position, cell in enumerate(state['columns'][column]) if cell == value]
+
+    @staticmethod
+    def _row(state: dict, position: int) -> dict:
+        return {header: state['columns'][header][position] for header in state['headers']}
+
+
+class SpreadsheetWriteBuffer:
+    """
+    工作表寫入緩衝區\n
+    收集各工作表的儲存格更新，將相鄰儲存格合併為範圍後以單一 batch request 寫入。\n
+    達到 max_pending 筆時通知背景執行緒寫入，另外每 flush_interval 秒自動寫入，程式結束時也會寫入剩餘資料。\n
+    配額限制（429）、5xx 與連線錯誤的資料會放回緩衝區；其他 4xx（範圍錯誤、工作表已刪除、受保護的儲存格等）
+    會逐一範圍重試，仍失敗的範圍捨棄並計入 dropped，不會影響其他資料。
+    """
+    def __init__(self, service: SpreadsheetService, max_pending: int = 100, flush_interval: float = 5,
+                 max_retries: int = 5):
+        """
+        Args:
+            service: SpreadsheetService
+            max_pending: 累積多少筆儲存格更新時通知背景執行緒寫入
+            flush_interval: 背景定時寫入的間隔秒數，0 代表只在達到 max_pending 時寫入
+            max_retries: 遇到配額限制（429）或暫時性錯誤時的重試次數
+        """
+        self.service = service
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._counters = {'cells': 0, 'flushes': 0, 'ranges': 0, 'retries': 0, 'failures': 0, 'dropped': 0}
+        threading.Thread(target=self._flush_loop, name='spreadsheet-write-buffer', daemon=True).start()
+        atexit.register(self.close)
+
+    def update_cell_value(self, title: str, range: tuple, value):
+        """
+        Summary:
+            將儲存格更新放入緩衝區（同一儲存格以最後一次的值為準）
+        Args:
+            title: 工作表名稱
+            range: 儲存格位置(E.g. (row, col))
+            value: 要更新的資料
+        """
+        with self._lock:
+            self._pending.setdefault(title, {})[tuple(range)] = value
+            self._counters['cells'] += 1
+            should_flush = self._pending_count() >= self.max_pending
+        if should_flush:
+            # 由背景執行緒寫入，不佔用呼叫端（例如 webhook）的執行緒
+            self._wake_event.set()
+
+    def flush(self) -> int:
+        """
+        Summary:
+            立即寫入緩衝區內所有更新\n
+            可重試的錯誤會將資料放回緩衝區並拋出例外；無法寫入的範圍會被捨棄並記錄
+        Returns:
+            int: 寫入的範圍數
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            blocks = self._build_ranges(pending)
+            try:
+                self._send([entry for _, _, entry in blocks])
+                written = blocks
+            except Exception as e:
+                with self._lock:
+                    self._counters['failures'] += 1
+                if self._is_retryable(e):
+                    self._requeue(pending)
+                    raise
+                # 4xx：可能只有部分範圍有問題，逐一範圍寫入
+                written = self._send_individually(blocks)
+            with self._lock:
+                self._counters['flushes'] += 1
+                self._counters['ranges'] += len(written)
+            for title in {title for title, cells, _ in written if any(row == 1 for row, _ in cells)}:
+                self.service._invalidate_headers(self.service.get_worksheet(title))
+            return len(written)
+
+    def _send_individually(self, blocks: list) -> list:
+        written = []
+        retryable_error = None
+        for title, cells, entry in blocks:
+            try:
+                self._send([entry])
+                written.append((title, cells, entry))
+            except Exception as e:
+                if self._is_retryable(e):
+                    retryable_error = e
+                    self._requeue({title: cells})
+                else:
+                    with self._lock:
+                        self._counters['dropped'] += len(cells)
+                    logger.error('Dropped spreadsheet write to %s: %s', entry['dataFilter']['a1Range'], e)
+        if retryable_error is not None:
+            raise retryable_error
+        return written
+
+    def _requeue(self, pending: dict):
+        with self._lock:
+            for title, cells in pending.items():
+                current = self._pending.setdefault(title, {})
+                for cell, value in cells.items():
+                    # 寫入失敗期間若有新的值則保留新的值
+                    current.setdefault(cell, value)
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        """配額限制（429）、5xx 與連線等非 HTTP 錯誤可重試，其他 4xx 不可重試"""
+        if isinstance(error, HttpError):
+            status = int(error.resp.status)
+            return status == 429 or status >= 500
+        return True
+
+    def close(self):
+        """停止定時寫入並寫入剩餘資料"""
+        self._stop_event.set()
+        self._wake_event.set()
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Failed to flush spreadsheet write buffer')
+
+    def stats(self) -> dict:
+        """Returns
+        dict: 待寫入筆數與寫入統計
+        """
+        with self._lock:
+            return {'pending': self._pending_count(), **self._counters}
+
+    def _pending_count(self) -> int:
+        return sum(len(cells) for cells in self._pending.values())
+
+    def _flush_loop(self):
+        while not self._stop_event.is_set():
+            self._wake_event.wait(self.flush_interval or None)
+            self._wake_event.clear()
+            if self._stop_event.is_set():
+                return
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed to flush spreadsheet write buffer')
+
+    @staticmethod
+    def _build_ranges(pending: dict) -> list:
+        """
+        將儲存格合併為矩形範圍：同列連續欄位合併為一段，相鄰列的相同欄位段再合併\n
+        回傳 [(工作表名稱, 範圍內的儲存格, batch update 的資料), ...]
+        """
+        data = []
+        for title, cells in pending.items():
+            sheet = "'" + title.replace("'", "''") + "'"
+            rows = {}
+            for (row, col), value in cells.items():
+                rows.setdefault(row, {})[col] = value
+            segments = []
+            for row, columns in rows.items():
+                cols = sorted(columns)
+                start = cols[0]
+                for previous, col in zip(cols, cols[1:] + [None]):
+                    if col != previous + 1:
+                        segments.append((start, previous, row, [columns[c] for c in range(start, previous + 1)]))
+                        start = col
+            segments.sort(key=lambda segment: (segment[0], segment[1], segment[2]))
+            blocks = []
+            for start_col, end_col, row, values in segments:
+                last = blocks[-1] if blocks else None
+                if last and last['cols'] == (start_col, end_col) and last['end_row'] + 1 == row:
+                    last['end_row'] = row
+                    last['values'].append(values)
+                else:
+                    blocks.append({'cols': (start_col, end_col), 'start_row': row, 'end_row': row, 'values': [values]})
+            for block in blocks:
+                start = format_addr((block['start_row'], block['cols'][0]), 'label')
+                end = format_addr((block['end_row'], block['cols'][1]), 'label')
+                block_cells = {
+                    (row, col): cells[(row, col)]
+                    for row in range(block['start_row'], block['end_row'] + 1)
+                    for col in range(block['cols'][0], block['cols'][1] + 1)
+                }
+                data.append((title, block_cells, {
+                    'dataFilter': {'a1Range': f'{sheet}!{start}:{end}'},
+                    'values': block['values'],
+                    'majorDimension': 'ROWS'
+                }))
+        return data
+
+    def _send(self, data: list):
+        """以單一 batch request 寫入，遇到 429 / 5xx 時以指數退避重試"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.service.gc.sheet.values_batch_update_by_data_filter(self.service.sh.id, data, parse=True)
+                return
+            except HttpError as e:
+                status = int(e.resp.status)
+                if attempt == self.max_retries or (status != 429 and status < 500):
+                    raise
+                with self._lock:
+                    self._counters['retries'] += 1
+                time.sleep(min(64, 2 ** attempt) + random.uniform(0, 1))
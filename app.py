@@ -3,11 +3,16 @@ from linebot_app import linebot_app
 from liff_app import liff_app
 from admin_app import admin_app
 from config import get_config
+from api.linebot_helper import FlexMessageHelper
+from map import DatabaseCollectionMap
+import multiprocessing
+import os
 
 config = get_config()
 firebaseservice = config.firebaseService
 
 app = Flask(__name__)
+app.logger.info("Startup timings: " + config.startup_report())
 app.register_blueprint(linebot_app)
 app.register_blueprint(liff_app, url_prefix='/liff')
 app.register_blueprint(admin_app, url_prefix='/admin')
@@ -20,5 +25,72 @@ def index():
 def forbidden_page():
     return render_template('http/forbidden.html')
 
+def _read_shared_collections():
+    """讀取 fork 前預先載入的集合：{集合: [(文件 ID, 文件內容, update_time)]}"""
+    service = config.firebaseService.get()
+    return {
+        collection: [(doc.id, doc.to_dict() or {}, str(doc.update_time)) for doc in service.db.collection(collection).stream()]
+        for collection in (DatabaseCollectionMap.FEATURE, DatabaseCollectionMap.LINE_FLEX)
+    }
+
+def _send_from_child(target, connection):
+    try:
+        connection.send((True, target()))
+    except Exception as e:
+        connection.send((False, f"{type(e).__name__}: {str(e)}"))
+    finally:
+        connection.close()
+        # 不執行繼承自 master 的 atexit 與 finally（例如 gunicorn 的清理）
+        os._exit(0)
+
+def _run_in_child(target, timeout: float = 30):
+    """
+    Summary:
+        在 fork 出的子行程中執行 target 並取回結果\n
+        gRPC / HTTP client 只在子行程中建立，master 行程不會留下 fork 後無法使用的連線
+    Raises:
+        RuntimeError: 子行程執行失敗或逾時
+    """
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_send_from_child, args=(target, sender), daemon=True)
+    process.start()
+    sender.close()
+    try:
+        if not receiver.poll(timeout):
+            raise RuntimeError(f"Timed out after {timeout}s")
+        succeeded, result = receiver.recv()
+    except EOFError:
+        raise RuntimeError(f"Child process exited with code {process.exitcode}")
+    finally:
+        receiver.close()
+        process.join(1)
+        if process.is_alive():
+            process.kill()
+    if not succeeded:
+        raise RuntimeError(result)
+    return result
+
+def preload():
+    """
+    預先載入唯讀的共用資料：編譯所有 Jinja 模板、建立功能路由、編譯 line_flex 集合的 Flex 模板\n
+    pre-fork 伺服器在 fork 前呼叫，worker 以 copy-on-write 共用這些記憶體；
+    Firestore 資料在子行程中讀取，master 行程不建立網路 client
+    """
+    for template in app.jinja_env.list_templates():
+        try:
+            app.jinja_env.get_template(template)
+        except Exception as e:
+            app.logger.warning(f"Failed to preload template {template}: {str(e)}")
+    try:
+        collections = _run_in_child(_read_shared_collections)
+        config.feature_registry.seed(
+            [{'_id': doc_id, **doc} for doc_id, doc, _ in collections[DatabaseCollectionMap.FEATURE]]
+        )
+        FlexMessageHelper.preload_templates(collections[DatabaseCollectionMap.LINE_FLEX])
+    except Exception as e:
+        # 無法預先載入時 worker 第一次使用時再載入
+        app.logger.warning(f"Failed to preload Firestore data: {str(e)}")
+
 if __name__ == "__main__":
     app.run()
\ No newline at end of file
@@ -0,0 +1,187 @@
+"""
+非同步（ASGI）入口
+
+    uvicorn asgi_app:app --workers 4
+
+/callback 以 asyncio 處理：驗證簽章後立即回應 200，事件以 task 並行處理（同一使用者依序），
+LINE API 使用 AsyncMessagingApi、功能以 execute_message_async / execute_postback_async 執行；
+其他路由（LIFF、Admin）交由原本的 Flask app 處理。
+"""
+from asgiref.wsgi import WsgiToAsgi
+from app import app as flask_app
+from config import get_config
+from features.base import feature_factory
+from api.async_linebot_helper import AsyncLineBotHelper, async_line_api_client
+from utils.error_handler import handle_exception_async
+from utils.event_handler import EventHandler
+from utils.metrics import register_metrics
+from utils.webhook import get_event_key
+from linebot.v3.exceptions import InvalidSignatureError
+from linebot.v3.webhooks import (
+    MessageEvent,
+    PostbackEvent,
+    FollowEvent,
+    UnfollowEvent,
+    TextMessageContent
+)
+import asyncio
+import logging
+
+config = get_config()
+line_handler = config.handler
+logger = logging.getLogger(__name__)
+wsgi_app = WsgiToAsgi(flask_app)
+
+class AsyncEventDispatcher:
+    """
+    非同步事件分派器\n
+    每個事件一個 task；同一使用者以 asyncio.Lock 依序處理，全域並行數以 Semaphore 限制。
+    """
+    def __init__(self, max_concurrency: int = 1000):
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._locks = {}
+        self._tasks = set()
+        self._counters = {'dispatched': 0, 'processed': 0, 'failed': 0}
+
+    def dispatch(self, events: list):
+        """依 payload 順序為每個事件建立 task（不等待完成）"""
+        for event in events:
+            task = asyncio.create_task(self._run(event))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            self._counters['dispatched'] += 1
+
+    async def drain(self):
+        """等待所有處理中的事件完成"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        """Returns
+        dict: 處理中的事件數與處理計數
+        """
+        return {
+            'max_concurrency': self.max_concurrency,
+            'in_flight': len(self._tasks),
+            'active_users': len(self._locks),
+            **self._counters
+        }
+
+    async def _run(self, event):
+        key = get_event_key(event)
+        # 先取得使用者的鎖再佔用全域名額，避免排隊中的同一使用者事件佔住名額
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._semaphore:
+                    await handle_event(event)
+            self._counters['processed'] += 1
+        except Exception:
+            self._counters['failed'] += 1
+            logger.exception('Failed to process webhook event')
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                self._locks.pop(key, None)
+
+dispatcher = AsyncEventDispatcher(config.ASYNC_MAX_CONCURRENCY)
+register_metrics('async_dispatcher', dispatcher.stats)
+
+async def app(scope, receive, send):
+    """ASGI application"""
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] == 'http' and scope['path'] == '/callback' and scope['method'] == 'POST':
+        return await callback(scope, receive, send)
+    return await wsgi_app(scope, receive, send)
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # 在 event loop 外載入功能設定（同時建立 Firebase），處理訊息時不會阻塞
+            await asyncio.to_thread(config.feature_registry.load)
+            if config.firebaseService.initialized:
+                # 非同步 Firestore client 需在 event loop 中建立，共用已建立的 Firebase app
+                config.asyncFirebaseService.get()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await dispatcher.drain()
+            await async_line_api_client.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def callback(scope, receive, send):
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    headers = dict(scope['headers'])
+    signature = headers.get(b'x-line-signature', b'').decode()
+    try:
+        payload = line_handler.parser.parse(body.decode('utf-8'), signature, as_payload=True)
+    except InvalidSignatureError:
+        logger.info("Invalid signature. Please check your channel access token/channel secret.")
+        return await respond(send, 400, b'Bad Request')
+    dispatcher.dispatch(payload.events)
+    await respond(send, 200, b'OK')
+
+async def respond(send, status: int, body: bytes):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'text/plain; charset=utf-8')]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+async def report_exception(e, event):
+    """非同步的共用錯誤處理（管理員查詢與訊息皆不阻塞 event loop）"""
+    await handle_exception_async(e, admin_notification=True, event=event, logger=logger)
+
+async def handle_event(event):
+    if isinstance(event, MessageEvent):
+        if isinstance(event.message, TextMessageContent):
+            await handle_message(event)
+    elif isinstance(event, PostbackEvent):
+        await handle_postback(event)
+    elif isinstance(event, FollowEvent):
+        await handle_follow(event)
+    elif isinstance(event, UnfollowEvent):
+        await handle_unfollow(event)
+
+async def handle_follow(event):
+    try:
+        await AsyncLineBotHelper.reply_message(event, EventHandler.follow(event))
+    except Exception as e:
+        await report_exception(e, event)
+
+async def handle_unfollow(event):
+    try:
+        EventHandler.unfollow(event)
+    except Exception as e:
+        await report_exception(e, event)
+
+async def handle_message(event):
+    try:
+        feature, status_messages = EventHandler.route_message(event)
+        if status_messages:
+            return await AsyncLineBotHelper.reply_message(event, status_messages)
+        if feature:
+            with EventHandler.track(event, feature):
+                await feature_factory.execute_message_async(feature, event, request=None)
+    except Exception as e:
+        await report_exception(e, event)
+
+async def handle_postback(event):
+    try:
+        params = EventHandler.parse_postback(event)
+        if params is None:
+            return
+        with EventHandler.track(event, params.get('task')):
+            await feature_factory.dispatch_postback_async(event, params)
+    except Exception as e:
+        await report_exception(e, event)
@@ -0,0 +1,86 @@
+"""
+Flex 模板產生 carousel 的 micro-benchmark
+
+    python benchmarks/flex_template_bench.py [items] [repeat]
+
+比較原本每個 item 都 json.dumps → replace_variable → json.loads 的做法，
+與預先編譯的 FlexTemplate（每次編譯 / 重複使用快取的編譯結果）。
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.utils import replace_variable
+from utils.flex_template import FlexTemplate
+
+BUBBLE = {
+    "type": "bubble",
+    "hero": {"type": "image", "url": "{{image_url}}", "size": "full", "aspectRatio": "20:13", "aspectMode": "cover"},
+    "body": {
+        "type": "box",
+        "layout": "vertical",
+        "contents": [
+            {"type": "text", "text": "{{title}}", "weight": "bold", "size": "xl"},
+            {"type": "text", "text": "價格：{{price}} 元", "size": "sm", "color": "#999999"},
+            {
+                "type": "box",
+                "layout": "vertical",
+                "margin": "lg",
+                "contents": [
+                    {"type": "text", "text": "{{description}}", "wrap": True, "size": "sm"},
+                    {"type": "text", "text": "地點：{{place}}", "wrap": True, "size": "sm"}
+                ]
+            }
+        ]
+    },
+    "footer": {
+        "type": "box",
+        "layout": "vertical",
+        "contents": [
+            {"type": "button", "style": "link", "action": {"type": "postback", "label": "詳細資訊", "data": "task=detail&id={{id}}"}},
+            {"type": "button", "style": "link", "action": {"type": "uri", "label": "網站", "uri": "{{url}}"}}
+        ]
+    }
+}
+TEMPLATE = {"type": "carousel", "contents": [BUBBLE]}
+
+def legacy(items):
+    """原本的做法：每個 item 都序列化、正規表示式替換、再解析"""
+    bubbles = []
+    for item in items:
+        new_bubble = TEMPLATE['contents'][0].copy()
+        new_bubble = replace_variable(json.dumps(new_bubble), item)
+        bubbles.append(json.loads(new_bubble))
+    return {**TEMPLATE, 'contents': bubbles}
+
+def compiled(items):
+    return FlexTemplate(TEMPLATE).render_carousel(items)
+
+CACHED = FlexTemplate(TEMPLATE)
+
+def cached(items):
+    return CACHED.render_carousel(items)
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    items = [
+        {
+            'id': i, 'title': f'商品 {i}', 'price': i * 10, 'description': '說明文字',
+            'place': '台北', 'image_url': f'https://example.com/{i}.png', 'url': f'https://example.com/{i}'
+        }
+        for i in range(count)
+    ]
+    assert legacy(items) == compiled(items) == cached(items)
+    print(f"{count} items x {repeat} runs")
+    baseline = None
+    for name, func in (('legacy', legacy), ('compiled', compiled), ('cached', cached)):
+        seconds = min(timeit.repeat(lambda: func(items), number=repeat, repeat=3))
+        baseline = baseline or seconds
+        print(f"{name:>9}: {seconds / repeat * 1e6:9.1f} us/carousel  ({baseline / seconds:.1f}x)")
+
+if __name__ == '__main__':
+    main()
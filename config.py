@@ -6,11 +6,19 @@ from linebot.v3 import (
 from linebot.v3.messaging import (
     Configuration
 )
+from contextlib import contextmanager
 import json
+import threading
+import time
 import pygsheets
 from api.spreadsheet import SpreadsheetService
 from api.firebase import FireBaseService
-from map import FeatureStatus
+from api.async_firebase import AsyncFireBaseService
+from api.line_client import LineApiClient
+from utils.metrics import register_metrics
+from utils.rate_limiter import RateLimiter
+from api.feature_registry import FeatureRegistry
+from map import Map, FeatureStatus
 
 class Singleton(type):
     _instances = {}
@@ -20,12 +28,86 @@ class Singleton(type):
             cls._instances[cls] = super(Singleton, cls).__call__(*args, **kwargs)
         return cls._instances[cls]
     
+class LazyService:
+    """
+    延遲初始化的服務代理\n
+    第一次存取屬性時才建立實體（執行緒安全），也可以用 warm_up 在背景預先建立。
+    """
+    def __init__(self, name, factory, timings):
+        self._name = name
+        self._factory = factory
+        self._timings = timings
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """取得服務實體（尚未建立時建立）"""
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    started = time.perf_counter()
+                    self._instance = self._factory()
+                    self._timings[self._name] = round(time.perf_counter() - started, 3)
+                instance = self._instance
+        return instance
+
+    @property
+    def initialized(self):
+        return self._instance is not None
+
+    def reset(self):
+        """捨棄目前的實體，下次使用時重新建立（實體有 close 方法時會先呼叫）"""
+        with self._lock:
+            instance, self._instance = self._instance, None
+        if instance is not None and hasattr(instance, 'close'):
+            instance.close()
+
+    def warm_up(self):
+        """在背景執行緒建立服務實體"""
+        def run():
+            try:
+                self.get()
+            except Exception as e:
+                # 背景預熱失敗時，第一次使用會再嘗試初始化並拋出錯誤
+                print(f"Failed to warm up {self._name}: {str(e)}")
+        thread = threading.Thread(target=run, name=f'warm-up-{self._name}', daemon=True)
+        thread.start()
+        return thread
+
+    def __getattr__(self, name):
+        # 私有與特殊屬性（例如 ABCMeta 檢查的 __isabstractmethod__、copy / pickle 的 __deepcopy__）不代理，
+        # 避免只是檢查屬性就建立服務
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
+
+    def __repr__(self):
+        return f"<LazyService {self._name} initialized={self.initialized}>"
+
 class Config(metaclass=Singleton):
     def __init__(self):
-        self._load_environment_variables()
-        self._check_required_env_vars()
-        self._initialize_line_bot()
+        # 啟動各階段耗時（秒），服務延遲初始化的耗時會在建立時補上
+        self.startup_timings = {}
+        with self._timed('environment'):
+            self._load_environment_variables()
+            self._check_required_env_vars()
+            self._load_tuning_variables()
+        with self._timed('line_bot'):
+            self._initialize_line_bot()
+        self._initialize_services()
         self._initialize_features()
+        register_metrics('startup', lambda: dict(self.startup_timings))
+        if self.SERVICE_WARMUP:
+            self.warm_up()
+
+    @contextmanager
+    def _timed(self, phase):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.startup_timings[phase] = round(time.perf_counter() - started, 3)
 
     def _load_environment_variables(self):
         """ 載入環境變數 """
@@ -53,18 +135,155 @@ class Config(metaclass=Singleton):
             print(f"Please set the following environment variables: {', '.join(missing_vars)}")
             sys.exit(1)
 
+    def _load_tuning_variables(self):
+        """載入效能調整參數（皆為選填，未設定時使用預設值）"""
+        # Webhook 處理模式：sync 為同步處理；parallel 為同步但不同使用者的事件並行處理；
+        # queue 為驗證簽章後放入佇列，立即回應 200
+        self.WEBHOOK_MODE = os.getenv('WEBHOOK_MODE', 'sync').lower()
+        self.WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', 4))
+        self.WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', 1000))
+        self.WEBHOOK_MAX_CONCURRENCY = int(os.getenv('WEBHOOK_MAX_CONCURRENCY', 8))
+        self.WEBHOOK_PER_USER_CONCURRENCY = int(os.getenv('WEBHOOK_PER_USER_CONCURRENCY', 1))
+        # 非同步模式（asgi_app）同時處理的事件上限
+        self.ASYNC_MAX_CONCURRENCY = int(os.getenv('ASYNC_MAX_CONCURRENCY', 1000))
+        # LINE Messaging API 共用連線池
+        self.LINE_API_POOL_SIZE = int(os.getenv('LINE_API_POOL_SIZE', 10))
+        self.LINE_API_CONNECT_TIMEOUT = float(os.getenv('LINE_API_CONNECT_TIMEOUT', 3))
+        self.LINE_API_READ_TIMEOUT = float(os.getenv('LINE_API_READ_TIMEOUT', 10))
+        # 回覆訊息時每次都呼叫 LINE validate API（預設只驗證新的模板形狀）
+        self.LINE_VALIDATE_STRICT = os.getenv('LINE_VALIDATE_STRICT', 'false').lower() == 'true'
+        # LINE API 外呼限流（每秒請求數，行程內共用；reply 優先並可使用全域保留量）
+        self.LINE_RATE_LIMIT_ENABLED = os.getenv('LINE_RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+        self.LINE_RATE_LIMIT_GLOBAL = float(os.getenv('LINE_RATE_LIMIT_GLOBAL', 1000))
+        self.LINE_RATE_LIMIT_REPLY = float(os.getenv('LINE_RATE_LIMIT_REPLY', 1000))
+        self.LINE_RATE_LIMIT_PUSH = float(os.getenv('LINE_RATE_LIMIT_PUSH', 200))
+        self.LINE_RATE_LIMIT_LOADING = float(os.getenv('LINE_RATE_LIMIT_LOADING', 100))
+        self.LINE_RATE_LIMIT_PROFILE = float(os.getenv('LINE_RATE_LIMIT_PROFILE', 500))
+        self.LINE_RATE_LIMIT_DEFAULT = float(os.getenv('LINE_RATE_LIMIT_DEFAULT', 100))
+        # 取得額度的最長等待秒數（reply token 有效期限較長，可以等待較久）
+        self.LINE_RATE_LIMIT_MAX_WAIT = float(os.getenv('LINE_RATE_LIMIT_MAX_WAIT', 5))
+        self.LINE_RATE_LIMIT_REPLY_MAX_WAIT = float(os.getenv('LINE_RATE_LIMIT_REPLY_MAX_WAIT', 20))
+        # 圖文選單圖片的本機快取目錄（可在多個環境間共用）
+        self.RICH_MENU_IMAGE_CACHE_DIR = os.getenv(
+            'RICH_MENU_IMAGE_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'line-bot-template', 'rich_menu_images')
+        )
+        # 圖文選單大量連結 / 刪除時同時送出的請求數
+        self.RICH_MENU_MAX_WORKERS = int(os.getenv('RICH_MENU_MAX_WORKERS', 4))
+        # 使用者個人資料快取（封鎖 / 未加好友的使用者以 PROFILE_NEGATIVE_TTL 快取）
+        self.PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', 10000))
+        self.PROFILE_CACHE_TTL = float(os.getenv('PROFILE_CACHE_TTL', 3600))
+        self.PROFILE_NEGATIVE_TTL = float(os.getenv('PROFILE_NEGATIVE_TTL', 300))
+        # 多人推播：同時送出的段數（每段最多 500 人）與每秒送出段數上限（0 為不限制）
+        self.MULTICAST_MAX_WORKERS = int(os.getenv('MULTICAST_MAX_WORKERS', 4))
+        self.MULTICAST_CHUNKS_PER_SECOND = float(os.getenv('MULTICAST_CHUNKS_PER_SECOND', 0))
+        self.MULTICAST_MAX_RETRIES = int(os.getenv('MULTICAST_MAX_RETRIES', 5))
+        # 載入動畫：超過門檻仍未回覆才送出（門檻依各功能的平均處理時間調整）
+        self.LOADING_ANIMATION_DELAY = float(os.getenv('LOADING_ANIMATION_DELAY', 0.5))
+        self.LOADING_ANIMATION_MAX_DELAY = float(os.getenv('LOADING_ANIMATION_MAX_DELAY', 1.5))
+        self.LOADING_ANIMATION_SECONDS = int(os.getenv('LOADING_ANIMATION_SECONDS', 10))
+        # Firestore 讀取快取（以逗號分隔的集合名稱，未設定則不啟用）
+        self.FIRESTORE_CACHE_COLLECTIONS = [
+            collection.strip() for collection in os.getenv('FIRESTORE_CACHE_COLLECTIONS', '').split(',') if collection.strip()
+        ]
+        self.FIRESTORE_CACHE_SIZE = int(os.getenv('FIRESTORE_CACHE_SIZE', 1024))
+        self.FIRESTORE_CACHE_TTL = float(os.getenv('FIRESTORE_CACHE_TTL', 300))
+        # Google Sheets 寫入緩衝區
+        self.SHEETS_WRITE_BUFFER_SIZE = int(os.getenv('SHEETS_WRITE_BUFFER_SIZE', 100))
+        self.SHEETS_WRITE_FLUSH_INTERVAL = float(os.getenv('SHEETS_WRITE_FLUSH_INTERVAL', 5))
+        # 啟動時在背景同時初始化 Google Sheets 與 Firebase（false 則於第一次使用時才初始化）
+        self.SERVICE_WARMUP = os.getenv('SERVICE_WARMUP', 'true').lower() == 'true'
+
     def _initialize_line_bot(self):
         """初始化LINE Bot相關物件"""
         self.handler = WebhookHandler(self.CHANNEL_SECRET)
         self.configuration = Configuration(access_token=self.CHANNEL_ACCESS_TOKEN)
-        self.spreadsheetService = SpreadsheetService(pygsheets.authorize(service_account_env_var='GDRIVE_API_CREDENTIALS'), self.SPREADSHEET_URL)
-        self.firebaseService = FireBaseService(json.loads(self.FIREBASE_CREDENTIALS))
+        self.line_rate_limiter = None
+        if self.LINE_RATE_LIMIT_ENABLED:
+            self.line_rate_limiter = RateLimiter(
+                {
+                    'reply': self.LINE_RATE_LIMIT_REPLY,
+                    'push': self.LINE_RATE_LIMIT_PUSH,
+                    'loading': self.LINE_RATE_LIMIT_LOADING,
+                    'profile': self.LINE_RATE_LIMIT_PROFILE,
+                    'default': self.LINE_RATE_LIMIT_DEFAULT
+                },
+                global_rate=self.LINE_RATE_LIMIT_GLOBAL,
+                max_wait={'reply': self.LINE_RATE_LIMIT_REPLY_MAX_WAIT},
+                default_max_wait=self.LINE_RATE_LIMIT_MAX_WAIT
+            )
+            register_metrics('line_rate_limiter', self.line_rate_limiter.stats)
+        self.line_api_client = LineApiClient(
+            self.configuration,
+            pool_size=self.LINE_API_POOL_SIZE,
+            timeout=(self.LINE_API_CONNECT_TIMEOUT, self.LINE_API_READ_TIMEOUT),
+            rate_limiter=self.line_rate_limiter
+        )
+
+    def _initialize_services(self):
+        """建立 Google Sheets 與 Firebase 的延遲初始化代理"""
+        self.spreadsheetService = LazyService('spreadsheet', self._create_spreadsheet_service, self.startup_timings)
+        self.firebaseService = LazyService('firebase', self._create_firebase_service, self.startup_timings)
+        # 非同步模式（asgi_app）使用，與 firebaseService 共用 Firebase app
+        self.asyncFirebaseService = LazyService(
+            'firebase_async', lambda: AsyncFireBaseService(self.firebaseService.app), self.startup_timings
+        )
+
+    def _create_spreadsheet_service(self):
+        return SpreadsheetService(
+            pygsheets.authorize(service_account_env_var='GDRIVE_API_CREDENTIALS'),
+            self.SPREADSHEET_URL,
+            self.SHEETS_WRITE_BUFFER_SIZE,
+            self.SHEETS_WRITE_FLUSH_INTERVAL
+        )
+
+    def _create_firebase_service(self):
+        firebase_service = FireBaseService(json.loads(self.FIREBASE_CREDENTIALS))
+        for collection in self.FIRESTORE_CACHE_COLLECTIONS:
+            firebase_service.enable_cache(collection, self.FIRESTORE_CACHE_SIZE, self.FIRESTORE_CACHE_TTL)
+        return firebase_service
+
+    def warm_up(self):
+        """在背景同時初始化所有延遲服務，回傳執行緒列表"""
+        threads = [service.warm_up() for service in (self.spreadsheetService, self.firebaseService)]
+        # 預先載入功能設定，第一則訊息不需要等待 Firestore
+        thread = threading.Thread(target=self.feature_registry.load, name='warm-up-feature-registry', daemon=True)
+        thread.start()
+        return threads + [thread]
+
+    def network_services(self):
+        """Returns
+        tuple: 使用網路連線的延遲服務（依重新建立時關閉的順序）
+        """
+        return (self.spreadsheetService, self.asyncFirebaseService, self.firebaseService)
+
+    def reset_clients(self):
+        """重新建立所有網路 client\n
+        gRPC / HTTP 連線無法在 fork 後沿用，pre-fork 伺服器需在每個 worker fork 後呼叫
+        """
+        self.line_api_client.reset()
+        for service in self.network_services():
+            service.reset()
+
+    def startup_report(self):
+        """Returns
+        str: 啟動各階段耗時
+        """
+        return ', '.join(f"{phase}={seconds:.3f}s" for phase, seconds in self.startup_timings.items())
     
     def _initialize_features(self):
-        """初始化功能狀態"""
+        """初始化功能狀態
+
+        feature 為程式內建的預設狀態，feature 集合中的設定會透過 feature_registry 即時覆蓋
+        """
         self.feature = {
             
         }
+        self.feature_registry = FeatureRegistry(
+            self.firebaseService,
+            static_status=self.feature,
+            static_keywords=Map.FEATURE
+        )
+        register_metrics('feature_registry', self.feature_registry.stats)
 
 config = Config()
 
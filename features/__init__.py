@@ -1,3 +1,3 @@
-from .base import FeatureFactory
+from .base import FeatureFactory, FeatureLifecycle, postback_action
 
-__all__ = ['FeatureFactory']
\ No newline at end of file
+__all__ = ['FeatureFactory', 'FeatureLifecycle', 'postback_action']
@@ -1,11 +1,21 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Type, Optional
+import asyncio
+import inspect
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from enum import Enum
+from typing import Any, Dict, Type, Optional
+from urllib.parse import unquote
 from config import Config, get_config
 from api.firebase import FireBaseService
+from api.async_firebase import AsyncFireBaseService
+from utils.metrics import register_metrics
 
 class Feature(ABC):
     config: Config = get_config()
     firebaseService: FireBaseService = config.firebaseService
+    # 非同步模式覆寫 execute_*_async 時使用，Firestore 查詢不阻塞 event loop
+    asyncFirebaseService: AsyncFireBaseService = config.asyncFirebaseService
 
     @abstractmethod
     def execute_message(self, event, **kwargs):
@@ -15,25 +25,311 @@ class Feature(ABC):
     def execute_postback(self, event, **kwargs):
         pass
 
+    async def execute_message_async(self, event, **kwargs):
+        """非同步模式（asgi_app）使用，預設在執行緒中執行 execute_message，原生 async 的功能可覆寫"""
+        return await asyncio.to_thread(self.execute_message, event, **kwargs)
+
+    async def execute_postback_async(self, event, **kwargs):
+        """非同步模式（asgi_app）使用，預設在執行緒中執行 execute_postback，原生 async 的功能可覆寫"""
+        return await asyncio.to_thread(self.execute_postback, event, **kwargs)
+
+class FeatureLifecycle(Enum):
+    """
+    功能實體的生命週期
+    """
+    # 每個事件建立新實體
+    TRANSIENT = 1
+    # 整個行程共用一個實體
+    SINGLETON = 2
+    # 實體用完後放回 pool 重複使用，同一實體同時只處理一個事件
+    POOLED = 3
+
+def postback_action(name: str, schema: Dict[str, Any] = None):
+    """
+    Summary:
+        將 Feature 的方法註冊為 postback action 的處理函式，呼叫方式為 method(event, params=params)
+    Args:
+        name: action 名稱（postback data 中的 action 參數）
+        schema: 參數名稱對應的型別（str / int / float / bool 或轉換函式），或 (型別, 預設值)
+    Example:
+        @postback_action('page', schema={'page': (int, 1)})
+        def show_page(self, event, params): ...
+    """
+    def decorator(method):
+        method._postback_action = (name, compile_schema(schema or {}))
+        return method
+    return decorator
+
+def _to_bool(value: str) -> bool:
+    lowered = value.strip().lower()
+    if lowered in ('1', 'true', 'yes', 'on'):
+        return True
+    if lowered in ('0', 'false', 'no', 'off', ''):
+        return False
+    raise ValueError(f"Invalid boolean value: {value}")
+
+def compile_schema(schema: Dict[str, Any]) -> tuple:
+    """將參數 schema 轉換為 ((名稱, 轉換函式, 預設值), ...)，未指定預設值時為 None"""
+    compiled = []
+    for key, spec in schema.items():
+        converter, default = spec if isinstance(spec, tuple) else (spec, None)
+        compiled.append((key, _to_bool if converter is bool else converter, default))
+    return tuple(compiled)
+
+def apply_schema(schema: tuple, params: dict) -> dict:
+    """
+    Summary:
+        依 schema 轉換參數型別，未列在 schema 的參數保留原本的字串
+    Raises:
+        ValueError: 參數無法轉換為指定型別
+    """
+    typed = dict(params)
+    for key, converter, default in schema:
+        value = params.get(key)
+        if value is None:
+            typed[key] = default
+            continue
+        try:
+            typed[key] = converter(value)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid postback parameter '{key}': {value!r}") from e
+    return typed
+
+def parse_postback_data(data: str, params: dict = None) -> dict:
+    """
+    Summary:
+        解析 postback data（query string 格式，值可包含 '=' 與 %XX 編碼字元）\n
+        '+' 保留為 '+'（不會像 parse_qsl 轉換為空白），需要空白時請使用 %20
+    Args:
+        data: event.postback.data
+        params: event.postback.params（日期時間選擇器等的結果）
+    Returns:
+        dict: 參數，同名參數以最後一個為準
+    """
+    parsed = dict(params or {})
+    if '=' in data:
+        for param in data.split('&'):
+            if param:
+                key, _, value = param.partition('=')
+                parsed[unquote(key)] = unquote(value)
+    return parsed
+
+class _FeatureEntry:
+    """單一功能的註冊資訊、實體與預先建立的 postback action 對應"""
+    def __init__(self, feature_class: Type[Feature], lifecycle: FeatureLifecycle, thread_safe: bool, pool_size: int):
+        self.feature_class = feature_class
+        self.lifecycle = lifecycle
+        self.thread_safe = thread_safe
+        self.pool_size = pool_size
+        self.created = 0
+        self._instance = None
+        self._pool = []
+        self._lock = threading.Lock()
+        # 非執行緒安全的 singleton 同時只允許一個事件使用；非同步模式另以 asyncio.Lock 依序排隊（FIFO）
+        self._call_lock = threading.Lock()
+        self._async_lock = asyncio.Lock()
+        # action -> (方法名稱, schema)
+        self.actions = {}
+        for attr_name, member in inspect.getmembers(feature_class, callable):
+            action = getattr(member, '_postback_action', None)
+            if action:
+                self.actions[action[0]] = (attr_name, action[1])
+
+    def _create(self) -> Feature:
+        self.created += 1
+        return self.feature_class()
+
+    def _checkout(self) -> Feature:
+        if self.lifecycle is FeatureLifecycle.TRANSIENT:
+            return self._create()
+        with self._lock:
+            if self.lifecycle is FeatureLifecycle.SINGLETON:
+                if self._instance is None:
+                    self._instance = self._create()
+                return self._instance
+            return self._pool.pop() if self._pool else self._create()
+
+    def _checkin(self, instance: Feature):
+        if self.lifecycle is FeatureLifecycle.POOLED:
+            with self._lock:
+                if len(self._pool) < self.pool_size:
+                    self._pool.append(instance)
+
+    @property
+    def _serialized(self) -> bool:
+        return self.lifecycle is FeatureLifecycle.SINGLETON and not self.thread_safe
+
+    @contextmanager
+    def acquire(self):
+        instance = self._checkout()
+        if self._serialized:
+            self._call_lock.acquire()
+        try:
+            yield instance
+        finally:
+            if self._serialized:
+                self._call_lock.release()
+            self._checkin(instance)
+
+    @asynccontextmanager
+    async def acquire_async(self):
+        if not self._serialized:
+            instance = self._checkout()
+            try:
+                yield instance
+            finally:
+                self._checkin(instance)
+            return
+        async with self._async_lock:
+            # 同步路徑（執行緒）正在使用時才在執行緒中等待，不佔住 event loop
+            if not self._call_lock.acquire(blocking=False):
+                waiter = asyncio.ensure_future(asyncio.to_thread(self._call_lock.acquire))
+                try:
+                    await asyncio.shield(waiter)
+                except asyncio.CancelledError:
+                    # 執行緒之後仍會取得鎖，取得後立即釋放，避免之後的呼叫永遠等待
+                    waiter.add_done_callback(lambda _: self._call_lock.release())
+                    raise
+            try:
+                yield self._checkout()
+            finally:
+                self._call_lock.release()
+
 class FeatureFactory:
     def __init__(self):
         self.feature_map: Dict[str, Type[Feature]] = {}
+        self._entries: Dict[str, _FeatureEntry] = {}
+        self._counters_lock = threading.Lock()
+        self._unknown_features: Dict[str, int] = {}
+        self._unknown_actions: Dict[str, int] = {}
 
-    def register(self, name: str, feature_class: Type[Feature]):
+    def register(self, name: str, feature_class: Type[Feature], lifecycle: FeatureLifecycle = FeatureLifecycle.TRANSIENT,
+                 thread_safe: bool = False, pool_size: int = 4):
+        """
+        Args:
+            name: 功能名稱（Map.FEATURE 的值或 postback 的 task）
+            feature_class: 功能類別
+            lifecycle: 實體生命週期
+            thread_safe: 實體是否可同時處理多個事件（非執行緒安全的 SINGLETON 會依序處理）
+            pool_size: POOLED 最多保留的閒置實體數
+        """
         self.feature_map[name] = feature_class
+        self._entries[name] = _FeatureEntry(feature_class, lifecycle, thread_safe, pool_size)
+
+    def _count(self, counters: Dict[str, int], key: str):
+        with self._counters_lock:
+            counters[key] = counters.get(key, 0) + 1
+
+    def _get_entry(self, feature_name: str) -> Optional[_FeatureEntry]:
+        entry = self._entries.get(feature_name)
+        if entry is None:
+            self._count(self._unknown_features, str(feature_name))
+        return entry
+
+    def has_feature(self, feature_name: str) -> bool:
+        """是否有註冊的功能（不計入找不到的功能次數）"""
+        return feature_name in self._entries
 
     def get_feature(self, feature_name: str) -> Optional[Feature]:
-        feature_class = self.feature_map.get(feature_name)
-        if feature_class:
-            return feature_class()
-        else:
-            print(f"找不到對應的功能: {feature_name}")
-            return None
+        """
+        Summary:
+            取得功能實體（依註冊的生命週期建立或共用）\n
+            POOLED 的實體不會放回 pool；處理事件請使用 execute_message / dispatch_postback
+        """
+        entry = self._get_entry(feature_name)
+        return entry._checkout() if entry else None
+
+    def execute_message(self, feature_name: str, event, **kwargs) -> bool:
+        """
+        Summary:
+            以功能處理訊息事件
+        Returns:
+            bool: 是否有對應的功能
+        """
+        entry = self._get_entry(feature_name)
+        if entry is None:
+            return False
+        with entry.acquire() as feature:
+            feature.execute_message(event, **kwargs)
+        return True
+
+    async def execute_message_async(self, feature_name: str, event, **kwargs) -> bool:
+        """execute_message 的非同步版本"""
+        entry = self._get_entry(feature_name)
+        if entry is None:
+            return False
+        async with entry.acquire_async() as feature:
+            await feature.execute_message_async(event, **kwargs)
+        return True
+
+    def _resolve_action(self, entry: _FeatureEntry, params: dict) -> tuple:
+        action = params.get('action')
+        if action is None:
+            return None, params
+        handler = entry.actions.get(action)
+        if handler is None:
+            self._count(self._unknown_actions, f"{params.get('task')}.{action}")
+            return None, params
+        return handler[0], apply_schema(handler[1], params)
+
+    def dispatch_postback(self, event, params: dict) -> bool:
+        """
+        Summary:
+            依 task 與 action 處理 postback 事件\n
+            有以 postback_action 註冊的 action 時呼叫該方法（參數依 schema 轉換型別），否則呼叫 execute_postback
+        Args:
+            params: parse_postback_data 解析後的參數
+        Returns:
+            bool: 是否有對應的功能
+        """
+        entry = self._get_entry(params.get('task'))
+        if entry is None:
+            return False
+        method_name, params = self._resolve_action(entry, params)
+        with entry.acquire() as feature:
+            if method_name:
+                getattr(feature, method_name)(event, params=params)
+            else:
+                feature.execute_postback(event, params=params)
+        return True
+
+    async def dispatch_postback_async(self, event, params: dict) -> bool:
+        """dispatch_postback 的非同步版本，一般方法在執行緒中執行，async 方法直接 await"""
+        entry = self._get_entry(params.get('task'))
+        if entry is None:
+            return False
+        method_name, params = self._resolve_action(entry, params)
+        async with entry.acquire_async() as feature:
+            if not method_name:
+                await feature.execute_postback_async(event, params=params)
+            else:
+                method = getattr(feature, method_name)
+                if inspect.iscoroutinefunction(method):
+                    await method(event, params=params)
+                else:
+                    await asyncio.to_thread(method, event, params=params)
+        return True
+
+    def stats(self) -> dict:
+        """Returns
+        dict: 各功能建立的實體數、找不到的功能（task）與 action 次數
+        """
+        with self._counters_lock:
+            return {
+                'features': {
+                    name: {'lifecycle': entry.lifecycle.name, 'created': entry.created, 'pooled': len(entry._pool)}
+                    for name, entry in self._entries.items()
+                },
+                'unknown_features': dict(self._unknown_features),
+                'unknown_actions': dict(self._unknown_actions)
+            }
 
 feature_factory = FeatureFactory()
+register_metrics('feature_factory', feature_factory.stats)
 
-def register_feature(name: str):
+def register_feature(name: str, lifecycle: FeatureLifecycle = FeatureLifecycle.TRANSIENT, thread_safe: bool = False,
+                     pool_size: int = 4):
     def decorator(cls):
-        feature_factory.register(name, cls)
+        feature_factory.register(name, cls, lifecycle, thread_safe, pool_size)
         return cls
     return decorator
@@ -0,0 +1,45 @@
+"""
+正式環境 Gunicorn 設定
+
+    gunicorn -c gunicorn.conf.py app:app
+
+preload_app 會在 master 行程載入應用程式與唯讀資料後再 fork，worker 以 copy-on-write 共用；
+Firebase / Google Sheets / LINE API 的連線則在每個 worker fork 後重新建立。
+"""
+import gc
+import multiprocessing
+import os
+
+# master 行程不初始化網路服務，避免 gRPC / HTTP 連線在 fork 後被多個 worker 共用
+# （worker 是否在背景初始化由 WORKER_SERVICE_WARMUP 決定）
+os.environ['SERVICE_WARMUP'] = 'false'
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 0))
+preload_app = True
+accesslog = '-'
+errorlog = '-'
+
+def when_ready(server):
+    """fork 前：載入共用的唯讀資料，並凍結 GC 追蹤的物件以減少 copy-on-write 複製"""
+    import app
+    from config import get_config
+    app.preload()
+    initialized = [repr(service) for service in get_config().network_services() if service.initialized]
+    assert not initialized, f"Network services must not be initialized before fork: {', '.join(initialized)}"
+    gc.freeze()
+
+def post_fork(server, worker):
+    """fork 後：在 worker 中重新建立網路 client，並依設定在背景初始化服務"""
+    from config import get_config
+    config = get_config()
+    config.reset_clients()
+    if os.getenv('WORKER_SERVICE_WARMUP', 'true').lower() == 'true':
+        config.warm_up()
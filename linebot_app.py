@@ -1,9 +1,12 @@
 from config import get_config
 from features.base import feature_factory
-from map import Map, FeatureStatus, Permission, DatabaseCollectionMap
+from map import Permission, DatabaseCollectionMap
 from api.linebot_helper import LineBotHelper
 from utils.error_handler import handle_exception
-from flask import Blueprint, request, abort, current_app
+from utils.event_handler import EventHandler
+from utils.metrics import register_metrics
+from utils.webhook import WebhookEventQueue, UserOrderedDispatcher
+from flask import Blueprint, request, abort, current_app, has_request_context
 from linebot.v3.exceptions import InvalidSignatureError
 from linebot.v3.webhooks import (
     MessageEvent,
@@ -12,7 +15,6 @@ from linebot.v3.webhooks import (
     UnfollowEvent,
     TextMessageContent
 )
-from linebot.v3.messaging import TextMessage
 
 linebot_app = Blueprint('linebot_app', __name__)
 
@@ -21,6 +23,20 @@ configuration = config.configuration
 line_handler = config.handler
 firebaseService = config.firebaseService
 
+# queue 模式：驗證簽章後放入背景佇列，立即回應 LINE 平台
+webhook_queue = None
+if config.WEBHOOK_MODE == 'queue':
+    webhook_queue = WebhookEventQueue(line_handler, config.WEBHOOK_WORKERS, config.WEBHOOK_QUEUE_SIZE)
+    register_metrics('webhook_queue', webhook_queue.stats)
+
+# parallel 模式：同一個 payload 中不同使用者的事件並行處理，同一使用者依序處理
+webhook_dispatcher = None
+if config.WEBHOOK_MODE == 'parallel':
+    webhook_dispatcher = UserOrderedDispatcher(
+        line_handler, config.WEBHOOK_MAX_CONCURRENCY, config.WEBHOOK_PER_USER_CONCURRENCY
+    )
+    register_metrics('webhook_dispatcher', webhook_dispatcher.stats)
+
 
 @linebot_app.route("/callback", methods=['POST'])
 def callback():
@@ -28,7 +44,15 @@ def callback():
     body = request.get_data(as_text=True)
     current_app.logger.info("Request body: " + body)
     try:
-        line_handler.handle(body, signature)
+        if webhook_queue:
+            webhook_queue.submit(body, signature, app=current_app._get_current_object())
+        elif webhook_dispatcher:
+            payload = line_handler.parser.parse(body, signature, as_payload=True)
+            webhook_dispatcher.dispatch(
+                payload.events, payload.destination, app=current_app._get_current_object()
+            )
+        else:
+            line_handler.handle(body, signature)
     except InvalidSignatureError:
         current_app.logger.info("Invalid signature. Please check your channel access token/channel secret.")
         abort(400)
@@ -37,58 +61,37 @@ def callback():
 @line_handler.add(FollowEvent)
 def handle_follow(event):
     try:
-        LineBotHelper.show_loading_animation_(event)
-
-        welcome_message = "歡迎使用本系統！"
-        messages = [
-            TextMessage(text=welcome_message)
-        ]
-        LineBotHelper.reply_message(event, messages)
+        LineBotHelper.reply_message(event, EventHandler.follow(event))
     except Exception as e:
         handle_exception(e, admin_notification=True, event=event)
 
 @line_handler.add(UnfollowEvent)
 def handle_unfollow(event):
     try:
-        pass
+        EventHandler.unfollow(event)
     except Exception as e:
         handle_exception(e, admin_notification=True, event=event)
 
 @line_handler.add(MessageEvent, message=TextMessageContent)
 def handle_message(event):
     try:
-        user_msg = event.message.text
-        feature = Map.FEATURE.get(user_msg)
-
+        feature, status_messages = EventHandler.route_message(event)
+        if status_messages:
+            return LineBotHelper.reply_message(event, status_messages)
         if feature:
-            LineBotHelper.show_loading_animation_(event)
-            feature_status = config.feature.get(feature)
-
-            match feature_status:
-                case FeatureStatus.DISABLE:
-                    return LineBotHelper.reply_message(event, [TextMessage(text='此功能尚未開放，敬請期待！')])
-                case FeatureStatus.MAINTENANCE:
-                    return LineBotHelper.reply_message(event, [TextMessage(text='此功能維護中，請見諒！')])
-            feature_instance = feature_factory.get_feature(feature)
-            if feature_instance:
-                feature_instance.execute_message(event, request=request)
-        
+            with EventHandler.track(event, feature):
+                # 背景 worker 中沒有 request context
+                feature_factory.execute_message(feature, event, request=request if has_request_context() else None)
     except Exception as e:
         handle_exception(e, admin_notification=True, event=event)
 
 @line_handler.add(PostbackEvent)
 def handle_postback(event):
     try:
-        postback_data = event.postback.data
-        if 'richmenu' in postback_data:
+        params = EventHandler.parse_postback(event)
+        if params is None:
             return
-        LineBotHelper.show_loading_animation_(event)
-        
-        params = event.postback.params or {}
-        if '=' in postback_data:
-            params.update(dict(param.split('=') for param in postback_data.split('&')))
-        feature_instance = feature_factory.get_feature(params.get('task'))
-        if feature_instance:
-            feature_instance.execute_postback(event, params=params)
+        with EventHandler.track(event, params.get('task')):
+            feature_factory.dispatch_postback(event, params)
     except Exception as e:
-        handle_exception(e, admin_notification=True, event=event)
\ No newline at end of file
+        handle_exception(e, admin_notification=True, event=event)
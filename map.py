@@ -53,4 +53,5 @@ class DatabaseCollectionMap:
     RICH_MENU = "rich_menu"
     LINE_FLEX = "line_flex"
     QUICK_REPLY = "quick_reply"
+    FEATURE = "feature"
     USER = "users"
\ No newline at end of file
@@ -0,0 +1,18 @@
+import os
+
+# config 在匯入時檢查必要的環境變數：測試使用假的值，且不在背景預先建立服務（不連線）
+TEST_ENV = {
+    'CHANNEL_SECRET': 'test',
+    'CHANNEL_ACCESS_TOKEN': 'test',
+    'GDRIVE_API_CREDENTIALS': 'test',
+    'SPREADSHEET_URL': 'test',
+    'FIREBASE_CREDENTIALS': 'test',
+    'LIFF_ID_COMPACT': 'test',
+    'LIFF_ID_TALL': 'test',
+    'LIFF_ID_FULL': 'test',
+    'LIFF_ID_ADMIN': 'test',
+    'SERVICE_WARMUP': 'false',
+}
+
+for name, value in TEST_ENV.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,69 @@
+from utils.cache import MISSING, TTLCache
+
+
+def test_invalidating_one_key_keeps_other_inflight_fills():
+    cache = TTLCache()
+    first, second = cache.generation('U1'), cache.generation('U2')
+    cache.delete('U1')
+
+    cache.set('U1', 'stale', generation=first)
+    cache.set('U2', 'fresh', generation=second)
+    assert cache.get('U1') is MISSING
+    assert cache.get('U2') == 'fresh'
+
+    # 失效後才開始的讀取可以寫入
+    cache.set('U1', 'new', generation=cache.generation('U1'))
+    assert cache.get('U1') == 'new'
+
+
+def test_delete_where_and_clear_reject_matching_fills():
+    cache = TTLCache()
+    doc, other = cache.generation(('doc', 'a')), cache.generation(('doc', 'b'))
+    cache.delete_where(lambda key: key[1] == 'a')
+    cache.set(('doc', 'a'), 1, generation=doc)
+    cache.set(('doc', 'b'), 2, generation=other)
+    assert cache.get(('doc', 'a')) is MISSING and cache.get(('doc', 'b')) == 2
+
+    generation = cache.generation(('doc', 'b'))
+    cache.clear()
+    cache.set(('doc', 'b'), 3, generation=generation)
+    assert cache.get(('doc', 'b')) is MISSING
+
+
+def test_invalidation_records_are_bounded():
+    cache = TTLCache(maxsize=2)
+    generation = cache.generation('old')
+    cache.delete('old')
+    for key in range(3):
+        cache.delete(key)
+    assert len(cache._invalidated) == 2
+    # 紀錄被移除後仍保守地拒絕較舊的讀取
+    cache.set('old', 'stale', generation=generation)
+    assert cache.get('old') is MISSING
+
+
+def test_lru_eviction_and_stats():
+    cache = TTLCache(maxsize=2, ttl=0)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+
+    assert cache.get('b') is MISSING
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    stats = cache.stats()
+    assert stats['size'] == 2 and stats['evictions'] == 1
+    assert stats['hits'] == 3 and stats['misses'] == 1
+
+
+def test_expired_items_are_removed(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('utils.cache.time.monotonic', lambda: now[0])
+    cache = TTLCache(ttl=10)
+    cache.set('a', 1)
+    cache.set('b', 2, ttl=60)
+
+    now[0] += 30
+    assert cache.get('a', None) is None
+    assert cache.get('b') == 2
+    assert cache.stats()['expirations'] == 1 and len(cache) == 1
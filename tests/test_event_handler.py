@@ -0,0 +1,129 @@
+import asyncio
+from contextlib import nullcontext
+from types import SimpleNamespace
+
+import pytest
+
+from api import async_linebot_helper, linebot_helper
+from api.async_linebot_helper import AsyncFlexMessageHelper, AsyncLineBotHelper
+from api.feature_registry import FeatureRegistry
+from api.linebot_helper import FlexMessageHelper
+from features.base import Feature, FeatureFactory
+from map import FeatureStatus
+from utils import error_handler, event_handler
+from utils.event_handler import EventHandler
+from utils.flex_template import FlexTemplateCache
+
+
+class Weather(Feature):
+    def execute_message(self, event, **kwargs):
+        pass
+
+    def execute_postback(self, event, **kwargs):
+        pass
+
+
+class Service:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def get_collection_data(self, collection):
+        return self.docs
+
+    def subscribe(self, collection, callback):
+        pass
+
+
+def message_event(text):
+    return SimpleNamespace(message=SimpleNamespace(text=text), reply_token='token', source=SimpleNamespace(user_id='U1'))
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    service = Service([
+        {'_id': 'weather', 'keywords': ['天氣'], 'status': 'ENABLE'},
+        {'_id': 'shop', 'keywords': ['商店'], 'status': 'MAINTENANCE'},
+        {'_id': 'game', 'keywords': ['遊戲'], 'status': FeatureStatus.DISABLE.value},
+    ])
+    registry = FeatureRegistry(SimpleNamespace(get=lambda: service))
+    monkeypatch.setattr(event_handler.config, 'feature_registry', registry)
+    return registry
+
+
+def test_route_message_returns_feature_or_status_reply(registry):
+    assert EventHandler.route_message(message_event('天氣')) == ('weather', None)
+    assert EventHandler.route_message(message_event('沒有這個功能')) == (None, None)
+
+    feature, messages = EventHandler.route_message(message_event('商店'))
+    assert feature == 'shop' and messages[0].text == EventHandler.STATUS_MESSAGES[FeatureStatus.MAINTENANCE]
+    feature, messages = EventHandler.route_message(message_event('遊戲'))
+    assert feature == 'game' and messages[0].text == EventHandler.STATUS_MESSAGES[FeatureStatus.DISABLE]
+
+
+def test_parse_postback_skips_rich_menu_switches():
+    postback = lambda data: SimpleNamespace(postback=SimpleNamespace(data=data, params=None))
+    assert EventHandler.parse_postback(postback('richmenu=next')) is None
+    assert EventHandler.parse_postback(postback('task=weather&city=a+b')) == {'task': 'weather', 'city': 'a+b'}
+
+
+def test_track_only_registered_features(monkeypatch):
+    factory = FeatureFactory()
+    factory.register('weather', Weather)
+    monkeypatch.setattr(event_handler, 'feature_factory', factory)
+    tracked = []
+    monkeypatch.setattr(event_handler.loading_indicator, 'track',
+                        lambda event, feature: tracked.append(feature) or nullcontext())
+
+    with EventHandler.track(message_event('x'), 'weather'):
+        pass
+    with EventHandler.track(message_event('x'), 'random-task'):
+        pass
+    assert tracked == ['weather']
+
+
+def test_async_error_handler_uses_async_firestore(monkeypatch):
+    queries, pushes, replies = [], [], []
+
+    class AsyncService:
+        async def filter_data(self, collection, conditions):
+            queries.append((collection, conditions))
+            return [{'userId': 'admin'}]
+
+    async def push_message(user_id, messages):
+        pushes.append(user_id)
+
+    async def reply_message(event, messages):
+        replies.append(messages[0].text)
+
+    monkeypatch.setattr(error_handler.config, 'asyncFirebaseService', AsyncService())
+    monkeypatch.setattr(AsyncLineBotHelper, 'push_message', push_message)
+    monkeypatch.setattr(AsyncLineBotHelper, 'reply_message', reply_message)
+
+    asyncio.run(error_handler.handle_exception_async(RuntimeError('boom'), admin_notification=True,
+                                                     event=message_event('x'), logger=SimpleNamespace(error=lambda message: None)))
+    assert queries == [('users', error_handler.ADMIN_CONDITIONS)]
+    assert pushes == ['admin']
+    assert replies == [error_handler.USER_ERROR_MESSAGE]
+
+
+def test_async_flex_helper_loads_with_async_firestore_once(monkeypatch):
+    loads = []
+
+    class AsyncService:
+        async def get_data(self, collection, doc_id):
+            loads.append(doc_id)
+            return {'type': 'carousel', 'contents': [{'type': 'bubble', 'body': {'type': 'text', 'text': '{{name}}'}}]}
+
+    monkeypatch.setattr(linebot_helper, 'flex_templates', FlexTemplateCache())
+    monkeypatch.setattr(FlexMessageHelper, 'watching', staticmethod(lambda: True))
+    monkeypatch.setattr(async_linebot_helper.config, 'asyncFirebaseService', AsyncService())
+
+    async def run():
+        first = await AsyncFlexMessageHelper.create_carousel_from_template('card', [{'name': 'A'}, {'name': 'B'}])
+        second = await AsyncFlexMessageHelper.create_carousel_from_template('card', [{'name': 'C'}])
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert [bubble['body']['text'] for bubble in first['contents']] == ['A', 'B']
+    assert [bubble['body']['text'] for bubble in second['contents']] == ['C']
+    assert loads == ['card']
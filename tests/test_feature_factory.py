@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from features.base import (Feature, FeatureFactory, FeatureLifecycle, apply_schema, compile_schema,
+                           parse_postback_data, postback_action)
+
+
+class Order(Feature):
+    def __init__(self):
+        self.calls = []
+
+    def execute_message(self, event, **kwargs):
+        self.calls.append(('message', event))
+
+    def execute_postback(self, event, **kwargs):
+        self.calls.append(('postback', kwargs['params']))
+
+    @postback_action('view', schema={'page': (int, 1), 'detail': bool})
+    def view(self, event, params):
+        self.calls.append(('view', params))
+
+
+def test_import_does_not_initialize_firebase():
+    # conftest 設定假的憑證，匯入 features.base 不能建立 Firebase
+    assert not Feature.firebaseService.initialized
+
+
+def test_apply_schema_converts_and_applies_defaults():
+    schema = compile_schema({'page': (int, 1), 'detail': bool, 'ratio': float})
+    typed = apply_schema(schema, {'detail': 'yes', 'ratio': '0.5', 'extra': 'x'})
+    assert typed == {'page': 1, 'detail': True, 'ratio': 0.5, 'extra': 'x'}
+
+
+@pytest.mark.parametrize('params', [{'page': 'abc'}, {'detail': 'maybe'}])
+def test_apply_schema_rejects_invalid_values(params):
+    schema = compile_schema({'page': int, 'detail': bool})
+    with pytest.raises(ValueError):
+        apply_schema(schema, params)
+
+
+def test_parse_postback_data_keeps_plus_and_equals():
+    params = parse_postback_data('task=order&q=a+b%20c&token=x=y', {'date': '2024-01-01'})
+    assert params == {'date': '2024-01-01', 'task': 'order', 'q': 'a+b c', 'token': 'x=y'}
+
+
+def test_dispatch_postback_routes_action_with_typed_params():
+    factory = FeatureFactory()
+    factory.register('order', Order, FeatureLifecycle.SINGLETON)
+    assert factory.dispatch_postback('event', parse_postback_data('task=order&action=view&page=2'))
+    assert factory.get_feature('order').calls == [
+        ('view', {'task': 'order', 'action': 'view', 'page': 2, 'detail': None})
+    ]
+
+
+def test_unknown_task_and_action_are_counted():
+    factory = FeatureFactory()
+    factory.register('order', Order, FeatureLifecycle.SINGLETON)
+    assert not factory.dispatch_postback('event', {'task': 'missing'})
+    assert factory.dispatch_postback('event', {'task': 'order', 'action': 'delete'})
+
+    stats = factory.stats()
+    assert stats['unknown_features'] == {'missing': 1}
+    assert stats['unknown_actions'] == {'order.delete': 1}
+    # 未註冊的 action 改由 execute_postback 處理
+    assert factory.get_feature('order').calls == [('postback', {'task': 'order', 'action': 'delete'})]
+
+
+def test_has_feature_does_not_count_unknown_features():
+    factory = FeatureFactory()
+    factory.register('order', Order)
+    assert factory.has_feature('order')
+    assert not factory.has_feature('missing')
+    assert factory.stats()['unknown_features'] == {}
+
+
+def test_pooled_instances_are_checked_in_and_reused():
+    factory = FeatureFactory()
+    factory.register('order', Order, FeatureLifecycle.POOLED, pool_size=1)
+    factory.execute_message('order', 'first')
+    factory.execute_message('order', 'second')
+
+    stats = factory.stats()['features']['order']
+    assert stats == {'lifecycle': 'POOLED', 'created': 1, 'pooled': 1}
+
+
+def test_serialized_singleton_async_dispatch():
+    factory = FeatureFactory()
+    factory.register('order', Order, FeatureLifecycle.SINGLETON)
+
+    async def run():
+        await asyncio.gather(*(
+            factory.dispatch_postback_async(f'event-{i}', {'task': 'order', 'action': 'view', 'page': str(i)})
+            for i in range(5)
+        ))
+
+    asyncio.run(run())
+    feature = factory.get_feature('order')
+    assert sorted(params['page'] for _, params in feature.calls) == [0, 1, 2, 3, 4]
+    assert factory.stats()['features']['order']['created'] == 1
+
+
+def test_cancelled_async_wait_releases_singleton_lock():
+    factory = FeatureFactory()
+    factory.register('order', Order, FeatureLifecycle.SINGLETON)
+    entry = factory._entries['order']
+
+    async def run():
+        # 同步路徑（執行緒）正在使用 singleton 時取消等待中的非同步呼叫
+        entry._call_lock.acquire()
+        waiting = asyncio.ensure_future(factory.dispatch_postback_async('event', {'task': 'order'}))
+        await asyncio.sleep(0.05)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        entry._call_lock.release()
+        await asyncio.wait_for(factory.dispatch_postback_async('event', {'task': 'order'}), timeout=2)
+
+    asyncio.run(run())
+    assert factory.get_feature('order').calls == [('postback', {'task': 'order'})]
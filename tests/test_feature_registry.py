@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+
+from api.feature_registry import FeatureRegistry
+from map import FeatureStatus
+
+
+class Service:
+    def __init__(self, docs):
+        self.docs = docs
+        self.loads = 0
+        self.callback = None
+
+    def get_collection_data(self, collection):
+        self.loads += 1
+        if isinstance(self.docs, Exception):
+            raise self.docs
+        return self.docs
+
+    def subscribe(self, collection, callback):
+        self.callback = callback
+
+
+def change(kind, doc_id, data=None):
+    return SimpleNamespace(type=SimpleNamespace(name=kind),
+                           document=SimpleNamespace(id=doc_id, to_dict=lambda: data))
+
+
+def test_changes_swap_in_a_new_snapshot():
+    service = Service([{'_id': 'weather', 'keywords': ['天氣'], 'status': 'ENABLE'}])
+    registry = FeatureRegistry(SimpleNamespace(get=lambda: service), static_status={'shop': FeatureStatus.ENABLE})
+    assert registry.route('天氣') == ('weather', FeatureStatus.ENABLE)
+    before = registry._snapshot
+
+    service.callback([change('MODIFIED', 'weather', {'keywords': ['天氣'], 'status': 2}),
+                      change('ADDED', 'shop', {'keywords': ['商店'], 'status': 'DISABLE'})])
+    assert registry.route('天氣') == ('weather', FeatureStatus.MAINTENANCE)
+    assert registry.route('商店') == ('shop', FeatureStatus.DISABLE)
+    # 處理中的訊息持有的舊快照不受影響
+    assert before[1].match('商店') is None and before[0]['weather'] == FeatureStatus.ENABLE
+
+    service.callback([change('REMOVED', 'weather')])
+    assert registry.route('天氣') == (None, None)
+    assert service.loads == 1
+
+
+def test_load_failure_keeps_static_settings_until_retry(monkeypatch):
+    service = Service(RuntimeError('unavailable'))
+    registry = FeatureRegistry(SimpleNamespace(get=lambda: service), static_status={'shop': FeatureStatus.ENABLE},
+                               static_keywords={'商店': 'shop'})
+    assert registry.route('商店') == ('shop', FeatureStatus.ENABLE)
+    assert registry.status('shop') == FeatureStatus.ENABLE
+    assert service.loads == 1 and registry.stats()['load_errors'] == 1
+
+    service.docs = [{'_id': 'shop', 'status': 'MAINTENANCE'}]
+    monkeypatch.setattr(registry, '_retry_at', 0)
+    assert registry.status('shop') == FeatureStatus.MAINTENANCE
+    assert service.loads == 2
+
+
+def test_invalid_status_is_ignored():
+    service = Service([{'_id': 'shop', 'status': 'UNKNOWN'}, {'_id': 'game', 'status': '9'}])
+    registry = FeatureRegistry(SimpleNamespace(get=lambda: service), static_status={'shop': FeatureStatus.DISABLE})
+    assert registry.status('shop') == FeatureStatus.DISABLE
+    assert registry.status('game') is None
@@ -0,0 +1,56 @@
+from utils.feature_router import FeatureRouter, build_feature_router
+
+
+def test_exact_match_beats_prefix_and_pattern():
+    router = FeatureRouter(
+        exact={'天氣': 'exact'},
+        prefixes={'天': 'prefix'},
+        patterns=[('天.*', 'pattern')]
+    )
+    assert router.match('天氣') == 'exact'
+
+
+def test_longest_prefix_beats_shorter_prefix_and_pattern():
+    router = FeatureRouter(
+        prefixes={'/w': 'short', '/wiki': 'long'},
+        patterns=[('/wiki .*', 'pattern')]
+    )
+    assert router.match('/wiki python') == 'long'
+    assert router.match('/weather') == 'short'
+
+
+def test_patterns_are_full_match_in_order():
+    router = FeatureRouter(patterns=[(r'\d+d\d+', 'dice'), (r'\d+.*', 'number')])
+    assert router.match('2d6') == 'dice'
+    assert router.match('2 apples') == 'number'
+    assert router.match('roll 2d6') is None
+
+
+def test_numbered_backreference_is_not_renumbered():
+    router = FeatureRouter(patterns=[('hello', 'a'), (r'(\w)\1', 'b')])
+    assert router.match('xx') == 'b'
+    assert router.match('hello') == 'a'
+    assert router.match('xy') is None
+
+
+def test_named_backreference_and_duplicate_group_names():
+    router = FeatureRouter(patterns=[(r'(?P<c>\w)(?P=c)', 'double'), (r'(?P<c>\d+)!', 'bang')])
+    assert router.match('aa') == 'double'
+    assert router.match('12!') == 'bang'
+
+
+def test_invalid_pattern_is_skipped():
+    router = FeatureRouter(patterns=[('x(', 'broken'), ('ok', 'fine')])
+    assert router.match('ok') == 'fine'
+
+
+def test_build_feature_router_overrides_static_keywords():
+    router = build_feature_router(
+        [{'_id': 'weather', 'keywords': ['天氣'], 'aliases': ['weather'], 'prefixes': ['天氣 ']}],
+        {'天氣': 'legacy', '選單': 'menu'}
+    )
+    assert router.match('天氣') == 'weather'
+    assert router.match('weather') == 'weather'
+    assert router.match('天氣 台北') == 'weather'
+    assert router.match('選單') == 'menu'
+    assert router.match('其他') is None
@@ -0,0 +1,97 @@
+import json
+import threading
+
+import pytest
+
+from utils.flex_template import FlexTemplate, FlexTemplateCache
+from utils.utils import compile_template, replace_variable
+
+CAROUSEL = {
+    'type': 'carousel',
+    'altText': '{{title}}',
+    'contents': [{
+        'type': 'bubble',
+        'hero': {'type': 'image', 'url': 'https://example.com/{{image}}.png', 'size': 'full'},
+        'body': {'type': 'box', 'layout': 'vertical', 'spacing': 'md', 'contents': [
+            {'type': 'text', 'text': '{{name}}', 'weight': 'bold', 'wrap': True},
+            {'type': 'text', 'text': '{{price}} 元 / {{name}}', 'flex': 0},
+            {'type': 'text', 'text': '{{missing}}'},
+        ]},
+        '{{key}}': 'value',
+    }, {'type': 'bubble', 'body': {'type': 'text', 'text': 'ignored {{name}}'}}],
+}
+
+
+def test_replace_variable_keeps_unknown_variables_and_limits_count():
+    assert replace_variable('{{a}}-{{b}}-{{a}}', {'a': 1}) == '1-{{b}}-1'
+    assert replace_variable('{{a}}-{{a}}-{{a}}', {'a': 'x'}, max_count=2) == 'x-x-{{a}}'
+    assert replace_variable('no variables', {'a': 1}) == 'no variables'
+    template = compile_template('Hi {{name}}!')
+    assert template.variables == {'name'} and compile_template('Hi {{name}}!') is template
+
+
+@pytest.mark.parametrize('variables', [
+    {'title': '熱門商品', 'image': 'cake', 'name': '蛋糕', 'price': 120, 'key': 'extra'},
+    {'name': 'only name'},
+    {},
+])
+def test_render_matches_text_replacement(variables):
+    """編譯後的模板與原本以 json.dumps + replace_variable + json.loads 的結果相同"""
+    expected = json.loads(replace_variable(json.dumps(CAROUSEL, ensure_ascii=False), variables))
+    assert FlexTemplate(CAROUSEL).render(variables) == expected
+
+
+def test_render_carousel_uses_first_bubble_and_returns_new_objects():
+    template = FlexTemplate(CAROUSEL)
+    items = [{'name': 'A', 'price': 1}, {'name': 'B', 'price': 2}]
+    first = template.render_carousel(items)
+    bubble = json.dumps(CAROUSEL['contents'][0], ensure_ascii=False)
+    assert first['contents'] == [json.loads(replace_variable(bubble, item)) for item in items]
+    assert first['altText'] == '{{title}}'
+
+    first['contents'][0]['body']['contents'].append('mutated')
+    assert len(template.render_carousel(items)['contents'][0]['body']['contents']) == 3
+    assert template.variables == {'title', 'image', 'name', 'price', 'missing', 'key'}
+    with pytest.raises(ValueError):
+        FlexTemplate({'type': 'bubble'}).render_carousel(items)
+
+
+def test_cache_recompiles_only_when_version_changes():
+    cache = FlexTemplateCache(maxsize=2)
+    loads = []
+
+    def loader(text):
+        return lambda: loads.append(text) or {'type': 'text', 'text': text}
+
+    first = cache.get('card', 1, loader('v1'))
+    assert cache.get('card', 1, loader('unused')) is first
+    assert cache.get('card', 2, loader('v2')).render({}) == {'type': 'text', 'text': 'v2'}
+    assert cache.peek('card', 1) is None and cache.peek('card', 2) is not None
+
+    cache.get(('menu', 'header'), None, loader('header'))
+    cache.get('other', None, loader('other'))
+    assert cache.peek('card', 2) is None
+    assert loads == ['v1', 'v2', 'header', 'other']
+
+    cache.invalidate('menu')
+    assert cache.peek(('menu', 'header')) is None
+    cache.retain(['missing'])
+    assert cache.stats()['size'] == 0
+
+
+def test_cache_does_not_store_template_loaded_before_invalidation():
+    cache = FlexTemplateCache()
+    loading, release = threading.Event(), threading.Event()
+
+    def loader():
+        loading.set()
+        release.wait(1)
+        return {'type': 'text', 'text': 'old'}
+
+    worker = threading.Thread(target=cache.get, args=('card', None, loader))
+    worker.start()
+    loading.wait(1)
+    cache.invalidate('card')
+    release.set()
+    worker.join()
+    assert cache.peek('card') is None
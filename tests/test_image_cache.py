@@ -0,0 +1,92 @@
+import struct
+
+import pytest
+
+from api import image_cache
+from api.image_cache import PNG_SIGNATURE, ImageCache, read_image_info, validate_rich_menu_image
+
+
+def png(width, height):
+    return PNG_SIGNATURE + b'\0\0\0\rIHDR' + struct.pack('>II', width, height) + b'\x08\x06\0\0\0'
+
+
+def jpeg(width, height):
+    app0 = b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\0' + b'\0' * 9
+    sof = b'\xff\xc0' + struct.pack('>HBHH', 17, 8, height, width) + b'\0' * 10
+    return b'\xff\xd8' + app0 + sof + b'\xff\xd9'
+
+
+def test_reads_png_and_jpeg_headers():
+    assert read_image_info(png(2500, 1686)) == ('image/png', 2500, 1686)
+    assert read_image_info(jpeg(1200, 405)) == ('image/jpeg', 1200, 405)
+
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'GIF89a' + b'\0' * 20,
+    PNG_SIGNATURE + b'\0\0\0\rIHDR\0\0',
+    jpeg(1200, 405)[:25],
+    jpeg(1200, 405)[:28],
+    b'\xff\xd8\xff\xe0\0\x01' + b'\0' * 10,
+])
+def test_unsupported_or_truncated_images_raise_value_error(data):
+    with pytest.raises(ValueError):
+        read_image_info(data)
+
+
+class Response:
+    def __init__(self, status_code, body=b'', headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start:start + chunk_size]
+
+
+@pytest.fixture
+def server(monkeypatch):
+    requests, responses = [], []
+
+    def get(url, headers=None, **kwargs):
+        requests.append(headers)
+        return responses.pop(0)
+
+    monkeypatch.setattr(image_cache.requests, 'get', get)
+    return requests, responses
+
+
+def test_revalidates_with_etag_and_uses_cached_object_on_304(tmp_path, server):
+    requests, responses = server
+    cache = ImageCache(str(tmp_path))
+    body = png(2500, 843)
+    responses += [Response(200, body, {'ETag': '"v1"', 'Last-Modified': 'Mon, 01 Jan 2024 00:00:00 GMT'}),
+                  Response(304)]
+
+    first = cache.fetch('https://example.com/menu.png')
+    second = cache.fetch('https://example.com/menu.png')
+
+    assert requests[0] == {}
+    assert requests[1] == {'If-None-Match': '"v1"', 'If-Modified-Since': 'Mon, 01 Jan 2024 00:00:00 GMT'}
+    assert second.sha256 == first.sha256 and second.read() == body
+    assert cache.stats()['downloads'] == 1 and cache.stats()['revalidated'] == 1
+    validate_rich_menu_image(second, {'width': 2500, 'height': 843})
+
+
+def test_rejects_oversized_and_failed_downloads(tmp_path, server):
+    _, responses = server
+    cache = ImageCache(str(tmp_path), max_bytes=10)
+    responses += [Response(200, png(2500, 843)), Response(404)]
+
+    with pytest.raises(ValueError, match='exceeds'):
+        cache.fetch('https://example.com/large.png')
+    with pytest.raises(ValueError, match='HTTP 404'):
+        cache.fetch('https://example.com/missing.png')
+    assert not list((tmp_path / 'objects').iterdir())
@@ -0,0 +1,63 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from api.loading_indicator import LoadingIndicator
+
+
+def event(user_id, reply_token):
+    return SimpleNamespace(source=SimpleNamespace(user_id=user_id), reply_token=reply_token)
+
+
+class Recorder:
+    def __init__(self):
+        self.sent = []
+        self.called = threading.Event()
+
+    def __call__(self, user_id, seconds):
+        self.sent.append((user_id, seconds))
+        self.called.set()
+
+
+def test_fast_replies_do_not_show_loading_animation():
+    send = Recorder()
+    indicator = LoadingIndicator(send, delay=0.05)
+    with indicator.track(event('U1', 't1'), 'fast'):
+        pass
+    time.sleep(0.1)
+    assert send.sent == []
+    assert indicator.stats()['cancelled'] == 1
+
+
+def test_slow_events_show_one_animation_per_user():
+    send = Recorder()
+    indicator = LoadingIndicator(send, delay=0.02, loading_seconds=5)
+    first, second = event('U1', 't1'), event('U1', 't2')
+    indicator.start(first, 'slow')
+    indicator.start(second, 'slow')
+    assert send.called.wait(1)
+    time.sleep(0.05)
+    indicator.finish(first)
+    indicator.finish(second)
+
+    assert send.sent == [('U1', 5)]
+    stats = indicator.stats()
+    assert stats['deduplicated'] == 1 and stats['inflight'] == 0
+
+
+def test_threshold_follows_feature_latency():
+    indicator = LoadingIndicator(lambda user_id, seconds: None, delay=0.5, max_delay=1.5, alpha=0.5)
+    assert indicator.threshold('feature') == 0.5
+    indicator._latency['feature'] = 0.6
+    assert indicator.threshold('feature') == pytest.approx(0.9)
+    # 已知很慢的功能立即送出
+    indicator._latency['feature'] = 2
+    assert indicator.threshold('feature') == 0
+
+
+def test_events_without_reply_token_are_ignored():
+    indicator = LoadingIndicator(lambda user_id, seconds: None)
+    indicator.start(event('U1', None))
+    assert indicator.stats()['tracked'] == 0
@@ -0,0 +1,98 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+from linebot.v3.messaging import ApiException, TextMessage
+
+from api import multicast
+from api.multicast import MulticastError, MulticastFanout
+
+
+def api_error(status, headers=None):
+    error = ApiException(status=status, reason='error')
+    error.headers = headers or {}
+    return error
+
+
+class MessagingApi:
+    """依 (段落第一位收件者) 回傳預先設定的結果，記錄每次請求的收件者與 retry key"""
+    def __init__(self, outcomes=None):
+        self.outcomes = outcomes or {}
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def multicast_with_http_info(self, request, x_line_retry_key=None):
+        with self._lock:
+            self.calls.append((list(request.to), x_line_retry_key))
+            outcomes = self.outcomes.get(request.to[0])
+            outcome = outcomes.pop(0) if outcomes else None
+        if isinstance(outcome, Exception):
+            raise outcome
+        return SimpleNamespace(headers={'x-line-request-id': f'req-{request.to[0]}'})
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(multicast.time, 'sleep', lambda seconds: None)
+
+
+def send(api, recipients, **kwargs):
+    fanout = MulticastFanout(lambda: api, max_workers=2, max_retries=kwargs.pop('max_retries', 2))
+    return fanout.send(recipients, [TextMessage(text='hi')], **kwargs)
+
+
+def test_recipients_are_deduplicated_and_chunked_in_order():
+    api = MessagingApi()
+    reports = send(api, ['U1', {'userId': 'U2'}, {'_id': 'U1'}, 'U3', 'U4', 'U5'], chunk_size=2)
+
+    assert [report['recipients'] for report in reports] == [2, 2, 1]
+    assert sorted(call[0] for call in api.calls) == [['U1', 'U2'], ['U3', 'U4'], ['U5']]
+    assert all(report['status'] == 'sent' for report in reports)
+    assert reports[1]['request_id'] == 'req-U3'
+
+
+def test_retries_reuse_the_retry_key_and_409_counts_as_sent():
+    api = MessagingApi({'U1': [api_error(429, {'Retry-After': '1'}), api_error(500),
+                               api_error(409, {'x-line-accepted-request-id': 'accepted'})]})
+    [report] = send(api, ['U1'])
+
+    assert report['status'] == 'sent' and report['attempts'] == 3
+    assert report['request_id'] == 'accepted'
+    assert len({retry_key for _, retry_key in api.calls}) == 1
+
+
+def test_client_errors_are_not_retried():
+    api = MessagingApi({'U1': [api_error(400)]})
+    [report] = send(api, ['U1'])
+
+    assert len(api.calls) == 1
+    assert report['status'] == 'failed' and not report['retryable']
+    assert report['user_ids'] == ['U1']
+
+
+def test_partial_retryable_failure_raises_with_failed_recipients():
+    api = MessagingApi({'U3': [api_error(429)] * 3})
+    reports = send(api, ['U1', 'U2', 'U3'], chunk_size=2)
+
+    assert MulticastError.should_raise(reports)
+    error = MulticastError(reports)
+    assert [report['user_ids'] for report in error.failed] == [['U3']]
+    assert error.retryable
+    assert '1/2 chunks (1 recipients)' in str(error)
+    assert not MulticastError.should_raise([reports[0]])
+
+
+def test_multicast_message_raises_when_any_chunk_fails(monkeypatch):
+    from api import linebot_helper
+
+    reports = [
+        {'chunk': 0, 'recipients': 1, 'status': 'sent', 'retryable': True, 'error': None},
+        {'chunk': 1, 'recipients': 1, 'status': 'failed', 'retryable': True, 'error': '429', 'user_ids': ['U2']},
+    ]
+    monkeypatch.setattr(linebot_helper.multicast_fanout, 'send', lambda user_ids, messages: reports)
+    with pytest.raises(MulticastError) as raised:
+        linebot_helper.LineBotHelper.multicast_message(['U1', 'U2'], [TextMessage(text='hi')])
+    assert raised.value.reports is reports
+
+    monkeypatch.setattr(linebot_helper.multicast_fanout, 'send', lambda user_ids, messages: reports[:1])
+    assert linebot_helper.LineBotHelper.multicast_message(['U1'], [TextMessage(text='hi')]) == reports[:1]
@@ -0,0 +1,104 @@
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import app
+from api import linebot_helper
+from api.feature_registry import FeatureRegistry
+from api.linebot_helper import FlexMessageHelper
+from map import DatabaseCollectionMap
+from utils.flex_template import FlexTemplateCache
+
+BUBBLE = {'type': 'bubble', 'body': {'type': 'text', 'text': 'Hi {{name}}'}}
+
+
+def change(doc_id, update_time, kind='MODIFIED'):
+    return SimpleNamespace(type=SimpleNamespace(name=kind), document=SimpleNamespace(id=doc_id, update_time=update_time))
+
+
+@pytest.fixture
+def flex_cache(monkeypatch):
+    cache = FlexTemplateCache()
+    monkeypatch.setattr(linebot_helper, 'flex_templates', cache)
+    monkeypatch.setattr(FlexMessageHelper, '_preloaded_versions', {})
+    return cache
+
+
+def test_run_in_child_returns_result_and_reports_errors():
+    assert app._run_in_child(lambda: {'value': [1, 2]}) == {'value': [1, 2]}
+
+    def fail():
+        raise KeyError('missing')
+
+    with pytest.raises(RuntimeError, match='KeyError'):
+        app._run_in_child(fail)
+
+
+def test_preload_templates_compiles_documents_and_json_fields(flex_cache):
+    FlexMessageHelper.preload_templates([
+        ('whole', {**BUBBLE, 'version': 1}, 't1'),
+        ('fields', {'card': json.dumps(BUBBLE), 'title': 'not json'}, 't2'),
+    ])
+    assert flex_cache.stats()['size'] == 2
+    assert FlexMessageHelper._preloaded_versions == {'whole': 't1', 'fields': 't2'}
+
+    template = flex_cache.get(('fields', 'card'), None, lambda: pytest.fail('should be preloaded'))
+    assert template.render({'name': 'Ann'})['body']['text'] == 'Hi Ann'
+
+
+def test_template_listener_keeps_unchanged_preloaded_documents(flex_cache):
+    FlexMessageHelper.preload_templates([('a', BUBBLE, 't1'), ('b', BUBBLE, 't1'), ('c', BUBBLE, 't1')])
+    flex_cache.get(('runtime', None), None, lambda: BUBBLE)
+
+    # 訂閱時移除不是預先編譯的模板，第一次通知只移除版本已改變或已刪除的文件
+    flex_cache.retain(FlexMessageHelper._preloaded_versions)
+    FlexMessageHelper._on_template_changes([change('a', 't1', 'ADDED'), change('b', 't2', 'ADDED')])
+    FlexMessageHelper._on_template_changes([change('c', 't1', 'REMOVED')])
+
+    keys = list(flex_cache._templates)
+    assert keys == [('a', None)]
+    assert FlexMessageHelper._preloaded_versions == {'a': 't1'}
+
+
+def test_seeded_registry_does_not_wait_for_worker_load():
+    loading = threading.Event()
+    release = threading.Event()
+
+    class Service:
+        def get_collection_data(self, collection):
+            loading.set()
+            release.wait(5)
+            return [{'_id': 'weather', 'keywords': ['天氣預報']}]
+
+        def subscribe(self, collection, callback):
+            pass
+
+    service = Service()
+    registry = FeatureRegistry(SimpleNamespace(get=lambda: service))
+    registry.seed([{'_id': 'weather', 'keywords': ['天氣']}])
+
+    loader = threading.Thread(target=registry.load)
+    loader.start()
+    assert loading.wait(5)
+    # 載入中仍以 fork 前的快照回應
+    assert registry.route('天氣') == ('weather', None)
+    release.set()
+    loader.join(5)
+    assert registry.route('天氣預報') == ('weather', None)
+    assert registry.route('天氣') == (None, None)
+
+
+def test_preload_seeds_registry_and_templates_without_network_clients(monkeypatch, flex_cache):
+    registry = FeatureRegistry(SimpleNamespace(get=lambda: pytest.fail('should not load')))
+    monkeypatch.setattr(app.config, 'feature_registry', registry)
+    monkeypatch.setattr(app, '_read_shared_collections', lambda: {
+        DatabaseCollectionMap.FEATURE: [('weather', {'keywords': ['天氣']}, 't1')],
+        DatabaseCollectionMap.LINE_FLEX: [('card', BUBBLE, 't1')],
+    })
+    app.preload()
+
+    assert registry._snapshot[1].match('天氣') == 'weather'
+    assert FlexMessageHelper._preloaded_versions == {'card': 't1'}
+    assert not any(service.initialized for service in app.config.network_services())
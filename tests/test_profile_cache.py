@@ -0,0 +1,61 @@
+import asyncio
+import threading
+
+from linebot.v3.messaging import ApiException
+
+from api import linebot_helper
+from api.async_linebot_helper import AsyncLineBotHelper
+from api.profile_cache import ProfileCache
+
+
+def test_eviction_of_other_user_keeps_inflight_fill():
+    started, release = threading.Event(), threading.Event()
+
+    def fetch(user_id):
+        started.set()
+        release.wait(1)
+        return {'userId': user_id}
+
+    cache = ProfileCache(fetch)
+    worker = threading.Thread(target=cache.get, args=('U1',))
+    worker.start()
+    started.wait(1)
+    cache.evict('U2')
+    release.set()
+    worker.join()
+
+    assert cache.peek('U1') == {'userId': 'U1'}
+    assert cache.stats()['fetches'] == 1
+
+
+def test_not_found_is_cached():
+    calls = []
+
+    def fetch(user_id):
+        calls.append(user_id)
+        raise ApiException(status=404, reason='Not Found')
+
+    cache = ProfileCache(fetch)
+    assert cache.get('U1') is None and cache.get('U1') is None
+    assert calls == ['U1']
+
+
+def test_async_lookups_share_one_fetch(monkeypatch):
+    calls = []
+    release = threading.Event()
+
+    def fetch(user_id):
+        calls.append(user_id)
+        release.wait(1)
+        return {'userId': user_id}
+
+    monkeypatch.setattr(linebot_helper, 'profile_cache', ProfileCache(fetch))
+
+    async def run():
+        lookups = [asyncio.ensure_future(AsyncLineBotHelper.get_user_info('U1')) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        release.set()
+        return await asyncio.gather(*lookups)
+
+    assert asyncio.run(run()) == [{'userId': 'U1'}] * 5
+    assert calls == ['U1']
@@ -0,0 +1,65 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from api import linebot_helper
+from api.linebot_helper import QuickReplyRegistry
+
+
+class Service:
+    def __init__(self, docs):
+        self.docs = docs
+        self.callbacks = []
+
+    def get_collection_data(self, collection):
+        return self.docs
+
+    def subscribe(self, collection, callback):
+        self.callbacks.append(callback)
+
+
+def change(doc_id, data=None, kind='MODIFIED'):
+    return SimpleNamespace(type=SimpleNamespace(name=kind),
+                           document=SimpleNamespace(id=doc_id, to_dict=lambda: data))
+
+
+@pytest.fixture
+def service(monkeypatch):
+    service = Service([
+        {'_id': 'menu', 'items': [json.dumps({'type': 'message', 'label': 'A', 'text': 'a'}),
+                                  {'type': 'uri', 'label': 'B', 'uri': 'https://example.com'}]},
+        {'_id': 'other', 'items': [{'type': 'message', 'label': 'C', 'text': 'c'}]},
+    ])
+    monkeypatch.setattr(linebot_helper, 'firebaseService', SimpleNamespace(get=lambda: service))
+    return service
+
+
+def test_get_returns_independent_copies(service):
+    registry = QuickReplyRegistry()
+    first = registry.get('menu')
+    first.items[0].action.label = 'changed'
+    first.items[1].action.uri = 'https://changed.example.com'
+    first.items.append(first.items[1])
+
+    second = registry.get('menu')
+    assert len(second.items) == 2
+    assert second.items[0].action.label == 'A'
+    assert second.items[1].action.uri == 'https://example.com'
+    assert second.to_json() == registry.get_json('menu')
+    assert registry.stats()['builds'] == 2
+
+
+def test_changes_rebuild_only_changed_sets(service):
+    registry = QuickReplyRegistry()
+    registry.get('menu')
+    [callback] = service.callbacks
+
+    callback([change('menu', {'items': service.docs[0]['items']}),
+              change('other', {'items': [{'type': 'message', 'label': 'D', 'text': 'd'}]})])
+    assert registry.stats()['builds'] == 3
+    assert registry.get('other').items[0].action.label == 'D'
+
+    callback([change('other', kind='REMOVED')])
+    with pytest.raises(ValueError):
+        registry.get('other')
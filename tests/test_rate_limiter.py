@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils.rate_limiter import RateLimiter, RateLimitExceeded, TokenBucket, backoff_delay, classify_line_endpoint
+
+
+def drain(bucket: TokenBucket, priority: bool = True):
+    while not bucket.try_acquire(priority):
+        pass
+
+
+def test_bucket_keeps_reserve_for_priority_requests():
+    bucket = TokenBucket(rate=1, capacity=4, reserve=2)
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    # 只剩保留量：低優先權需要等待，高優先權可以使用
+    assert bucket.try_acquire() > 0
+    assert bucket.try_acquire(priority=True) == 0
+
+
+def test_bucket_acquire_times_out():
+    bucket = TokenBucket(rate=1, capacity=1)
+    drain(bucket)
+    started = time.monotonic()
+    assert not bucket.acquire(timeout=0.05)
+    assert 0.04 <= time.monotonic() - started < 0.5
+
+
+def test_low_priority_yields_while_priority_request_waits():
+    bucket = TokenBucket(rate=20, capacity=1)
+    drain(bucket)
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(bucket.acquire(priority=True, timeout=1)))
+    waiter.start()
+    while not bucket._priority_waiters:
+        time.sleep(0.001)
+    # 令牌補充後先給等待中的高優先權請求
+    assert not bucket.acquire(timeout=0.02)
+    waiter.join()
+    assert results == [True]
+
+
+def test_endpoint_token_is_refunded_when_global_bucket_times_out():
+    limiter = RateLimiter({'push': 1, 'default': 1}, global_rate=1, default_max_wait=0.05)
+    drain(limiter._global)
+
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire('push')
+    assert limiter._bucket('push').try_acquire() == 0
+    assert limiter.stats()['push']['rejected'] == 1
+
+
+def test_async_acquire_refunds_and_registers_priority_waiters():
+    limiter = RateLimiter({'reply': 20, 'push': 20, 'default': 1}, global_rate=5, reserve_ratio=0,
+                          max_wait={'reply': 1}, default_max_wait=0.05)
+
+    async def run():
+        drain(limiter._global)
+        with pytest.raises(RateLimitExceeded):
+            await limiter.acquire_async('push')
+        assert limiter._bucket('push').try_acquire() == 0
+
+        drain(limiter._global)
+        reply = asyncio.ensure_future(limiter.acquire_async('reply'))
+        await asyncio.sleep(0.005)
+        assert limiter._global._priority_waiters == 1
+        # reply 等待時，非同步的 push 也要讓出
+        with pytest.raises(RateLimitExceeded):
+            await limiter.acquire_async('push')
+        await reply
+        assert limiter._global._priority_waiters == 0
+
+        drain(limiter._global)
+        cancelled = asyncio.ensure_future(limiter.acquire_async('reply'))
+        await asyncio.sleep(0.005)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        assert limiter._global._priority_waiters == 0
+
+    asyncio.run(run())
+    assert limiter.stats()['reply']['acquired'] == 1
+
+
+@pytest.mark.parametrize('url, endpoint', [
+    ('https://api.line.me/v2/bot/message/reply', 'reply'),
+    ('https://api.line.me/v2/bot/message/multicast', 'push'),
+    ('https://api.line.me/v2/bot/profile/U1', 'profile'),
+])
+def test_classify_line_endpoint(url, endpoint):
+    assert classify_line_endpoint(url) == endpoint
+
+
+def test_backoff_delay_honours_retry_after():
+    assert 3 <= backoff_delay(0, '3') <= 4.5
+    assert 0 < backoff_delay(2) <= 30
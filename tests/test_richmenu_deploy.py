@@ -0,0 +1,177 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from linebot.v3.messaging import ApiException
+
+from api import richmenu_deploy
+from api.richmenu_deploy import RichMenuDeployer
+
+DEFINITION = {'size': {'width': 2500, 'height': 843}, 'selected': False, 'name': 'menu',
+              'chatBarText': 'menu', 'areas': []}
+
+
+def image(url, sha256=None, width=2500, height=843):
+    return SimpleNamespace(url=url, sha256=sha256 or f'sha-{url}', width=width, height=height)
+
+
+def doc(doc_id, image_url, **deployed):
+    return {'_id': doc_id, 'alias_id': doc_id, 'richmenu': json.dumps(DEFINITION), 'image_url': image_url, **deployed}
+
+
+def deployed(doc_id, image_url, rich_menu_id):
+    """已部署且與目前定義相同的文件"""
+    definition = json.dumps(DEFINITION, sort_keys=True, ensure_ascii=False)
+    return doc(doc_id, image_url, richmenu_id=rich_menu_id, definition_hash=RichMenuDeployer._hash(definition.encode()),
+               image_hash=f'sha-{image_url}')
+
+
+class MessagingApi:
+    def __init__(self, menus=(), aliases=None, failing_aliases=()):
+        self.menus = set(menus)
+        self.aliases = dict(aliases or {})
+        self.failing_aliases = set(failing_aliases)
+        self.deleted, self.default = [], None
+
+    def get_rich_menu_list(self):
+        return SimpleNamespace(richmenus=[SimpleNamespace(rich_menu_id=menu) for menu in self.menus])
+
+    def get_rich_menu_alias_list(self):
+        return SimpleNamespace(aliases=[SimpleNamespace(rich_menu_alias_id=alias, rich_menu_id=menu)
+                                        for alias, menu in self.aliases.items()])
+
+    def create_rich_menu(self, rich_menu_request):
+        rich_menu_id = f'new-{len(self.menus)}'
+        self.menus.add(rich_menu_id)
+        return SimpleNamespace(rich_menu_id=rich_menu_id)
+
+    def update_rich_menu_alias(self, alias_id, request):
+        if alias_id in self.failing_aliases:
+            raise ApiException(status=500, reason='error')
+        self.aliases[alias_id] = request.rich_menu_id
+
+    def set_default_rich_menu(self, rich_menu_id):
+        self.default = rich_menu_id
+
+    def delete_rich_menu(self, rich_menu_id):
+        self.deleted.append(rich_menu_id)
+        self.menus.discard(rich_menu_id)
+
+
+class FirebaseService:
+    def __init__(self, docs):
+        self.docs = docs
+        self.updates = {}
+
+    def get_collection_data(self, collection):
+        return self.docs
+
+    def update_data(self, collection, doc_id, data):
+        self.updates[doc_id] = data
+
+
+@pytest.fixture
+def setup(monkeypatch):
+    fetched, uploaded = [], []
+
+    def configure(docs, api, images=None):
+        images = images or {}
+
+        def get_image(url):
+            fetched.append(url)
+            if isinstance(images.get(url), Exception):
+                raise images[url]
+            return images.get(url) or image(url)
+
+        service = FirebaseService(docs)
+        monkeypatch.setattr(richmenu_deploy, 'line_api_client', SimpleNamespace(messaging_api=api))
+        monkeypatch.setattr(richmenu_deploy, 'firebaseService', service)
+        monkeypatch.setattr(richmenu_deploy.RichMenuHelper, 'get_rich_menu_image_', staticmethod(get_image))
+        monkeypatch.setattr(richmenu_deploy.RichMenuHelper, 'upload_rich_menu_image_',
+                            staticmethod(lambda rich_menu_id, image: uploaded.append(rich_menu_id)))
+        monkeypatch.setattr(richmenu_deploy.RichMenuHelper, 'create_rich_menu_alias_',
+                            staticmethod(lambda alias_id, rich_menu_id: api.aliases.__setitem__(alias_id, rich_menu_id)))
+        return service
+
+    configure.fetched, configure.uploaded = fetched, uploaded
+    return configure
+
+
+def actions(plan):
+    return {menu['doc_id']: (menu['action'], menu['reason']) for menu in plan['menus']}
+
+
+def test_plan_reports_bad_images_per_menu(setup):
+    setup([
+        deployed('page1', 'a.png', 'old-1'),
+        deployed('page2', 'b.png', 'old-2'),
+        deployed('page3', 'c.png', 'old-3'),
+        doc('page4', 'd.png'),
+        {'_id': 'broken', 'richmenu': '{'},
+    ], MessagingApi(['old-1', 'old-2', 'old-3'], {'page1': 'old-1', 'page2': 'old-2'}),
+        {'b.png': ValueError('HTTP 404'), 'c.png': image('c.png', sha256='changed'),
+         'd.png': image('d.png', height=1686)})
+
+    plan = RichMenuDeployer(max_workers=2).plan()
+    result = actions(plan)
+    assert result['page1'] == ('unchanged', None)
+    assert result['page2'] == ('invalid', 'image: HTTP 404')
+    assert result['page3'] == ('replace', 'image changed')
+    assert result['page4'][0] == 'invalid' and 'does not match menu size' in result['page4'][1]
+    assert result['broken'][0] == 'invalid'
+
+
+def test_dry_run_only_fetches_images_needed_to_detect_changes(setup):
+    setup([deployed('page1', 'a.png', 'old-1'), doc('page2', 'b.png')],
+          MessagingApi(['old-1'], {'page1': 'old-1'}))
+
+    output = RichMenuDeployer().deploy(apply=False)
+    assert setup.fetched == ['a.png']
+    assert [(menu['doc_id'], menu['action']) for menu in output['plan']] == [('page1', 'unchanged'), ('page2', 'create')]
+    assert output['result'] is None
+    assert all(not key.startswith('_') for menu in output['plan'] for key in menu)
+
+
+def test_apply_switches_aliases_and_deletes_replaced_menus(setup):
+    api = MessagingApi(['old-1', 'old-2'], {'page1': 'old-1', 'page2': 'old-2'})
+    service = setup([deployed('page1', 'a.png', 'old-1'), deployed('page2', 'b.png', 'old-2')], api,
+                    {'a.png': image('a.png', sha256='changed')})
+
+    output = RichMenuDeployer().deploy(apply=True)
+    result = output['result']
+    new_id = result['created']['page1']
+    assert result['applied'] and not result['errors']
+    assert api.aliases == {'page1': new_id, 'page2': 'old-2'}
+    assert api.default == new_id
+    assert result['deleted'] == ['old-1']
+    assert service.updates == {'page1': {'richmenu_id': new_id, 'definition_hash': output['plan'][0]['definition_hash'],
+                                         'image_hash': 'changed'}}
+    assert setup.uploaded == [new_id]
+
+
+def test_failed_alias_switch_keeps_old_menu_and_removes_new_one(setup):
+    api = MessagingApi(['old-1', 'old-2'], {'page1': 'old-1', 'page2': 'old-2'}, failing_aliases={'page2'})
+    service = setup([deployed('page1', 'a.png', 'old-1'), deployed('page2', 'b.png', 'old-2')], api,
+                    {'a.png': image('a.png', sha256='a2'), 'b.png': image('b.png', sha256='b2')})
+
+    result = RichMenuDeployer().deploy(apply=True)['result']
+    created = result['created']
+    assert not result['applied']
+    assert result['errors'] == [{'alias_id': 'page2', 'step': 'alias', 'error': '500 error'}]
+    assert api.aliases == {'page1': created['page1'], 'page2': 'old-2'}
+    assert sorted(result['deleted']) == sorted(['old-1', created['page2']])
+    assert 'old-2' in api.menus and list(service.updates) == ['page1']
+
+
+def test_failed_create_does_not_switch_any_alias(setup):
+    api = MessagingApi(['old-1'], {'page1': 'old-1'})
+    deployer = RichMenuDeployer()
+    setup([deployed('page1', 'a.png', 'old-1'), doc('page2', 'b.png')], api,
+          {'a.png': image('a.png', sha256='a2'), 'b.png': ValueError('HTTP 500')})
+
+    # 只顯示計畫時未檢查的圖片在 apply 時才取得，失敗時不切換任何 alias
+    plan = deployer.plan(check_images=False)
+    result = deployer.apply(plan)
+    assert result['errors'] == [{'alias_id': 'page2', 'step': 'create', 'error': 'image: HTTP 500'}]
+    assert api.aliases == {'page1': 'old-1'}
+    assert result['deleted'] == list(result['created'].values())
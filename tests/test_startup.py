@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHECK_UNINITIALIZED = '''
+import gc
+import features.base
+import app
+from config import LazyService
+services = [obj for obj in gc.get_objects() if isinstance(obj, LazyService)]
+assert services, 'no LazyService found'
+initialized = [repr(service) for service in services if service.initialized]
+assert not initialized, initialized
+'''
+
+
+def test_importing_app_does_not_initialize_services():
+    # 在新的行程中匯入，避免其他測試已建立的 config 影響結果
+    result = subprocess.run([sys.executable, '-c', CHECK_UNINITIALIZED], cwd=ROOT, env=dict(os.environ),
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+
+
+def test_lazy_service_does_not_proxy_private_attributes():
+    from config import LazyService
+
+    calls = []
+    service = LazyService('test', lambda: calls.append(1) or object(), {})
+    assert not hasattr(service, '__isabstractmethod__')
+    assert not hasattr(service, '_private')
+    assert not calls and not service.initialized
+
+
+WHEN_READY = '''
+import runpy
+import sys
+
+import pytest
+import app
+from config import get_config
+app._read_shared_collections = lambda: {'feature': [], 'line_flex': []}
+if sys.argv[1] == 'initialized':
+    get_config().firebaseService._instance = object()
+runpy.run_path('gunicorn.conf.py')['when_ready'](None)
+'''
+
+
+@pytest.mark.parametrize('state, returncode', [('lazy', 0), ('initialized', 1)])
+def test_when_ready_requires_uninitialized_network_services(state, returncode):
+    result = subprocess.run([sys.executable, '-c', WHEN_READY, state], cwd=ROOT, env=dict(os.environ),
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == returncode, result.stderr
+    if returncode:
+        assert 'must not be initialized before fork' in result.stderr
@@ -0,0 +1,92 @@
+from types import SimpleNamespace
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from api import spreadsheet
+from api.spreadsheet import SpreadsheetWriteBuffer
+
+
+def http_error(status):
+    return HttpError(httplib2.Response({'status': status}), b'error')
+
+
+class Service:
+    """記錄每次 batch request 的範圍；fail 依範圍回傳例外"""
+    def __init__(self, fail=None):
+        self.fail = fail or (lambda ranges: None)
+        self.requests = []
+        self.invalidated = []
+        self.sh = SimpleNamespace(id='sheet-id')
+        self.gc = SimpleNamespace(sheet=SimpleNamespace(values_batch_update_by_data_filter=self._update))
+
+    def _update(self, spreadsheet_id, data, parse=True):
+        ranges = [entry['dataFilter']['a1Range'] for entry in data]
+        error = self.fail(ranges)
+        if error:
+            raise error
+        self.requests.append({entry['dataFilter']['a1Range']: entry['values'] for entry in data})
+
+    def get_worksheet(self, title):
+        return title
+
+    def _invalidate_headers(self, wks):
+        self.invalidated.append(wks)
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(spreadsheet.time, 'sleep', lambda seconds: None)
+
+
+def make_buffer(service, **kwargs):
+    # flush_interval=0：背景執行緒只在達到 max_pending 時寫入，測試中手動 flush
+    return SpreadsheetWriteBuffer(service, max_pending=1000, flush_interval=0, **kwargs)
+
+
+def test_adjacent_cells_are_merged_into_ranges():
+    service = Service()
+    buffer = make_buffer(service)
+    for row in (2, 3):
+        for col in (1, 2):
+            buffer.update_cell_value('Sheet1', (row, col), f'{row}-{col}')
+    buffer.update_cell_value('Sheet1', (2, 1), 'latest')
+    buffer.update_cell_value('Sheet1', (5, 4), 'alone')
+    buffer.update_cell_value("Bob's", (1, 1), 'header')
+
+    assert buffer.flush() == 3
+    assert service.requests == [{
+        "'Sheet1'!A2:B3": [['latest', '2-2'], ['3-1', '3-2']],
+        "'Sheet1'!D5:D5": [['alone']],
+        "'Bob''s'!A1:A1": [['header']],
+    }]
+    assert service.invalidated == ["Bob's"]
+    assert buffer.flush() == 0
+    assert buffer.stats()['pending'] == 0
+
+
+def test_client_error_drops_only_the_bad_range():
+    service = Service(lambda ranges: http_error(400) if "'Missing'!A1:A1" in ranges else None)
+    buffer = make_buffer(service)
+    buffer.update_cell_value('Sheet1', (2, 1), 'ok')
+    buffer.update_cell_value('Missing', (1, 1), 'bad')
+
+    assert buffer.flush() == 1
+    assert service.requests == [{"'Sheet1'!A2:A2": [['ok']]}]
+    assert buffer.stats()['dropped'] == 1 and buffer.stats()['pending'] == 0
+
+
+def test_quota_errors_requeue_without_overwriting_newer_values():
+    failures = [http_error(429)] * 2
+    service = Service(lambda ranges: failures.pop(0) if failures else None)
+    buffer = make_buffer(service, max_retries=1)
+    buffer.update_cell_value('Sheet1', (2, 1), 'old')
+
+    with pytest.raises(HttpError):
+        buffer.flush()
+    buffer.update_cell_value('Sheet1', (2, 1), 'new')
+    assert buffer.stats()['retries'] == 1 and buffer.stats()['pending'] == 1
+
+    assert buffer.flush() == 1
+    assert service.requests == [{"'Sheet1'!A2:A2": [['new']]}]
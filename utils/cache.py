@@ -0,0 +1,117 @@
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+import threading
+import time
+
+MISSING = object()
+
+class TTLCache:
+    """
+    執行緒安全的 LRU + TTL 快取\n
+    讀取資料前以 generation(key) 記下該 key 的版本並在寫入時帶入，若讀取期間該 key 被失效則不寫入，
+    避免失效事件發生後才寫入舊資料；其他 key 的失效不影響進行中的寫入。
+    """
+    # 最多記錄的條件式失效數，超過時較舊的讀取一律視為已失效
+    MAX_PREDICATES = 32
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        """
+        Args:
+            maxsize: 最多保留的項目數，超過時移除最久未使用的項目
+            ttl: 項目存活秒數，0 代表不過期
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = 0
+        # 早於 _floor 的讀取一律視為已失效（clear 或失效紀錄超過上限時推進）
+        self._floor = 0
+        self._invalidated = OrderedDict()
+        self._predicates = []
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def generation(self, key: Hashable) -> int:
+        """讀取資料前取得的版本，寫入時帶入 set(generation=...)"""
+        with self._lock:
+            return self._clock
+
+    def _is_stale(self, key: Hashable, generation: int) -> bool:
+        """讀取後該 key 是否曾被失效（需持有鎖）"""
+        if generation < self._floor or self._invalidated.get(key, -1) > generation:
+            return True
+        return any(stamp > generation and predicate(key) for stamp, predicate in self._predicates)
+
+    def _invalidate(self) -> int:
+        """推進版本並回傳此次失效的版本（需持有鎖）"""
+        self._clock += 1
+        self._counters['invalidations'] += 1
+        return self._clock
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        """取得快取值，不存在或已過期時回傳 default"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires_at = item
+                if not expires_at or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self._counters['hits'] += 1
+                    return value
+                del self._data[key]
+                self._counters['expirations'] += 1
+            self._counters['misses'] += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, generation: int = None, ttl: float = None):
+        """寫入快取值
+
+        Args:
+            generation: 讀取資料前取得的 generation(key)，若期間該 key 被失效則不寫入
+            ttl: 此項目的存活秒數，預設使用快取的 ttl
+        """
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            if generation is not None and self._is_stale(key, generation):
+                return
+            self._data[key] = (value, time.monotonic() + ttl if ttl else 0)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def delete(self, key: Hashable):
+        """刪除單一項目"""
+        with self._lock:
+            self._invalidated[key] = self._invalidate()
+            self._invalidated.move_to_end(key)
+            if len(self._invalidated) > self.maxsize:
+                self._floor = max(self._floor, self._invalidated.popitem(last=False)[1])
+            self._data.pop(key, None)
+
+    def delete_where(self, predicate: Callable[[Hashable], bool]):
+        """刪除符合條件的項目"""
+        with self._lock:
+            self._predicates.append((self._invalidate(), predicate))
+            if len(self._predicates) > self.MAX_PREDICATES:
+                self._floor = max(self._floor, self._predicates.pop(0)[0])
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        """清除所有項目"""
+        with self._lock:
+            self._floor = self._invalidate()
+            self._invalidated.clear()
+            self._predicates.clear()
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """Returns
+        dict: 大小、命中/未命中與移除計數
+        """
+        with self._lock:
+            return {'size': len(self._data), 'maxsize': self.maxsize, 'ttl': self.ttl, **self._counters}
@@ -2,6 +2,7 @@ from flask import jsonify, current_app
 from config import get_config
 from map import Permission
 from api.linebot_helper import LineBotHelper
+from api.async_linebot_helper import AsyncLineBotHelper
 from linebot.v3.messaging import (
     TextMessage
 )
@@ -10,6 +11,10 @@ import traceback
 config = get_config()
 firebaseService = config.firebaseService
 
+# 通知管理員時查詢的條件與回覆用戶的訊息（同步與非同步版本共用）
+ADMIN_CONDITIONS = [('permission', '==', Permission.ADMIN)]
+USER_ERROR_MESSAGE = '發生錯誤，請聯繫系統管理員！'
+
 def handle_exception(e, admin_notification=False, event=None, return_json=False):
     """
     共用錯誤處理器
@@ -31,11 +36,8 @@ def handle_exception(e, admin_notification=False, event=None, return_json=False)
     # 通知管理員
     if admin_notification:
         try:
-            LineBotHelper.show_loading_animation_(event)
             LineBotHelper.push_message(
-                firebaseService.filter_data(
-                    'users', [('permission', '==', Permission.ADMIN)]
-                )[0]['userId'],
+                firebaseService.filter_data('users', ADMIN_CONDITIONS)[0]['userId'],
                 [TextMessage(text=error_message)]
             )
         except Exception as notify_error:
@@ -45,7 +47,7 @@ def handle_exception(e, admin_notification=False, event=None, return_json=False)
     # 回覆用戶
     if event:
         try:
-            LineBotHelper.reply_message(event, [TextMessage(text='發生錯誤，請聯繫系統管理員！')])
+            LineBotHelper.reply_message(event, [TextMessage(text=USER_ERROR_MESSAGE)])
         except Exception as reply_error:
             print(f"Failed to reply to LINE event: {str(reply_error)}")
     
@@ -53,4 +55,29 @@ def handle_exception(e, admin_notification=False, event=None, return_json=False)
     return jsonify({
         'success': False, 
         'message': "發生錯誤，請聯繫系統管理員"
-    }), 200 
\ No newline at end of file
+    }), 200 
+
+async def handle_exception_async(e, admin_notification=False, event=None, logger=None):
+    """
+    非同步模式（asgi_app）的錯誤處理器，參數同 handle_exception（不回傳 JSON）\n
+    以 asyncFirebaseService 查詢管理員、AsyncMessagingApi 送出訊息，不阻塞 event loop
+    :param logger: 記錄錯誤的 logger（未指定時使用 print）
+    """
+    error_message = ''.join(traceback.format_exception(None, e, e.__traceback__))
+    if logger:
+        logger.error(error_message)
+    else:
+        print(error_message)
+
+    if admin_notification:
+        try:
+            admins = await config.asyncFirebaseService.filter_data('users', ADMIN_CONDITIONS)
+            await AsyncLineBotHelper.push_message(admins[0]['userId'], [TextMessage(text=error_message)])
+        except Exception as notify_error:
+            print(f"Failed to notify admin: {str(notify_error)}")
+
+    if event:
+        try:
+            await AsyncLineBotHelper.reply_message(event, [TextMessage(text=USER_ERROR_MESSAGE)])
+        except Exception as reply_error:
+            print(f"Failed to reply to LINE event: {str(reply_error)}")
@@ -0,0 +1,79 @@
+from contextlib import nullcontext
+from typing import Optional, Tuple
+from config import get_config
+from features.base import feature_factory, parse_postback_data
+from map import FeatureStatus
+from api.linebot_helper import profile_cache, loading_indicator
+from linebot.v3.messaging import TextMessage
+
+config = get_config()
+
+class EventHandler:
+    """
+    LINE webhook 事件的共用處理邏輯（linebot_app 與 asgi_app 共用）\n
+    只決定要回覆的訊息、要執行的功能與是否追蹤處理時間；
+    回覆訊息與執行功能由各 app 以同步或非同步的方式進行。
+    """
+    WELCOME_MESSAGE = "歡迎使用本系統！"
+    STATUS_MESSAGES = {
+        FeatureStatus.DISABLE: '此功能尚未開放，敬請期待！',
+        FeatureStatus.MAINTENANCE: '此功能維護中，請見諒！'
+    }
+
+    @staticmethod
+    def follow(event) -> list:
+        """
+        Summary:
+            加入好友：移除「使用者不存在」的快取，下次查詢取得最新個人資料
+        Returns:
+            list: 要回覆的歡迎訊息
+        """
+        profile_cache.evict(event.source.user_id)
+        return [TextMessage(text=__class__.WELCOME_MESSAGE)]
+
+    @staticmethod
+    def unfollow(event):
+        """封鎖：以「使用者不存在」快取，不再查詢個人資料"""
+        profile_cache.mark_not_found(event.source.user_id)
+
+    @staticmethod
+    def route_message(event) -> Tuple[Optional[str], Optional[list]]:
+        """
+        Summary:
+            取得文字訊息對應的功能（只讀取記憶體中的快照，不查詢 Firestore）
+        Returns:
+            tuple: (功能名稱, 功能停用或維護中時要回覆的訊息)，沒有對應的功能時為 (None, None)
+        """
+        feature, feature_status = config.feature_registry.route(event.message.text)
+        if feature is None:
+            return None, None
+        status_message = __class__.STATUS_MESSAGES.get(feature_status)
+        if status_message:
+            return feature, [TextMessage(text=status_message)]
+        return feature, None
+
+    @staticmethod
+    def parse_postback(event) -> Optional[dict]:
+        """
+        Summary:
+            解析 postback data
+        Returns:
+            dict | None: 參數，圖文選單切換（richmenu）不需處理時回傳 None
+        """
+        postback_data = event.postback.data
+        if 'richmenu' in postback_data:
+            return None
+        return parse_postback_data(postback_data, event.postback.params)
+
+    @staticmethod
+    def track(event, feature: Optional[str]):
+        """
+        Summary:
+            超過門檻仍未回覆才在背景送出載入動畫（排程不會阻塞）\n
+            未註冊的功能不追蹤處理時間，避免任意的 postback data 讓處理時間紀錄無限增長
+        Returns:
+            context manager: 在區塊內追蹤事件
+        """
+        if not feature_factory.has_feature(feature):
+            return nullcontext()
+        return loading_indicator.track(event, feature)
@@ -0,0 +1,114 @@
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 反向參照：合併成單一 pattern 後數字群組會重新編號（\1 指向錯誤的群組），具名群組也可能重複
+_BACKREFERENCE = re.compile(r'(?<!\\)(?:\\\\)*\\[1-9]|\(\?P=')
+
+class FeatureRouter:
+    """
+    關鍵字路由（建立後不可變更）\n
+    完全比對與前綴比對共用一個 trie，只需走訪訊息一次；正規表示式合併成單一 pattern。
+    比對優先順序：完全比對 > 最長前綴 > 正規表示式（依加入順序）。
+    """
+    __slots__ = ('_root', '_pattern', '_pattern_features', '_patterns', 'size')
+
+    def __init__(self, exact: Dict[str, str] = None, prefixes: Dict[str, str] = None,
+                 patterns: Iterable[Tuple[str, str]] = ()):
+        """
+        Args:
+            exact: 關鍵字（含別名）對應的功能名稱
+            prefixes: 前綴對應的功能名稱
+            patterns: (正規表示式, 功能名稱)，需完全符合訊息
+        """
+        # 節點為 [子節點 dict, 完全比對的功能, 前綴比對的功能]
+        self._root = [{}, None, None]
+        self.size = 0
+        for keyword, feature in (exact or {}).items():
+            self._insert(keyword, feature, 1)
+        for prefix, feature in (prefixes or {}).items():
+            self._insert(prefix, feature, 2)
+
+        self._pattern = None
+        self._pattern_features = {}
+        self._patterns = []
+        patterns = list(patterns)
+        alternatives = []
+        for index, (pattern, feature) in enumerate(patterns):
+            try:
+                self._patterns.append((re.compile(pattern, re.DOTALL), feature))
+            except re.error as e:
+                print(f"Invalid feature pattern {pattern!r} for {feature}: {str(e)}")
+                continue
+            name = f'_p{index}'
+            alternatives.append(f'(?P<{name}>{pattern})')
+            self._pattern_features[name] = feature
+        if any(_BACKREFERENCE.search(pattern) for pattern, _ in patterns):
+            # 有反向參照時逐一比對，維持加入順序
+            alternatives = []
+        if alternatives:
+            try:
+                self._pattern = re.compile('|'.join(alternatives), re.DOTALL)
+                self._patterns = []
+            except re.error:
+                # 無法合併（例如重複的群組名稱或 inline flag），改為逐一比對
+                self._pattern = None
+
+    def _insert(self, key: str, feature: str, slot: int):
+        if not key:
+            return
+        node = self._root
+        for char in key:
+            node = node[0].setdefault(char, [{}, None, None])
+        node[slot] = feature
+        self.size += 1
+
+    def match(self, text: str) -> Optional[str]:
+        """
+        Summary:
+            取得訊息對應的功能名稱
+        Returns:
+            str | None: 功能名稱，沒有符合的規則時回傳 None
+        """
+        node = self._root
+        prefix_feature = None
+        for char in text:
+            node = node[0].get(char)
+            if node is None:
+                break
+            if node[2] is not None:
+                prefix_feature = node[2]
+        else:
+            if node[1] is not None:
+                return node[1]
+        if prefix_feature is not None:
+            return prefix_feature
+        if self._pattern is not None:
+            match = self._pattern.fullmatch(text)
+            if match:
+                # 外層的具名群組最後結束，lastgroup 即為符合的規則
+                return self._pattern_features.get(match.lastgroup)
+        for pattern, feature in self._patterns:
+            if pattern.fullmatch(text):
+                return feature
+        return None
+
+def build_feature_router(features: List[dict], static_keywords: Dict[str, str] = None) -> FeatureRouter:
+    """
+    Summary:
+        由功能設定建立路由
+    Args:
+        features: 功能設定，每筆包含 _id（功能名稱）與選填的 keywords、aliases、prefixes、patterns
+        static_keywords: 程式內建的關鍵字對應（Map.FEATURE），Firestore 設定相同關鍵字時以 Firestore 為準
+    """
+    exact = dict(static_keywords or {})
+    prefixes = {}
+    patterns = []
+    for feature in features:
+        name = feature['_id']
+        for keyword in [*(feature.get('keywords') or []), *(feature.get('aliases') or [])]:
+            exact[keyword] = name
+        for prefix in feature.get('prefixes') or []:
+            prefixes[prefix] = name
+        for pattern in feature.get('patterns') or []:
+            patterns.append((pattern, name))
+    return FeatureRouter(exact, prefixes, patterns)
@@ -0,0 +1,151 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List
+from utils.utils import compile_template
+
+def _compile_node(node) -> Callable[[Dict[str, Any]], Any]:
+    """將 JSON 節點編譯成 render 函式；dict / list 每次重新建立，常數字串與數值直接共用"""
+    if isinstance(node, str):
+        template = compile_template(node)
+        if not template.variables:
+            return lambda variables: node
+        return template.render
+    if isinstance(node, dict):
+        items = [(compile_template(key), _compile_node(value)) for key, value in node.items()]
+        return lambda variables: {
+            (key.render(variables) if key.variables else key.text): render(variables)
+            for key, render in items
+        }
+    if isinstance(node, list):
+        renders = [_compile_node(value) for value in node]
+        return lambda variables: [render(variables) for render in renders]
+    return lambda variables: node
+
+def _collect_variables(node, variables: set):
+    if isinstance(node, str):
+        variables.update(compile_template(node).variables)
+    elif isinstance(node, dict):
+        for key, value in node.items():
+            _collect_variables(key, variables)
+            _collect_variables(value, variables)
+    elif isinstance(node, list):
+        for value in node:
+            _collect_variables(value, variables)
+
+class FlexTemplate:
+    """
+    預先編譯的 Flex Message 模板\n
+    編譯時只走訪一次 JSON 結構並記錄每個 {{variable}} 的位置，render 時直接填入變數，
+    不需要 json.dumps / 正規表示式 / json.loads；變數值會以字串填入（與原本的文字替換相同）。
+    """
+    def __init__(self, template: Dict[str, Any]):
+        self.variables = set()
+        _collect_variables(template, self.variables)
+        self._render = _compile_node(template)
+        # carousel：第一個 bubble 作為每個項目的模板，其餘欄位不做變數替換
+        self._container = None
+        self._bubble = None
+        if isinstance(template.get('contents'), list) and template['contents']:
+            self._container = _compile_node({key: value for key, value in template.items() if key != 'contents'})
+            self._bubble = _compile_node(template['contents'][0])
+
+    def render(self, variables: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Summary:
+            以變數填入整個模板
+        Returns:
+            dict: 新的 Flex Message JSON
+        """
+        return self._render(variables)
+
+    def render_carousel(self, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Summary:
+            以模板的第一個 bubble 為每個項目產生一個 bubble
+        Returns:
+            dict: 新的 carousel JSON
+        """
+        if self._bubble is None:
+            raise ValueError("Template has no bubbles in 'contents'")
+        carousel = self._container({})
+        carousel['contents'] = [self._bubble(item) for item in items]
+        return carousel
+
+class FlexTemplateCache:
+    """
+    編譯後模板的快取（以文件 ID 或 (文件 ID, 欄位) 與版本為鍵，LRU）\n
+    同一文件的版本改變時會重新編譯並取代舊版本；不使用版本時由呼叫端在文件變更時呼叫 invalidate。
+    """
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+        # invalidate 的次數，載入期間有變更時不寫入快取，避免放入舊版本
+        self._generation = 0
+        self._counters = {'hits': 0, 'misses': 0}
+
+    def get(self, doc_id: Hashable, version: Hashable, loader: Callable[[], Dict[str, Any]]) -> FlexTemplate:
+        """
+        Summary:
+            取得編譯後的模板，快取中沒有對應版本時呼叫 loader 取得模板 JSON 並編譯
+        Args:
+            doc_id: 模板文件 ID 或 (文件 ID, 欄位)
+            version: 模板版本（任意可雜湊的值，以 invalidate 處理變更時可固定為 None）
+            loader: 回傳模板 JSON 的函式
+        """
+        with self._lock:
+            cached = self._templates.get(doc_id)
+            if cached is not None and cached[0] == version:
+                self._templates.move_to_end(doc_id)
+                self._counters['hits'] += 1
+                return cached[1]
+            self._counters['misses'] += 1
+            generation = self._generation
+        template = FlexTemplate(loader())
+        with self._lock:
+            if generation == self._generation:
+                self._templates[doc_id] = (version, template)
+                self._templates.move_to_end(doc_id)
+                while len(self._templates) > self.maxsize:
+                    self._templates.popitem(last=False)
+        return template
+
+    def peek(self, doc_id: Hashable, version: Hashable = None):
+        """
+        Summary:
+            只查詢快取，不載入（非同步模式先查詢快取，未命中時自行讀取模板後再呼叫 get）
+        Returns:
+            FlexTemplate | None: 快取中對應版本的模板
+        """
+        with self._lock:
+            cached = self._templates.get(doc_id)
+            if cached is None or cached[0] != version:
+                return None
+            self._templates.move_to_end(doc_id)
+            self._counters['hits'] += 1
+            return cached[1]
+
+    def invalidate(self, doc_id: str = None):
+        """移除指定文件（含所有欄位，未指定則全部）的編譯結果"""
+        with self._lock:
+            self._generation += 1
+            if doc_id is None:
+                self._templates.clear()
+                return
+            for key in [key for key in self._templates if key == doc_id or (isinstance(key, tuple) and key[0] == doc_id)]:
+                del self._templates[key]
+
+    def retain(self, doc_ids):
+        """只保留指定文件（含所有欄位）的編譯結果，其餘移除"""
+        doc_ids = set(doc_ids)
+        with self._lock:
+            self._generation += 1
+            for key in [key for key in self._templates if (key[0] if isinstance(key, tuple) else key) not in doc_ids]:
+                del self._templates[key]
+
+    def stats(self) -> dict:
+        """Returns
+        dict: 快取大小與命中次數
+        """
+        with self._lock:
+            return {'size': len(self._templates), 'maxsize': self.maxsize, **self._counters}
@@ -0,0 +1,31 @@
+from typing import Callable, Dict, Any
+import threading
+
+_lock = threading.Lock()
+_collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+def register_metrics(name: str, collector: Callable[[], Dict[str, Any]]):
+    """註冊指標收集函式。
+
+    Args:
+        name (str): 指標名稱（同名會覆蓋）
+        collector (Callable[[], Dict[str, Any]]): 回傳目前指標的函式
+    """
+    with _lock:
+        _collectors[name] = collector
+
+def collect_metrics() -> Dict[str, Dict[str, Any]]:
+    """收集所有已註冊的指標。
+
+    Returns:
+        Dict[str, Dict[str, Any]]: 以指標名稱為鍵的指標資料
+    """
+    with _lock:
+        collectors = dict(_collectors)
+    metrics = {}
+    for name, collector in collectors.items():
+        try:
+            metrics[name] = collector()
+        except Exception as e:
+            metrics[name] = {'error': str(e)}
+    return metrics
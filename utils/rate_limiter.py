@@ -0,0 +1,259 @@
+from urllib.parse import urlsplit
+from typing import Dict
+import asyncio
+import random
+import threading
+import time
+
+class RateLimitExceeded(Exception):
+    """在等待上限內無法取得令牌"""
+    def __init__(self, endpoint: str, waited: float):
+        super().__init__(f"Rate limit exceeded for '{endpoint}' after waiting {waited:.3f}s")
+        self.endpoint = endpoint
+        self.waited = waited
+
+class TokenBucket:
+    """
+    執行緒安全的令牌桶\n
+    以固定速率補充令牌；低優先權的請求只能使用保留量以上的令牌，且有高優先權請求在等待時會讓出。
+    """
+    def __init__(self, rate: float, capacity: float = None, reserve: float = 0):
+        """
+        Args:
+            rate: 每秒補充的令牌數
+            capacity: 令牌上限（突發量），預設與 rate 相同
+            reserve: 保留給高優先權請求的令牌數
+        """
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.reserve = min(reserve, self.capacity - 1)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._priority_waiters = 0
+        self._condition = threading.Condition()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def _try_take(self, priority: bool, now: float) -> float:
+        """取得一個令牌，成功回傳 0，否則回傳預計需要等待的秒數（需持有鎖）"""
+        self._refill(now)
+        floor = 0 if priority else self.reserve
+        if self._tokens - 1 >= floor and (priority or not self._priority_waiters):
+            self._tokens -= 1
+            return 0
+        return max((floor + 1 - self._tokens) / self.rate, 0.001)
+
+    def try_acquire(self, priority: bool = False) -> float:
+        """
+        Summary:
+            不等待地嘗試取得一個令牌
+        Returns:
+            float: 0 代表成功，否則為建議的等待秒數
+        """
+        with self._condition:
+            return self._try_take(priority, time.monotonic())
+
+    def acquire(self, priority: bool = False, timeout: float = None) -> bool:
+        """
+        Summary:
+            取得一個令牌，必要時等待
+        Args:
+            priority: 是否為高優先權請求
+            timeout: 最長等待秒數，None 為不限制
+        Returns:
+            bool: 是否在時限內取得令牌
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            if priority:
+                self._priority_waiters += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    delay = self._try_take(priority, now)
+                    if not delay:
+                        return True
+                    if deadline is not None:
+                        if now >= deadline:
+                            return False
+                        delay = min(delay, deadline - now)
+                    self._condition.wait(delay)
+            finally:
+                if priority:
+                    self._priority_waiters -= 1
+                    # 讓等待中的低優先權請求重新檢查
+                    self._condition.notify_all()
+
+    async def acquire_async(self, priority: bool = False, timeout: float = None) -> bool:
+        """acquire 的非同步版本，等待時不阻塞 event loop；高優先權請求等待期間同樣會讓低優先權請求讓出"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if priority:
+            with self._condition:
+                self._priority_waiters += 1
+        try:
+            while True:
+                now = time.monotonic()
+                delay = self.try_acquire(priority)
+                if not delay:
+                    return True
+                if deadline is not None:
+                    if now >= deadline:
+                        return False
+                    delay = min(delay, deadline - now)
+                await asyncio.sleep(delay)
+        finally:
+            if priority:
+                with self._condition:
+                    self._priority_waiters -= 1
+                    self._condition.notify_all()
+
+    def refund(self):
+        """歸還一個令牌（取得後未使用，例如全域桶逾時）"""
+        with self._condition:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens + 1)
+            self._condition.notify_all()
+
+class RateLimiter:
+    """
+    行程共用的外呼限流器\n
+    每個 endpoint 類別有各自的令牌桶，另有一個所有類別共用的全域令牌桶；
+    高優先權類別（預設為 reply）可以使用全域桶的保留量，並優先於其他類別取得令牌。
+    """
+    def __init__(self, limits: Dict[str, float], global_rate: float, priority_endpoints=('reply',),
+                 reserve_ratio: float = 0.2, max_wait: Dict[str, float] = None, default_max_wait: float = 5):
+        """
+        Args:
+            limits: endpoint 類別對應的每秒請求數，未列出的類別使用 'default'
+            global_rate: 所有類別合計的每秒請求數
+            priority_endpoints: 高優先權的 endpoint 類別
+            reserve_ratio: 全域桶保留給高優先權類別的比例
+            max_wait: endpoint 類別對應的最長等待秒數
+            default_max_wait: 未指定 max_wait 的類別的最長等待秒數
+        """
+        self.priority_endpoints = set(priority_endpoints)
+        self.max_wait = max_wait or {}
+        self.default_max_wait = default_max_wait
+        self._global = TokenBucket(global_rate, reserve=global_rate * reserve_ratio)
+        self._buckets = {endpoint: TokenBucket(rate) for endpoint, rate in limits.items()}
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _bucket(self, endpoint: str) -> TokenBucket:
+        return self._buckets.get(endpoint) or self._buckets['default']
+
+    def acquire(self, endpoint: str):
+        """
+        Summary:
+            取得一次外呼的額度（阻塞等待）
+        Raises:
+            RateLimitExceeded: 超過該類別的最長等待時間
+        """
+        priority = endpoint in self.priority_endpoints
+        started = time.monotonic()
+        timeout = self.max_wait.get(endpoint, self.default_max_wait)
+        bucket = self._bucket(endpoint)
+        acquired = bucket.acquire(priority, timeout)
+        if acquired:
+            remaining = timeout - (time.monotonic() - started)
+            acquired = remaining > 0 and self._global.acquire(priority, remaining)
+            if not acquired:
+                # 全域桶逾時，歸還已取得的類別令牌
+                bucket.refund()
+        self._record(endpoint, time.monotonic() - started, acquired)
+
+    async def acquire_async(self, endpoint: str):
+        """acquire 的非同步版本，等待時不阻塞 event loop"""
+        priority = endpoint in self.priority_endpoints
+        started = time.monotonic()
+        timeout = self.max_wait.get(endpoint, self.default_max_wait)
+        bucket = self._bucket(endpoint)
+        acquired = await bucket.acquire_async(priority, timeout)
+        if acquired:
+            remaining = timeout - (time.monotonic() - started)
+            try:
+                acquired = remaining > 0 and await self._global.acquire_async(priority, remaining)
+            except asyncio.CancelledError:
+                bucket.refund()
+                raise
+            if not acquired:
+                bucket.refund()
+        self._record(endpoint, time.monotonic() - started, acquired)
+
+    def _record(self, endpoint: str, waited: float, acquired: bool):
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, {'acquired': 0, 'rejected': 0, 'waited': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0})
+            stats['acquired' if acquired else 'rejected'] += 1
+            if waited >= 0.001:
+                stats['waited'] += 1
+                stats['wait_seconds'] += waited
+                stats['max_wait_seconds'] = max(stats['max_wait_seconds'], waited)
+        if not acquired:
+            raise RateLimitExceeded(endpoint, waited)
+
+    def stats(self) -> dict:
+        """Returns
+        dict: 各 endpoint 類別的取得、拒絕次數與等待時間
+        """
+        with self._lock:
+            return {
+                endpoint: {**stats, 'wait_seconds': round(stats['wait_seconds'], 3), 'max_wait_seconds': round(stats['max_wait_seconds'], 3)}
+                for endpoint, stats in self._stats.items()
+            }
+
+def get_header(headers, name: str):
+    """不分大小寫取得 HTTP header，找不到時回傳 None"""
+    if not headers:
+        return None
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+def backoff_delay(attempt: int, retry_after=None, max_delay: float = 60) -> float:
+    """
+    Summary:
+        重試前的等待秒數：指數退避加上 jitter，有 Retry-After 時至少等待該秒數
+    Args:
+        attempt: 第幾次重試（從 0 開始）
+        retry_after: Retry-After header 的值
+    """
+    delay = min(max_delay, 2 ** attempt)
+    if retry_after:
+        try:
+            delay = max(delay, float(retry_after))
+        except ValueError:
+            pass
+    return delay + random.uniform(0, delay / 2)
+
+# LINE Messaging API 路徑對應的 endpoint 類別
+LINE_ENDPOINTS = (
+    ('/v2/bot/message/reply', 'reply'),
+    ('/v2/bot/message/push', 'push'),
+    ('/v2/bot/message/multicast', 'push'),
+    ('/v2/bot/message/broadcast', 'push'),
+    ('/v2/bot/message/narrowcast', 'push'),
+    ('/v2/bot/chat/loading', 'loading'),
+    ('/v2/bot/profile', 'profile'),
+    ('/v2/bot/group/', 'profile'),
+    ('/v2/bot/room/', 'profile'),
+)
+
+def classify_line_endpoint(url: str) -> str:
+    """
+    Summary:
+        依 URL 路徑取得 LINE API 的 endpoint 類別
+    Returns:
+        str: reply / push / loading / profile / default
+    """
+    path = urlsplit(url).path
+    for prefix, endpoint in LINE_ENDPOINTS:
+        if path.startswith(prefix):
+            # 群組 / 聊天室只有成員資料屬於 profile
+            if prefix in ('/v2/bot/group/', '/v2/bot/room/') and '/member/' not in path:
+                break
+            return endpoint
+    return 'default'
@@ -1,5 +1,7 @@
 import re
-from typing import Dict, Any
+from functools import lru_cache
+from itertools import islice
+from typing import Dict, Any, Iterable, Iterator, List
 
 def camel_to_snake_case(data: Dict[str, Any]) -> Dict[str, Any]:
     """將字典的鍵從 camelCase 轉換為 snake_case。
@@ -19,10 +21,79 @@ def camel_to_snake_case(data: Dict[str, Any]) -> Dict[str, Any]:
     
     return {convert(k): v for k, v in data.items()}
 
+_VARIABLE_PATTERN = re.compile(r'\{\{([a-zA-Z0-9_]*)\}\}')
+
+class CompiledTemplate:
+    """預先切分好常數與變數片段的文字模板，由 compile_template 建立。
+    
+    Attributes:
+        text (str): 原始文字
+        segments (Tuple[tuple, ...]): 常數片段為 (None, text)，變數片段為 (key, placeholder, occurrence)，
+            occurrence 為該變數在文字中第幾次出現（從 1 開始）
+        variables (FrozenSet[str]): 文字中出現的變數名稱
+    """
+    __slots__ = ('text', 'segments', 'variables', '_parts', '_slots')
+
+    def __init__(self, text: str):
+        self.text = text
+        segments = []
+        occurrences: Dict[str, int] = {}
+        position = 0
+        for match in _VARIABLE_PATTERN.finditer(text):
+            if match.start() > position:
+                segments.append((None, text[position:match.start()]))
+            key = match.group(1)
+            occurrences[key] = occurrences.get(key, 0) + 1
+            segments.append((key, match.group(0), occurrences[key]))
+            position = match.end()
+        if position < len(text):
+            segments.append((None, text[position:]))
+        self.segments = tuple(segments)
+        self.variables = frozenset(occurrences)
+        # render 時複製 _parts，只覆寫變數所在的位置
+        self._parts = [segment[1] for segment in segments]
+        self._slots = tuple((index, *segment) for index, segment in enumerate(segments) if segment[0] is not None)
+
+    def render(self, variable_dict: Dict[str, Any], max_count: int = 0) -> str:
+        """以變數填入模板，參數與回傳值同 replace_variable。"""
+        if not self._slots:
+            return self.text
+        parts = self._parts.copy()
+        for index, key, placeholder, occurrence in self._slots:
+            if max_count and occurrence > max_count:
+                continue
+            value = variable_dict.get(key, placeholder)
+            parts[index] = value if isinstance(value, str) else str(value)
+        return ''.join(parts)
+
+@lru_cache(maxsize=1024)
+def _compile_template_cached(text: str) -> CompiledTemplate:
+    return CompiledTemplate(text)
+
+def compile_template(text: str) -> CompiledTemplate:
+    """將文字切分為常數與 {{variable}} 片段（以文字內容 LRU 快取）。
+    
+    沒有變數的文字直接建立常數模板，不佔用快取，避免大量一次性的文字把模板擠出快取。
+    
+    Args:
+        text (str): 包含 {{variable}} 格式變數的文字
+        
+    Returns:
+        CompiledTemplate: 可重複 render 的模板
+        
+    Example:
+        >>> compile_template("Hello {{name}}!").render({"name": "World"})
+        'Hello World!'
+    """
+    if '{{' not in text:
+        return CompiledTemplate(text)
+    return _compile_template_cached(text)
+
 def replace_variable(text: str, variable_dict: Dict[str, Any], max_count: int = 0) -> str:
     """替換文字中的變數。
     
     將文字中的 {{variable}} 格式的變數替換為 variable_dict 中對應的值。
+    相同的文字只會切分一次（見 compile_template）。
     
     Args:
         text (str): 包含 {{variable}} 格式變數的文字
@@ -36,18 +107,45 @@ def replace_variable(text: str, variable_dict: Dict[str, Any], max_count: int =
         >>> replace_variable("Hello {{name}}!", {"name": "World"})
         'Hello World!'
     """
-    replaced_count: Dict[str, int] = {}
-    
-    def replace(match: re.Match) -> str:
-        key = match.group(1)
-        if max_count:
-            if key not in replaced_count:
-                replaced_count[key] = 1
-            else:
-                replaced_count[key] += 1
-                if replaced_count[key] > max_count:
-                    return match.group(0)
-        return str(variable_dict.get(key, match.group(0)))
-
-    pattern = r'\{\{([a-zA-Z0-9_]*)\}\}'
-    return re.sub(pattern, replace, text) 
\ No newline at end of file
+    return compile_template(text).render(variable_dict, max_count)
+
+def chunked(iterable: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """將可迭代物件依指定大小分段（不會一次載入全部資料）。
+    
+    Args:
+        iterable (Iterable[Any]): 任意可迭代物件（list、generator 等）
+        size (int): 每段的最大筆數
+        
+    Returns:
+        Iterator[List[Any]]: 依序產生每段資料的 list
+        
+    Example:
+        >>> list(chunked(range(5), 2))
+        [[0, 1], [2, 3], [4]]
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def iter_user_ids(users: Iterable[Any]) -> Iterator[str]:
+    """依序取出不重複的 user id。
+    
+    Args:
+        users (Iterable[Any]): user id 字串，或含 userId / _id 的 dict（例如 FireBaseService.iter_filter_data 的結果）
+        
+    Returns:
+        Iterator[str]: 不重複的 user id（保留原本順序）
+        
+    Example:
+        >>> list(iter_user_ids(["U1", {"userId": "U2"}, {"_id": "U1"}]))
+        ['U1', 'U2']
+    """
+    seen = set()
+    for user in users:
+        user_id = (user.get('userId') or user.get('_id')) if isinstance(user, dict) else user
+        if user_id and user_id not in seen:
+            seen.add(user_id)
+            yield user_id
@@ -0,0 +1,263 @@
+from linebot.v3 import WebhookHandler
+from linebot.v3.webhooks import MessageEvent
+from concurrent.futures import Future, ThreadPoolExecutor, wait as wait_futures
+from collections import deque
+from typing import Dict, Optional
+import atexit
+import logging
+import queue
+import threading
+import zlib
+
+logger = logging.getLogger(__name__)
+
+def get_event_key(event) -> Optional[str]:
+    """取得事件的排序鍵（同一個鍵的事件必須依序處理）。
+
+    Args:
+        event: LINE webhook event
+
+    Returns:
+        Optional[str]: user_id，若無則為 group_id / room_id
+    """
+    source = getattr(event, 'source', None)
+    if source is None:
+        return None
+    return (
+        getattr(source, 'user_id', None)
+        or getattr(source, 'group_id', None)
+        or getattr(source, 'room_id', None)
+    )
+
+def dispatch_event(handler: WebhookHandler, event, destination: str = None) -> bool:
+    """依 WebhookHandler 的註冊規則找出對應的處理函式並執行單一事件。
+
+    規則與 WebhookHandler.handle 相同：先找 Event_Message，再找 Event，最後使用 default。
+
+    Args:
+        handler (WebhookHandler): 已註冊處理函式的 handler
+        event: LINE webhook event
+        destination (str, optional): webhook payload 的 destination
+
+    Returns:
+        bool: 是否有處理函式處理此事件
+    """
+    func = None
+    if isinstance(event, MessageEvent):
+        func = handler._handlers.get(f'{event.__class__.__name__}_{event.message.__class__.__name__}')
+    if func is None:
+        func = handler._handlers.get(event.__class__.__name__)
+    if func is None:
+        func = handler._default
+    if func is None:
+        logger.info('No handler of %s and no default handler', event.__class__.__name__)
+        return False
+    func(event)
+    return True
+
+class WebhookEventQueue:
+    """
+    Webhook 背景處理佇列\n
+    驗證簽章後將事件放入有上限的佇列並立即返回，由背景 worker 執行已註冊的處理函式。\n
+    佇列依事件來源分片，同一位使用者的事件固定由同一個 worker 依序處理。
+    """
+    def __init__(self, handler: WebhookHandler, workers: int = 4, maxsize: int = 1000):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.shard_size = max(1, maxsize // self.workers)
+        self._queues = [queue.Queue(maxsize=self.shard_size) for _ in range(self.workers)]
+        self._threads = []
+        self._lock = threading.Lock()
+        self._counters = {'enqueued': 0, 'processed': 0, 'failed': 0, 'dropped': 0}
+
+    def start(self):
+        """啟動 worker（重複呼叫不會重複啟動）"""
+        with self._lock:
+            if self._threads:
+                return
+            for index, shard in enumerate(self._queues):
+                thread = threading.Thread(
+                    target=self._worker, args=(shard,), name=f'webhook-worker-{index}', daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+        atexit.register(self.stop)
+
+    def submit(self, body: str, signature: str, app=None) -> int:
+        """驗證簽章並將事件放入佇列
+
+        簽章錯誤時會直接拋出 InvalidSignatureError；佇列已滿的事件會被丟棄並計入 dropped。
+
+        Args:
+            body (str): webhook request body
+            signature (str): X-Line-Signature
+            app: Flask app，worker 會在其 app context 中執行處理函式
+
+        Returns:
+            int: 成功放入佇列的事件數
+        """
+        payload = self.handler.parser.parse(body, signature, as_payload=True)
+        self.start()
+        accepted = 0
+        for event in payload.events:
+            shard = self._queues[self._shard_index(event)]
+            try:
+                shard.put_nowait((event, payload.destination, app))
+            except queue.Full:
+                self._incr('dropped')
+                logger.warning('Webhook queue is full, dropped %s', event.__class__.__name__)
+            else:
+                self._incr('enqueued')
+                accepted += 1
+        return accepted
+
+    def stop(self, timeout: float = 5):
+        """處理完佇列中剩餘的事件後停止 worker"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        if not threads:
+            return
+        for shard in self._queues:
+            try:
+                shard.put(None, timeout=timeout)
+            except queue.Full:
+                logger.warning('Webhook queue did not drain before shutdown')
+        for thread in threads:
+            thread.join(timeout)
+
+    def stats(self) -> dict:
+        """Returns
+        dict: 佇列深度、容量與處理/丟棄計數
+        """
+        with self._lock:
+            counters = dict(self._counters)
+        depths = [shard.qsize() for shard in self._queues]
+        return {
+            'depth': sum(depths),
+            'max_shard_depth': max(depths),
+            'capacity': self.shard_size * self.workers,
+            'workers': self.workers,
+            **counters
+        }
+
+    def _shard_index(self, event) -> int:
+        key = get_event_key(event)
+        if not key:
+            return 0
+        return zlib.crc32(key.encode()) % self.workers
+
+    def _incr(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _worker(self, shard: queue.Queue):
+        while True:
+            item = shard.get()
+            try:
+                if item is None:
+                    return
+                event, destination, app = item
+                try:
+                    if app is not None:
+                        with app.app_context():
+                            dispatch_event(self.handler, event, destination)
+                    else:
+                        dispatch_event(self.handler, event, destination)
+                    self._incr('processed')
+                except Exception:
+                    self._incr('failed')
+                    logger.exception('Failed to process webhook event')
+            finally:
+                shard.task_done()
+
+class UserOrderedDispatcher:
+    """
+    Webhook 事件並行分派器\n
+    不同使用者的事件同時處理，同一使用者的事件依 payload 中的順序處理。\n
+    max_workers 為全域並行上限；per_user_limit 為單一使用者同時處理的事件上限，
+    預設 1 代表嚴格依序，調高則放寬同一使用者的順序保證。
+    """
+    def __init__(self, handler: WebhookHandler, max_workers: int = 8, per_user_limit: int = 1):
+        self.handler = handler
+        self.max_workers = max(1, max_workers)
+        self.per_user_limit = max(1, per_user_limit)
+        self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='webhook-dispatch')
+        self._lock = threading.Lock()
+        self._pending: Dict[Optional[str], deque] = {}
+        self._running: Dict[Optional[str], int] = {}
+        self._counters = {'dispatched': 0, 'processed': 0, 'failed': 0}
+
+    def dispatch(self, events: list, destination: str = None, app=None, wait: bool = True) -> list:
+        """分派一個 payload 內的所有事件
+
+        Args:
+            events (list): LINE webhook events（依 payload 順序）
+            destination (str, optional): webhook payload 的 destination
+            app: Flask app，處理函式會在其 app context 中執行
+            wait (bool): 是否等待所有事件處理完成
+
+        Returns:
+            list[Future]: 每個事件對應的 Future
+        """
+        futures = []
+        with self._lock:
+            for event in events:
+                key = get_event_key(event)
+                future = Future()
+                self._pending.setdefault(key, deque()).append((event, destination, app, future))
+                self._counters['dispatched'] += 1
+                futures.append(future)
+                self._schedule(key)
+        if wait:
+            wait_futures(futures)
+        return futures
+
+    def stats(self) -> dict:
+        """Returns
+        dict: 並行上限、執行中與等待中的事件數及處理計數
+        """
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'per_user_limit': self.per_user_limit,
+                'running': sum(self._running.values()),
+                'pending': sum(len(pending) for pending in self._pending.values()),
+                'active_users': len(self._running),
+                **self._counters
+            }
+
+    def shutdown(self, wait: bool = True):
+        """停止分派器"""
+        self._executor.shutdown(wait=wait)
+
+    def _schedule(self, key: Optional[str]):
+        """將 key 可執行的事件送入執行緒池（呼叫端須持有 self._lock）"""
+        pending = self._pending.get(key)
+        while pending and self._running.get(key, 0) < self.per_user_limit:
+            item = pending.popleft()
+            self._running[key] = self._running.get(key, 0) + 1
+            self._executor.submit(self._run, key, item)
+        if not pending:
+            self._pending.pop(key, None)
+
+    def _run(self, key: Optional[str], item: tuple):
+        event, destination, app, future = item
+        try:
+            if app is not None:
+                with app.app_context():
+                    dispatch_event(self.handler, event, destination)
+            else:
+                dispatch_event(self.handler, event, destination)
+            future.set_result(True)
+            counter = 'processed'
+        except Exception as e:
+            logger.exception('Failed to process webhook event')
+            future.set_exception(e)
+            counter = 'failed'
+        finally:
+            with self._lock:
+                self._counters[counter] += 1
+                self._running[key] -= 1
+                if not self._running[key]:
+                    del self._running[key]
+                self._schedule(key)